@@ -1,24 +1,35 @@
 """satmo"""
 
-from .download import download_robust, download_to_tree, download_file
+from .download import download_robust, download_to_tree, download_file, download_many
+from .session import configure_session, get_session
 from .preprocessors import (bz2_unpack, bz2_compress, l2gen, getanc)
-from .query import make_download_url, query_from_extent, get_subscription_urls
+from .query import (make_download_url, query_from_extent, get_subscription_urls,
+                    get_subscription_checksums)
 from .utils import is_day, is_night, to_km
 from .utils import filename_parser, filename_builder, path_builder, path_finder, file_finder
+from .utils import FileMeta, parse_many
 from .utils import bit_pos_to_hex, resolution_to_km_str, pre_compose, processing_meta_from_list
 from .utils import find_composite_date_list, time_limit, viirs_geo_filename_builder
-from .utils import randomword, get_date_list
+from .utils import randomword, get_date_list, atomic_output
 from .wrappers import (timerange_download, make_daily_composite, timerange_daily_composite,
                        subscriptions_download, nrt_wrapper, l2mapgen_wrapper,
                        l2mapgen_batcher, l2gen_wrapper, l2gen_batcher,
                        refined_processing_wrapper_l1, nrt_wrapper_l1, bin_map_wrapper,
                        bin_map_batcher, l2_append_wrapper, l2gen_batcher, l3bin_wrapper,
-                       l3bin_map_wrapper, l3bin_map_batcher, l2_append_batcher)
+                       l3bin_map_wrapper, l3bin_map_batcher, l2_append_batcher,
+                       processing_graph, l3bin_map_graph)
+from .catalog import Catalog, set_catalog, get_catalog
+from .completeness import WorkUnit, find_gaps, work_dates
+from .scheduler import TaskGraph, parallel_map, shutdown_pools
+from .journal import Journal
+from .integrity import local_checksums, compare_manifest
+from .dependencies import file_checksum, read_inputs, write_inputs, is_outdated
 from .geo import geo_dict_from_nc, get_raster_meta
-from .errors import HttpResourceNotAvailable, SeadasError, TimeoutException
+from .errors import HttpResourceNotAvailable, SeadasError, TimeoutException, ChecksumMismatch
 from .visualization import make_map_title, make_preview
-from .processors import (nc2tif, FileComposer, BasicBinMap, L3mProcess,
-                         make_time_composite, l2_append, l2mapgen, l2bin, l3mapgen,
+from .processors import (nc2tif, FileComposer, IncrementalComposer, BasicBinMap,
+                         L3mProcess, make_time_composite, update_time_composite,
+                         compose_to_files, l2_append, l2mapgen, l2bin, l3mapgen,
                          l3bin)
 
 __version__ = "0.2.4"
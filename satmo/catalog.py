@@ -0,0 +1,430 @@
+"""Persistent catalog of the data archive
+
+The catalog is a local SQLite database holding, for every file of the archive,
+the fields extracted by filename_parser together with the size and modification
+time of the file, and its sha1 checksum when known (see satmo.integrity). It allows file_finder and path_finder to run indexed queries
+instead of globbing the (possibly network mounted) archive for every date.
+"""
+import os
+import sqlite3
+import warnings
+from collections import defaultdict
+from datetime import datetime, date as date_type
+
+from .utils import filename_parser
+from .dependencies import file_checksum
+
+
+_FIELDS = ['sensor_code', 'date', 'time', 'year', 'doy', 'level', 'suite',
+           'variable', 'resolution', 'composite', 'climatology', 'anomaly']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    sensor_code TEXT,
+    date TEXT,
+    time TEXT,
+    year INTEGER,
+    doy INTEGER,
+    level TEXT,
+    suite TEXT,
+    variable TEXT,
+    resolution TEXT,
+    composite TEXT,
+    climatology INTEGER,
+    anomaly INTEGER,
+    size INTEGER,
+    mtime REAL,
+    sha1 TEXT
+);
+CREATE INDEX IF NOT EXISTS files_level_date ON files (level, date, sensor_code);
+CREATE INDEX IF NOT EXISTS files_level_suite_date ON files (level, suite, date);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime REAL
+);
+"""
+
+# Columns of the files table
+_N_COLUMNS = len(_FIELDS) + 6
+
+_catalog = None
+
+
+def set_catalog(catalog):
+    """Set the catalog used by default by file_finder and path_finder
+
+    Args:
+        catalog (Catalog or str): A Catalog instance or the filename of a catalog
+            database. None disables the default catalog (glob search is used)
+
+    Examples:
+        >>> import satmo
+        >>> satmo.set_catalog('/export/isilon/datos2/satmo2_data/catalog.sqlite')
+        >>> # All subsequent file queries (including those of the batchers) use the catalog
+        >>> satmo.file_finder('/export/isilon/datos2/satmo2_data', '2016-01-01', 'L2',
+                              suite='OC')
+    """
+    global _catalog
+    if catalog is not None and not isinstance(catalog, Catalog):
+        catalog = Catalog(catalog)
+    _catalog = catalog
+
+
+def get_catalog():
+    """Return the default catalog (None if not set)"""
+    return _catalog
+
+
+def register(file_list, checksums=None, compute=False):
+    """Register newly written files in the default catalog, if one is set
+
+    Called by the functions writing to the archive (downloads, l2gen, l2bin,
+    l3mapgen, FileComposer) so that the catalog stays up to date without
+    rescanning. Already known sha1 checksums of the files are recorded too;
+    other checksums are only computed when requested, since that means reading
+    the files again (missing checksums are otherwise computed on first use, see
+    satmo.integrity.local_checksums). Catalog errors are turned into warnings,
+    so that they never interrupt processing.
+
+    Args:
+        file_list (list or str): Filename or list of filenames. None values and
+            files that do not exist are ignored.
+        checksums (dict): Already known sha1 checksums, by filename
+        compute (bool): Compute the checksums of the files missing from
+            checksums. Defaults to False
+    """
+    if _catalog is None:
+        return
+    if not isinstance(file_list, (list, tuple, set)):
+        file_list = [file_list]
+    file_list = [x for x in file_list if x is not None and os.path.isfile(x)]
+    try:
+        _catalog.add(file_list, checksums=checksums, compute=compute)
+    except sqlite3.Error as e:
+        warnings.warn('Files could not be registered in the catalog. %s' % e)
+
+
+def _prefix_clause(column, path):
+    """SQL clause (and its arguments) matching paths under a directory"""
+    path = os.path.join(path, '')
+    return 'substr(%s, 1, ?) = ?' % column, [len(path), path]
+
+
+def _as_date_str(x):
+    if type(x) is str:
+        x = datetime.strptime(x, "%Y-%m-%d")
+    if isinstance(x, datetime):
+        x = x.date()
+    if isinstance(x, date_type):
+        return x.isoformat()
+    return x
+
+
+class Catalog(object):
+    """SQLite backed catalog of the files of a data archive
+
+    Args:
+        db_file (str): Filename of the SQLite database. Created if it does not exist
+
+    Examples:
+        >>> import satmo
+        >>> from datetime import datetime
+
+        >>> catalog = satmo.Catalog('/export/isilon/datos2/satmo2_data/catalog.sqlite')
+        >>> catalog.scan('/export/isilon/datos2/satmo2_data')
+        >>> # Later on, only pick up the changes
+        >>> catalog.update('/export/isilon/datos2/satmo2_data')
+        >>> catalog.query(level='L3m', begin=datetime(2010, 1, 1),
+                          end=datetime(2019, 12, 31), sensor_code=['A', 'T'],
+                          suite='CHL', variable='chlor_a', composite='DAY')
+    """
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._conn = None
+        self._pid = None
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+            # Catalogs created before checksums were recorded
+            columns = [x[1] for x in conn.execute('PRAGMA table_info(files)')]
+            if 'sha1' not in columns:
+                conn.execute('ALTER TABLE files ADD COLUMN sha1 TEXT')
+
+    def __getstate__(self):
+        # sqlite connections cannot be shared between processes; a new one is
+        # opened on first use
+        return {'db_file': self.db_file}
+
+    def __setstate__(self, state):
+        self.db_file = state['db_file']
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_file, timeout=60)
+            self._pid = os.getpid()
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def _record(path):
+        """Build the row of a file; None if its name is not a valid data name"""
+        # Hidden files are temporary outputs (see atomic_output)
+        if os.path.basename(path).startswith('.'):
+            return None
+        meta = filename_parser(path, raiseError=False, record=True)
+        if meta['level'] is None:
+            return None
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        row = [path, os.path.dirname(path), os.path.basename(path)]
+        for field in _FIELDS:
+            value = meta[field]
+            if field in ['date', 'time'] and value is not None:
+                value = value.isoformat()
+            row.append(value)
+        row += [stat.st_size, stat.st_mtime, None]
+        return row
+
+    def add(self, file_list, checksums=None, compute=False):
+        """Register (or update) files in the catalog
+
+        Args:
+            file_list (list or str): Filename or list of filenames. Files whose name
+                cannot be parsed by filename_parser are ignored
+            checksums (dict): Known sha1 checksums of the files, by filename
+            compute (bool): Compute the checksums of the files missing from
+                checksums. Defaults to False, in which case their checksum is
+                left empty
+
+        Returns:
+            int: The number of files registered
+        """
+        if not isinstance(file_list, (list, tuple, set)):
+            file_list = [file_list]
+        checksums = dict((os.path.abspath(k), v) for k, v in (checksums or {}).items())
+        rows = [self._record(x) for x in file_list]
+        rows = [x for x in rows if x is not None]
+        for row in rows:
+            row[-1] = checksums.get(row[0])
+            if row[-1] is None and compute:
+                row[-1] = file_checksum(row[0])
+        with self._connection() as conn:
+            conn.executemany('INSERT OR REPLACE INTO files VALUES (%s)' %
+                             ', '.join(['?'] * _N_COLUMNS), rows)
+        return len(rows)
+
+    def checksums(self, file_list):
+        """Retrieve the recorded checksums of files
+
+        Args:
+            file_list (list): List of filenames
+
+        Returns:
+            dict: sha1 checksums by filename (as passed in file_list). Only files
+            with a recorded checksum, and whose size and modification time did
+            not change since, are present
+        """
+        paths = dict((os.path.abspath(x), x) for x in file_list)
+        rows = []
+        conn = self._connection()
+        keys = list(paths)
+        # Stay below the maximum number of arguments of a sqlite query
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows += conn.execute('SELECT path, size, mtime, sha1 FROM files WHERE sha1 IS NOT NULL '
+                                 'AND path IN (%s)' % ', '.join(['?'] * len(chunk)),
+                                 chunk).fetchall()
+        out = {}
+        for path, size, mtime, sha1 in rows:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_size == size and stat.st_mtime == mtime:
+                out[paths[path]] = sha1
+        return out
+
+    def remove(self, file_list):
+        """Remove files from the catalog
+
+        Args:
+            file_list (list or str): Filename or list of filenames
+        """
+        if not isinstance(file_list, (list, tuple, set)):
+            file_list = [file_list]
+        with self._connection() as conn:
+            conn.executemany('DELETE FROM files WHERE path = ?',
+                             [(os.path.abspath(x),) for x in file_list])
+
+    def _remove_tree(self, conn, path):
+        """Remove a directory, its sub-directories and their files from the catalog"""
+        for table, column in [('files', 'dir'), ('dirs', 'path')]:
+            clause, args = _prefix_clause(column, path)
+            conn.execute('DELETE FROM %s WHERE %s = ? OR %s' % (table, column, clause),
+                         [path] + args)
+
+    def update(self, data_root):
+        """Incrementally update the catalog with the changes of the archive
+
+        Walks the directory tree under data_root, but only lists the content of
+        the directories whose modification time changed since the previous update
+        (adding or removing a file changes the modification time of its directory).
+        Unchanged directories only cost a stat call, and their known
+        sub-directories are visited from the catalog.
+
+        Args:
+            data_root (str): Root of the data archive
+
+        Returns:
+            int: The number of files (re-)registered
+        """
+        data_root = os.path.abspath(data_root)
+        conn = self._connection()
+        clause, args = _prefix_clause('path', data_root)
+        known = {}
+        children = defaultdict(list)
+        for path, parent, mtime in conn.execute('SELECT path, parent, mtime FROM dirs '
+                                                'WHERE path = ? OR %s' % clause,
+                                                [data_root] + args):
+            known[path] = mtime
+            children[parent].append(path)
+        n_files = 0
+        stack = [data_root]
+        while stack:
+            path = stack.pop()
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                # Directory removed from the archive
+                with conn:
+                    self._remove_tree(conn, path)
+                continue
+            if known.get(path) == mtime:
+                stack += children[path]
+                continue
+            # The directory changed, list it
+            entries = [os.path.join(path, x) for x in os.listdir(path)]
+            sub_dirs = [x for x in entries if os.path.isdir(x)]
+            files = [x for x in entries if not os.path.isdir(x)]
+            rows = [self._record(x) for x in files]
+            rows = [x for x in rows if x is not None]
+            # Checksums of the unchanged files are kept
+            known_files = dict((x[0], x[1:]) for x in conn.execute(
+                'SELECT path, size, mtime, sha1 FROM files WHERE dir = ?', (path,)))
+            for row in rows:
+                size, file_mtime, sha1 = known_files.get(row[0], (None, None, None))
+                if row[-3:-1] == [size, file_mtime]:
+                    row[-1] = sha1
+            with conn:
+                for sub_dir in set(children[path]) - set(sub_dirs):
+                    self._remove_tree(conn, sub_dir)
+                conn.execute('DELETE FROM files WHERE dir = ?', (path,))
+                conn.executemany('INSERT OR REPLACE INTO files VALUES (%s)' %
+                                 ', '.join(['?'] * _N_COLUMNS), rows)
+                # mtime was retrieved before listing; a change happening in between
+                # is picked up by the next update
+                conn.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)',
+                             (path, os.path.dirname(path), mtime))
+            n_files += len(rows)
+            stack += sub_dirs
+        return n_files
+
+    def scan(self, data_root):
+        """Walk the full archive and (re-)register all its files
+
+        Files and directories of the catalog under data_root that no longer exist
+        are removed. Recorded checksums of the files that did not change are kept
+
+        Args:
+            data_root (str): Root of the data archive
+
+        Returns:
+            int: The number of files registered
+        """
+        data_root = os.path.abspath(data_root)
+        clause, args = _prefix_clause('path', data_root)
+        with self._connection() as conn:
+            known = conn.execute('SELECT sha1, path, size, mtime FROM files '
+                                 'WHERE sha1 IS NOT NULL AND %s' % clause, args).fetchall()
+            self._remove_tree(conn, data_root)
+        n_files = self.update(data_root)
+        with self._connection() as conn:
+            conn.executemany('UPDATE files SET sha1 = ? WHERE path = ? AND size = ? AND mtime = ?',
+                             known)
+        return n_files
+
+    def query(self, level=None, date=None, begin=None, end=None, sensor_code=None,
+              suite=None, variable=None, resolution=None, composite=None,
+              data_root=None, extension=None, columns='path'):
+        """Query the catalog
+
+        All arguments are optional; arguments left to None do not restrict the
+        query. sensor_code, suite and variable also accept lists.
+
+        Args:
+            level (str): Data level
+            date (str or datetime): Date of the files
+            begin (str or datetime): Start of the date range (inclusive)
+            end (str or datetime): End of the date range (inclusive)
+            sensor_code (str or list): Sensor code(s)
+            suite (str or list): Product suite(s)
+            variable (str or list): Product variable(s)
+            resolution (str): e.g. '1km'
+            composite (str): Composite period
+            data_root (str): Restrict the query to files under this directory
+            extension (str): Restrict the query to files with this extension (e.g. '.nc')
+            columns (str): Comma separated columns to return. Defaults to 'path'
+
+        Returns:
+            list: A list of paths sorted by date (list of tuples when several
+            columns are requested)
+        """
+        clauses = []
+        args = []
+        for field, value in [('level', level), ('date', _as_date_str(date)),
+                             ('sensor_code', sensor_code), ('suite', suite),
+                             ('variable', variable), ('resolution', resolution),
+                             ('composite', composite)]:
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                clauses.append('%s IN (%s)' % (field, ', '.join(['?'] * len(value))))
+                args += value
+            else:
+                clauses.append('%s = ?' % field)
+                args.append(value)
+        if begin is not None:
+            clauses.append('date >= ?')
+            args.append(_as_date_str(begin))
+        if end is not None:
+            clauses.append('date <= ?')
+            args.append(_as_date_str(end))
+        if data_root is not None:
+            clause, clause_args = _prefix_clause('path', os.path.abspath(data_root))
+            clauses.append(clause)
+            args += clause_args
+        if extension is not None:
+            clauses.append('filename LIKE ?')
+            args.append('%%%s' % extension)
+        sql = 'SELECT %s FROM files' % columns
+        if clauses:
+            sql += ' WHERE %s' % ' AND '.join(clauses)
+        sql += ' ORDER BY date, path'
+        rows = self._connection().execute(sql, args).fetchall()
+        if ',' not in columns:
+            return [x[0] for x in rows]
+        return rows
@@ -0,0 +1,278 @@
+"""Completeness of the data archive
+
+Compares the content of the catalog (see satmo.catalog) with the files expected
+from a processing configuration, and lists the files that are missing or out of
+date. The resulting work list can be passed to the batchers (see work_dates), so
+that reprocessing only touches what needs to be (re)built.
+"""
+from collections import namedtuple, defaultdict
+from datetime import datetime, timedelta
+
+from .utils import (filename_builder, resolution_to_km_str, find_composite_date_list,
+                    _default_catalog)
+from .global_variables import (SENSOR_CODES, L3_SUITE_FROM_VAR, STANDARD_L3_SUITES,
+                               L2_L3_SUITES_CORRESPONDENCES, COMPOSITE_DELTAS)
+
+
+class WorkUnit(namedtuple('WorkUnit', ['level', 'status', 'date', 'sensor_code', 'suite',
+                                         'variable', 'composite', 'filename', 'inputs'])):
+    """A file to (re)build
+
+    Fields:
+        level (str): Data level of the file
+        status (str): 'missing' if the file does not exist, 'stale' if one of its
+            inputs is more recent than the file, 'upstream' if one of its inputs is
+            itself missing or stale
+        date (datetime): Date of the file (first day of the period for temporal
+            composites)
+        sensor_code (str)
+        suite (str)
+        variable (str): None for L2 and L3b files
+        composite (str): None for L2 files
+        filename (str): Full path of the file
+        inputs (list): Full paths of the inputs of the file
+    """
+    __slots__ = ()
+
+# Key of a file: fields identifying a file of the archive, in the order of the
+# columns queried from the catalog
+_KEY_COLUMNS = 'level, sensor_code, date, time, suite, variable, resolution, composite'
+
+_EXTENSIONS = {'L2': '.nc', 'L3b': '.nc', 'L3m': '.tif'}
+
+_LEVEL_ORDER = {'L2': 0, 'L3b': 1, 'L3m': 2}
+
+
+def _suite_vars(var_list, dn, sensor):
+    """Variables of each L3 suite processed for a sensor (as in bin_map_wrapper)"""
+    var_dict = defaultdict(list)
+    for var in var_list:
+        suite = L3_SUITE_FROM_VAR[dn][var]
+        if var in STANDARD_L3_SUITES.get(suite, {}).get(sensor, []):
+            var_dict[suite].append(var)
+    return var_dict
+
+
+def _date_str(x):
+    if type(x) is str:
+        x = datetime.strptime(x, "%Y-%m-%d")
+    return x.strftime('%Y-%m-%d')
+
+
+def _filename(key, data_root):
+    level, sensor_code, date, time, suite, variable, resolution, composite = key
+    kwargs = {'date': datetime.strptime(date, '%Y-%m-%d'), 'sensor_code': sensor_code,
+              'suite': suite}
+    if level == 'L2':
+        kwargs['time'] = datetime.strptime(time, '%H:%M:%S').time()
+    else:
+        kwargs['composite'] = composite
+    if level == 'L3m':
+        kwargs.update(variable=variable, resolution=resolution)
+    return filename_builder(level=level, full_path=True, data_root=data_root, **kwargs)
+
+
+def find_gaps(begin, end, sensor_codes, data_root, day_vars=None, night_vars=None,
+              mapping_resolution=1000, daily_composite=False, composites=None,
+              l1a=True, catalog=None):
+    """List the files of a date range that are missing or out of date
+
+    The expected files are the ones produced by the processing chain of the
+    batchers for the given configuration:
+
+        - L2 files, one per L1A granule (when l1a is True)
+        - Daily L3b files, binned from the day (or night) L2 files of a sensor
+        - Daily L3m files of every sensor and variable
+        - Daily multi-sensor L3m composites (when daily_composite is True)
+        - L3b temporal composites (l3bin) and their L3m files (when composites is set)
+
+    A file is reported when it is missing while at least one of its inputs exists
+    (or is reported itself), or when one of its inputs is more recent than the file
+    (e.g. a refined L2 replacing a near real time one). The content of the archive
+    is retrieved from the catalog in a single query, so the catalog must be up to
+    date (see Catalog.update).
+
+    Args:
+        begin (datetime or str): Begin of the date range. 'yyyy-mm-dd' if str
+        end (datetime or str): End of the date range. 'yyyy-mm-dd' if str
+        sensor_codes (list): List of sensor codes (e.g. ['A', 'T', 'V'])
+        data_root (str): Root of the data archive
+        day_vars (list): Day variables (see bin_map_wrapper)
+        night_vars (list): Night variables (see bin_map_wrapper)
+        mapping_resolution (int): Resolution of the L3m files in meters. Defaults to 1000
+        daily_composite (bool): Check the daily multi-sensor composites (sensor
+            code 'X'). Defaults to False
+        composites (list): Temporal composites to check (e.g. ['8DAY', 'MO']).
+            Composite periods overlapping the date range are checked
+        l1a (bool): Check L2 files against L1A files. Set to False for archives
+            where L2 files are downloaded rather than processed locally
+        catalog (Catalog or str): Catalog to query. Defaults to the catalog set
+            with set_catalog
+
+    Returns:
+        list: A list of WorkUnit, ordered so that every file comes after its inputs
+
+    Examples:
+        >>> import satmo
+        >>> work_list = satmo.find_gaps('2016-01-01', '2016-12-31', ['A', 'T'],
+                                        '/export/isilon/datos2/satmo2_data',
+                                        day_vars=['chlor_a', 'sst'], night_vars=['sst'],
+                                        composites=['8DAY'],
+                                        catalog='/export/isilon/datos2/satmo2_data/catalog.sqlite')
+        >>> # Only process the dates where something is missing
+        >>> satmo.bin_map_batcher(None, None, ['A', 'T'], 3, 33, -122, -72,
+                                  '/export/isilon/datos2/satmo2_data',
+                                  day_vars=['chlor_a', 'sst'], night_vars=['sst'],
+                                  date_list=satmo.work_dates(work_list, ['L3b', 'L3m'],
+                                                             composite='DAY'))
+    """
+    catalog = _default_catalog(catalog)
+    if catalog is None:
+        raise ValueError('find_gaps requires a catalog (see satmo.set_catalog)')
+    begin = _date_str(begin)
+    end = _date_str(end)
+    resolution = resolution_to_km_str(mapping_resolution)
+    composites = composites or []
+    # Composite periods overlapping the date range
+    periods = {}
+    for composite in composites:
+        delta = COMPOSITE_DELTAS[composite]
+        period_list = []
+        date = datetime.strptime(begin, '%Y-%m-%d')
+        while date.strftime('%Y-%m-%d') <= end:
+            period = find_composite_date_list(date, delta)
+            period_list.append([x.strftime('%Y-%m-%d') for x in period])
+            date = period[-1] + timedelta(days=1)
+        periods[composite] = period_list
+    all_periods = sum(periods.values(), [])
+    query_begin = min([begin] + [x[0] for x in all_periods])
+    query_end = max([end] + [x[-1] for x in all_periods])
+    # Content of the archive, indexed by file key
+    index = {}
+    rows = catalog.query(begin=query_begin, end=query_end,
+                         sensor_code=list(sensor_codes) + ['X'], data_root=data_root,
+                         columns='path, mtime, anomaly, climatology, %s' % _KEY_COLUMNS)
+    for row in rows:
+        path, mtime, anomaly, climatology = row[:4]
+        key = tuple(row[4:])
+        if anomaly or climatology or key[0] not in ['L1A', 'L2', 'L3b', 'L3m']:
+            continue
+        if not path.endswith(_EXTENSIONS.get(key[0], '')):
+            continue
+        index[key] = (path, mtime)
+    # Files to (re)build, by key
+    planned = {}
+    work_list = []
+
+    def _check(key, input_keys):
+        present = [index[k] for k in input_keys if k in index]
+        upstream = [k for k in input_keys if k in planned]
+        if not present and not upstream:
+            return
+        if key not in index:
+            status = 'missing'
+        elif upstream:
+            status = 'upstream'
+        elif max([x[1] for x in present]) > index[key][1]:
+            status = 'stale'
+        else:
+            return
+        filename = index[key][0] if key in index else _filename(key, data_root)
+        planned[key] = filename
+        inputs = [index[k][0] if k in index else planned[k] for k in input_keys]
+        level, sensor_code, date, time, suite, variable, resolution_, composite = key
+        work_list.append(WorkUnit(level, status, datetime.strptime(date, '%Y-%m-%d'),
+                                  sensor_code, suite, variable, composite, filename,
+                                  inputs))
+
+    def _in_range(key):
+        return begin <= key[2] <= end
+
+    # L3 suites and variables of every sensor
+    suites = {}
+    for sensor_code in sensor_codes:
+        sensor = SENSOR_CODES[sensor_code]
+        suites[sensor_code] = {'day': _suite_vars(day_vars or [], 'day', sensor),
+                               'night': _suite_vars(night_vars or [], 'night', sensor)}
+    # L1A --> L2
+    if l1a:
+        for key in sorted(k for k in index if k[0] == 'L1A'):
+            if key[1] not in suites or not _in_range(key):
+                continue
+            dn = 'day' if key[3] > '12:00:00' else 'night'
+            l2_suites = set(L2_L3_SUITES_CORRESPONDENCES[x] for x in suites[key[1]][dn])
+            for l2_suite in sorted(l2_suites):
+                _check(('L2',) + key[1:4] + (l2_suite, None, None, None), [key])
+    # L2 --> daily L3b
+    l2_groups = defaultdict(list)
+    for key in set(index) | set(planned):
+        if key[0] == 'L2' and _in_range(key):
+            dn = 'day' if key[3] > '12:00:00' else 'night'
+            l2_groups[(key[1], key[2], dn, key[4])].append(key)
+    for (sensor_code, date, dn, l2_suite), input_keys in sorted(l2_groups.items()):
+        if sensor_code not in suites:
+            continue
+        for suite in sorted(suites[sensor_code][dn]):
+            if L2_L3_SUITES_CORRESPONDENCES[suite] == l2_suite:
+                _check(('L3b', sensor_code, date, None, suite, None, None, 'DAY'),
+                       sorted(input_keys))
+    # L3b --> L3m, for daily and temporal composites
+    for sensor_code in sensor_codes:
+        var_dict = dict(suites[sensor_code]['day'])
+        var_dict.update(suites[sensor_code]['night'])
+        for suite in sorted(var_dict):
+            l3b_dates = sorted(k[2] for k in set(index) | set(planned)
+                               if k[:2] == ('L3b', sensor_code) and k[4] == suite and
+                               k[7] == 'DAY')
+            l3b_list = [(date, 'DAY') for date in l3b_dates if begin <= date <= end]
+            for composite in composites:
+                for period in periods[composite]:
+                    input_keys = [('L3b', sensor_code, date, None, suite, None, None, 'DAY')
+                                  for date in l3b_dates if period[0] <= date <= period[-1]]
+                    _check(('L3b', sensor_code, period[0], None, suite, None, None,
+                            composite), input_keys)
+                    l3b_list.append((period[0], composite))
+            for date, composite in l3b_list:
+                l3b_key = ('L3b', sensor_code, date, None, suite, None, None, composite)
+                for var in sorted(var_dict[suite]):
+                    _check(('L3m', sensor_code, date, None, suite, var, resolution,
+                            composite), [l3b_key])
+    # L3m --> daily multi-sensor composite
+    if daily_composite:
+        l3m_groups = defaultdict(list)
+        for key in set(index) | set(planned):
+            if key[0] == 'L3m' and key[1] in sensor_codes and key[7] == 'DAY' and \
+                    key[6] == resolution and _in_range(key):
+                l3m_groups[key[2:]].append(key)
+        for key, input_keys in sorted(l3m_groups.items()):
+            _check(('L3m', 'X') + key, sorted(input_keys))
+    work_list.sort(key=lambda x: (_LEVEL_ORDER[x.level], x.composite != 'DAY',
+                                  x.sensor_code == 'X', x.date, x.filename))
+    return work_list
+
+
+def work_dates(work_list, level=None, composite=None, sensor_code=None):
+    """Dates of the units of a work list, to pass as date_list to the batchers
+
+    Args:
+        work_list (list): A list of WorkUnit (see find_gaps)
+        level (str or list): Only consider units of this level (or levels)
+        composite (str): Only consider units of this composite type (e.g. 'DAY', '8DAY')
+        sensor_code (str or list): Only consider units of this sensor (or sensors)
+
+    Returns:
+        list: A sorted list of unique datetime
+
+    Examples:
+        >>> # Dates of the missing 8DAY composites, to pass to l3bin_map_batcher
+        >>> satmo.work_dates(work_list, ['L3b', 'L3m'], composite='8DAY')
+    """
+    if isinstance(level, str):
+        level = [level]
+    if isinstance(sensor_code, str):
+        sensor_code = [sensor_code]
+    dates = set(x.date for x in work_list
+                if (level is None or x.level in level) and
+                (composite is None or x.composite == composite) and
+                (sensor_code is None or x.sensor_code in sensor_code))
+    return sorted(dates)
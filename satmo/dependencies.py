@@ -0,0 +1,148 @@
+"""Dependency tracking between the files of the archive
+
+Processed files (L3b, L3m, L2m, composites) record the size and modification
+time (and optionally the sha1 checksum) of the inputs they were produced from:
+as a tag of the SATMO_INPUTS namespace for GeoTiffs and as a global attribute
+for netCDF files. This allows make-like updates, where an existing output is
+only rebuilt when one of its inputs changed (e.g. a refined L2 file replacing a
+near real time one), by passing ``overwrite='auto'`` to the processing functions.
+"""
+import os
+import json
+import hashlib
+
+import netCDF4 as nc
+import rasterio
+
+
+INPUTS_NS = 'SATMO_INPUTS'
+INPUTS_ATTRIBUTE = 'satmo_inputs'
+
+
+def file_checksum(filename, block_size=2**20):
+    """Compute the sha1 checksum of a file
+
+    Args:
+        filename (str): Path of the file
+        block_size (int): Number of bytes read at once
+
+    Returns:
+        str: The hexadecimal digest
+    """
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as src:
+        for block in iter(lambda: src.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def input_record(file_list, checksum=False):
+    """Describe the state of a list of input files
+
+    Args:
+        file_list (list): List of input files
+        checksum (bool): Also compute the sha1 checksum of the files. Defaults to False
+
+    Returns:
+        dict: A dictionary with input basenames as keys and dictionaries with
+        size, mtime (and sha1) as values
+    """
+    record = {}
+    for file in file_list:
+        stat = os.stat(file)
+        record[os.path.basename(file)] = {'size': stat.st_size, 'mtime': stat.st_mtime}
+        if checksum:
+            record[os.path.basename(file)]['sha1'] = file_checksum(file)
+    return record
+
+
+def write_inputs(filename, file_list, checksum=False):
+    """Record the state of the inputs of a file in the file itself
+
+    Args:
+        filename (str): Output file (GeoTiff or netCDF)
+        file_list (list): Input files used to produce filename
+        checksum (bool): Also record the sha1 checksum of the inputs
+    """
+    record = json.dumps(input_record(file_list, checksum))
+    if filename.endswith('.nc'):
+        with nc.Dataset(filename, 'a') as dst:
+            dst.setncattr(INPUTS_ATTRIBUTE, record)
+    else:
+        with rasterio.open(filename, 'r+') as dst:
+            dst.update_tags(ns=INPUTS_NS, inputs=record)
+
+
+def read_inputs(filename):
+    """Read the input record of a file written by write_inputs
+
+    Args:
+        filename (str): Output file (GeoTiff or netCDF)
+
+    Returns:
+        dict: The input record (see input_record), None if the file has no record
+    """
+    try:
+        if filename.endswith('.nc'):
+            with nc.Dataset(filename) as src:
+                record = src.getncattr(INPUTS_ATTRIBUTE)
+        else:
+            with rasterio.open(filename) as src:
+                record = src.tags(ns=INPUTS_NS)['inputs']
+    except (KeyError, AttributeError, IOError, RuntimeError):
+        return None
+    return json.loads(record)
+
+
+def is_outdated(filename, file_list):
+    """Check whether a file must be rebuilt from its inputs
+
+    A file is outdated when the list of its inputs changed, or when the size or
+    modification time of one of them differs from the one recorded when the file
+    was written. When checksums were recorded, a modification time change with
+    unchanged content does not make the file outdated. Files without a record
+    (e.g. produced by an earlier version) are compared by modification time,
+    like make does.
+
+    Args:
+        filename (str): Output file
+        file_list (list): Current inputs of filename
+
+    Returns:
+        bool: True if filename does not exist or must be rebuilt
+    """
+    if not os.path.isfile(filename):
+        return True
+    record = read_inputs(filename)
+    if record is None:
+        mtime = os.path.getmtime(filename)
+        return any(os.path.getmtime(x) > mtime for x in file_list)
+    if set(record) != set(os.path.basename(x) for x in file_list):
+        return True
+    for file in file_list:
+        recorded = record[os.path.basename(file)]
+        stat = os.stat(file)
+        if stat.st_size != recorded['size']:
+            return True
+        if stat.st_mtime != recorded['mtime']:
+            if 'sha1' not in recorded or file_checksum(file) != recorded['sha1']:
+                return True
+    return False
+
+
+def needs_build(filename, file_list, overwrite=False):
+    """Apply the overwrite argument of the processing functions
+
+    Args:
+        filename (str): Output file
+        file_list (list): Inputs of filename
+        overwrite (bool or str): True to always (re)build the file, False to only
+            build it when it does not exist, 'auto' to also rebuild it when it is
+            outdated (see is_outdated)
+
+    Returns:
+        bool: True if filename must be (re)built
+    """
+    if overwrite == 'auto':
+        return is_outdated(filename, file_list)
+    return bool(overwrite) or not os.path.isfile(filename)
@@ -3,14 +3,78 @@ import requests
 import os.path
 import os
 import time
+import shutil
 import warnings
 import contextlib
+import heapq
+import threading
+import Queue
+import urlparse
+from collections import OrderedDict, defaultdict, deque
 from pprint import pprint
 
+from requests.packages.urllib3.exceptions import HTTPError as Urllib3Error
+
+from . import session
 from .utils import path_builder
-from .errors import HttpResourceNotAvailable
+from .catalog import register, get_catalog
+from .dependencies import file_checksum
+from .errors import HttpResourceNotAvailable, ChecksumMismatch
+
+# Size (in bytes) of the reads and writes of downloads
+CHUNK_SIZE = 2 ** 20
+
+# Errors after which a download is attempted again: connection problems, and
+# server errors still occurring once the retries of the session are exhausted
+_RETRIED_ERRORS = (requests.ConnectionError, requests.Timeout,
+                   requests.exceptions.ChunkedEncodingError,
+                   requests.exceptions.RetryError)
+
+def _part_filename(local_filename):
+    """Hidden file receiving the data of local_filename until the download completes"""
+    dirname, basename = os.path.split(local_filename)
+    return os.path.join(dirname, '.%s.part' % basename)
+
+
+def _validator_filename(part_filename):
+    """File holding the validator (ETag or Last-Modified) of the remote file a
+    part file is a part of"""
+    return part_filename + '.validator'
+
+
+def _read_validator(part_filename):
+    """Validator of a part file, None if the part file cannot be resumed"""
+    validator_filename = _validator_filename(part_filename)
+    if not os.path.isfile(part_filename) or not os.path.isfile(validator_filename):
+        return None
+    with open(validator_filename) as src:
+        return src.read() or None
 
-def download_file(url, write_dir, overwrite = False, check_integrity = False, timeout = 15):
+
+def _remove_validator(part_filename):
+    if os.path.isfile(_validator_filename(part_filename)):
+        os.remove(_validator_filename(part_filename))
+
+
+def _copy_body(response, f, chunk_size, raw=True):
+    """Write the body of a streamed response to a file object"""
+    if raw and 'Content-Encoding' not in response.headers:
+        # Large reads of the undecoded stream straight into the file, without
+        # the per chunk generator overhead of iter_content
+        try:
+            shutil.copyfileobj(response.raw, f, chunk_size)
+        except Urllib3Error as e:
+            # iter_content turns these into requests exceptions
+            raise requests.ConnectionError(e)
+    else:
+        # Compressed transfers must be decoded
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                f.write(chunk)
+
+
+def download_file(url, write_dir, overwrite = False, check_integrity = False, timeout = None,
+                  chunk_size = CHUNK_SIZE, raw = True, stats = None):
     """Generic file download function
 
     Downloads a file from a URL, and write it to a user defined location.
@@ -18,44 +82,105 @@ def download_file(url, write_dir, overwrite = False, check_integrity = False, ti
     with the server (e.g.: network is down) and an HttpResourceNotAvailable if the file appear not to
     exist on the server
 
+    Data are written to a hidden .part file of write_dir, renamed to the final
+    filename once the download is complete. The validator (ETag or Last-Modified)
+    of the remote file is saved next to the .part file, so that a download
+    interrupted earlier (e.g. by a ConnectionError, or a crash of the process)
+    is resumed with a Range request, provided the server supports it and the
+    remote file did not change; the file is downloaded from the start otherwise,
+    and when the server did not send a validator.
+
     Args:
         url (str): download url
         write_dir (str): Host directory to which the data will be written
         overwrite (bool): Should the file be overwritten if already existing on local host
         check_integrity (bool): Only makes sense if overwrite is set to False (when updating the archive)
         timeout (float): How long to wait (in seconds) for the server to send data before giving up and 
-            raising a requests.ConnectionError
+            raising a requests.ConnectionError. Defaults to the timeout of the shared session
+            (see satmo.session)
+        chunk_size (int): Size (in bytes) of the reads from the connection and
+            writes to the file. Defaults to CHUNK_SIZE (1 MB)
+        raw (bool): Copy the raw response stream to the file rather than iterating
+            over the content of the response. Responses with a Content-Encoding
+            are always decoded. Defaults to True
+        stats (dict): Optional dictionary in which the number of bytes received
+            ('bytes') and the duration of the transfer in seconds ('seconds') are
+            accumulated. Bytes of failed transfers are counted too
 
     Returns:
         str: The filename of the downloaded data
     """
     local_filename = os.path.join(write_dir, url.split('/')[-1])
+    part_filename = _part_filename(local_filename)
     file_exists = os.path.isfile(local_filename)
     if file_exists and not overwrite and not check_integrity:
         # No need to even send a request, end function
         return None
-    # Test that file is present on remote
-    r0 = requests.head(url)
-    if r0.status_code == 404:
-        raise HttpResourceNotAvailable
-    if not overwrite and file_exists and check_integrity:
-        # FIle integrity checking
-        if os.path.getsize(local_filename) == int(r0.headers['Content-Length']): # file size matches
+    if file_exists and not overwrite:
+        # Integrity checking; a HEAD request leaves the pooled connection
+        # reusable, which closing an unread streamed GET does not
+        r0 = session.head(url, timeout = timeout, allow_redirects = True)
+        if r0.status_code == 404:
+            raise HttpResourceNotAvailable
+        r0.raise_for_status()
+        if os.path.getsize(local_filename) == int(r0.headers.get('Content-Length', -1)):
             return None
-    # Create directory if it doesn't exist yet
-    if not os.path.exists(write_dir):
-        os.makedirs(write_dir)
-    # Download file
-    with contextlib.closing(requests.get(url, stream=True, timeout = timeout)) as r1:
-        with open(local_filename, 'wb') as f:
-            for chunk in r1.iter_content(chunk_size=1024):
-                if chunk:
-                    f.write(chunk)
+    headers = {}
+    validator = _read_validator(part_filename)
+    if validator is not None:
+        # The server sends the full file if it changed since
+        headers['Range'] = 'bytes=%d-' % os.path.getsize(part_filename)
+        headers['If-Range'] = validator
+    with contextlib.closing(session.get(url, stream=True, timeout = timeout,
+                                        headers = headers)) as r1:
+        # Test that file is present on remote
+        if r1.status_code == 404:
+            raise HttpResourceNotAvailable
+        if r1.status_code == 416:
+            # The part file is not a part of the remote file; start again
+            _remove_validator(part_filename)
+            return download_file(url, write_dir, overwrite, check_integrity, timeout,
+                                 chunk_size, raw, stats)
+        r1.raise_for_status()
+        if r1.status_code == 206:
+            size = int(r1.headers['Content-Range'].split('/')[-1])
+            mode = 'ab'
+        else:
+            size = int(r1.headers.get('Content-Length', -1))
+            mode = 'wb'
+        # Create directory if it doesn't exist yet
+        if not os.path.exists(write_dir):
+            os.makedirs(write_dir)
+        # Download file
+        if mode == 'wb':
+            validator = r1.headers.get('ETag', r1.headers.get('Last-Modified'))
+            if validator is None:
+                # Without validator, an interrupted download cannot be resumed safely
+                _remove_validator(part_filename)
+            else:
+                with open(_validator_filename(part_filename), 'w') as dst:
+                    dst.write(validator)
+        offset = os.path.getsize(part_filename) if mode == 'ab' else 0
+        start = time.time()
+        try:
+            with open(part_filename, mode) as f:
+                _copy_body(r1, f, chunk_size, raw)
+        finally:
+            if stats is not None and os.path.isfile(part_filename):
+                stats['bytes'] = stats.get('bytes', 0) + os.path.getsize(part_filename) - offset
+                stats['seconds'] = stats.get('seconds', 0) + time.time() - start
+        # Transfers cut by the server do not always raise an error
+        if size >= 0 and 'Content-Encoding' not in r1.headers and \
+                os.path.getsize(part_filename) != size:
+            raise requests.ConnectionError('Incomplete download of %s' % url)
+    os.rename(part_filename, local_filename)
+    _remove_validator(part_filename)
     return local_filename
 
 
 
-def download_to_tree(url, base_dir, overwrite = False, check_integrity = False):
+def download_to_tree(url, base_dir, overwrite = False, check_integrity = False,
+                     chunk_size = CHUNK_SIZE, raw = True, stats = None):
     """Download an ocean product file and automatically write it to the right location
 
     The idea is that the function immediately knows where to write the file
@@ -71,16 +196,21 @@ def download_to_tree(url, base_dir, overwrite = False, check_integrity = False):
         base_dir (str): root of the archive tree on the host
         overwrite (bool): Should the file be overwritten if already existing on local host
         check_integrity (bool): Only makes sense if overwrite is set to False (when updating the archive)
+        chunk_size (int): Size (in bytes) of the reads and writes (see download_file)
+        raw (bool): Copy the raw response stream to the file (see download_file)
+        stats (dict): Optional dictionary accumulating the transfer statistics (see download_file)
 
     Returns:
         str: The filename of the downloaded file
     """
     write_dir = path_builder(url, data_root=base_dir, add_file = False)
-    file_path = download_file(url, write_dir, overwrite = overwrite, check_integrity = check_integrity)
+    file_path = download_file(url, write_dir, overwrite = overwrite, check_integrity = check_integrity,
+                              chunk_size = chunk_size, raw = raw, stats = stats)
     return file_path
 
 
-def download_robust(url, base_dir, n_retries = 5, pause_retries = 10, overwrite = False, check_integrity = False):
+def download_robust(url, base_dir, n_retries = 5, pause_retries = 10, overwrite = False, check_integrity = False,
+                    chunk_size = CHUNK_SIZE):
     """Robust download of a list of urls
 
     Handles connection errors, optionally check for existing files and integrity
@@ -89,10 +219,12 @@ def download_robust(url, base_dir, n_retries = 5, pause_retries = 10, overwrite
     Args:
         url (str): Download url
         base_dir (str): root of the archive tree on the host
-        n_retries (int): Number of retries when the download fails because of a ConnectionError
+        n_retries (int): Number of retries when the download fails because of a ConnectionError,
+            a timeout or server errors persisting after the retries of the session
         pause_retries (int): Duration (in seconds) between retries
         overwrite (bool): Should existing files on the host be overwritten
         check_integrity (bool): Only makes sense if overwrite is set to False (when updating the archive)
+        chunk_size (int): Size (in bytes) of the reads and writes (see download_file)
 
     Returns:
         Boolean, True when successful, False otherwise
@@ -100,11 +232,13 @@ def download_robust(url, base_dir, n_retries = 5, pause_retries = 10, overwrite
     n = 1
     while n <= n_retries:
         try:
-            file_path = download_to_tree(url, base_dir, overwrite = overwrite, check_integrity = check_integrity)
+            file_path = download_to_tree(url, base_dir, overwrite = overwrite, check_integrity = check_integrity,
+                                         chunk_size = chunk_size)
+            register(file_path)
             return file_path
-        except requests.ConnectionError:
+        except _RETRIED_ERRORS:
             n += 1
-            overwrite = True # In case file has been partly downloaded 
+            # The download resumes from the partly downloaded file
             time.sleep(pause_retries)
         except HttpResourceNotAvailable:
             warnings.warn(url + ' not downloaded. Not found on server')
@@ -114,3 +248,145 @@ def download_robust(url, base_dir, n_retries = 5, pause_retries = 10, overwrite
             return None
     warnings.warn(url + ' not downloaded. Max retries reached')
     return None
+
+
+def _download_worker(jobs, results):
+    """Download thread of download_many; runs jobs until it receives None"""
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        url, base_dir, overwrite, check_integrity, chunk_size, expected = job
+        stats = {}
+        try:
+            file_path = download_to_tree(url, base_dir, overwrite=overwrite,
+                                         check_integrity=check_integrity,
+                                         chunk_size=chunk_size, stats=stats)
+            sha1 = None
+            # Checksums are computed here rather than on registration, to keep
+            # the main thread free
+            if file_path is not None and (expected is not None or get_catalog() is not None):
+                sha1 = file_checksum(file_path)
+                if expected is not None and sha1 != expected:
+                    os.remove(file_path)
+                    raise ChecksumMismatch('%s does not match its checksum' % url)
+            results.put((url, 'done', (file_path, sha1), stats))
+        except _RETRIED_ERRORS + (ChecksumMismatch,) as e:
+            results.put((url, 'retry', e, stats))
+        except HttpResourceNotAvailable as e:
+            results.put((url, 'missing', e, stats))
+        except Exception as e:
+            results.put((url, 'error', e, stats))
+
+
+def download_many(urls, base_dir, n_workers=4, per_host=4, n_retries=5, pause_retries=10,
+                  overwrite=False, check_integrity=False, chunk_size=CHUNK_SIZE, report=True,
+                  checksums=None):
+    """Concurrent robust download of a list of urls
+
+    Same behaviour as download_robust for every url, but up to n_workers files are
+    downloaded simultaneously (with at most per_host connections to the same
+    server). Downloads failing because of a connection error are retried after
+    pause_retries seconds, doubled at every new attempt, while the other
+    downloads go on. Results are yielded as downloads complete, so that
+    processing of the first files can start while the others are still being
+    downloaded. Downloaded files are verified against their expected checksum
+    when one is provided, and downloaded again if they do not match. Once all
+    urls were processed, the volume downloaded and the
+    achieved throughput are reported.
+
+    Args:
+        urls (list): Download urls. Duplicates are downloaded once
+        base_dir (str): root of the archive tree on the host
+        n_workers (int): Maximum number of simultaneous downloads. Defaults to 4
+        per_host (int): Maximum number of simultaneous downloads from the same
+            server. Defaults to 4
+        n_retries (int): Number of attempts when the download fails because of a
+            ConnectionError, a timeout or server errors persisting after the
+            retries of the session
+        pause_retries (int): Duration (in seconds) before the first retry
+        overwrite (bool): Should existing files on the host be overwritten
+        check_integrity (bool): Only makes sense if overwrite is set to False (when updating the archive)
+        chunk_size (int): Size (in bytes) of the reads and writes (see download_file)
+        report (bool): Print the volume downloaded and the throughput at the end.
+            Defaults to True
+        checksums (dict): Optional expected sha1 checksums of the files, by
+            filename (see get_subscription_checksums)
+
+    Returns:
+        generator: (url, filename) tuples, in completion order. filename is None
+        when the file was not downloaded (failure, or existing file)
+
+    Examples:
+        >>> import satmo
+        >>> for url, filename in satmo.download_many(url_list, '/export/isilon/datos2/satmo2_data',
+                                                     n_workers=8, per_host=4):
+        >>>     if filename is not None:
+        >>>         satmo.l2gen(filename, ...)
+    """
+    checksums = checksums or {}
+    jobs = Queue.Queue()
+    results = Queue.Queue()
+    threads = [threading.Thread(target=_download_worker, args=(jobs, results))
+               for _ in range(n_workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    # Urls waiting for a connection, by host
+    waiting = OrderedDict()
+    for url in OrderedDict.fromkeys(urls):
+        waiting.setdefault(urlparse.urlsplit(url).netloc, deque()).append(url)
+    delayed = [] # Heap of (time, url) of the retries
+    attempts = defaultdict(int)
+    active = defaultdict(int)
+    running = 0
+    received = 0
+    start = time.time()
+    try:
+        while running or delayed or any(waiting.values()):
+            while delayed and delayed[0][0] <= time.time():
+                url = heapq.heappop(delayed)[1]
+                waiting[urlparse.urlsplit(url).netloc].append(url)
+            for host, queue in waiting.items():
+                while queue and active[host] < per_host and running < n_workers:
+                    url = queue.popleft()
+                    attempts[url] += 1
+                    active[host] += 1
+                    running += 1
+                    jobs.put((url, base_dir, overwrite, check_integrity, chunk_size,
+                              checksums.get(os.path.basename(url))))
+            timeout = delayed[0][0] - time.time() if delayed else 9999999
+            if not running:
+                time.sleep(max(timeout, 0))
+                continue
+            try:
+                # A timeout is also required for KeyboardInterrupt to work
+                url, status, value, stats = results.get(True, max(timeout, 0.01))
+            except Queue.Empty:
+                continue
+            received += stats.get('bytes', 0)
+            running -= 1
+            active[urlparse.urlsplit(url).netloc] -= 1
+            if status == 'done':
+                file_path, sha1 = value
+                register(file_path, checksums={file_path: sha1} if sha1 else None)
+                yield url, file_path
+                continue
+            if status == 'retry':
+                if attempts[url] < n_retries:
+                    heapq.heappush(delayed, (time.time() + pause_retries * 2 ** (attempts[url] - 1),
+                                             url))
+                    continue
+                warnings.warn(url + ' not downloaded. Max retries reached')
+            elif status == 'missing':
+                warnings.warn(url + ' not downloaded. Not found on server')
+            else:
+                warnings.warn(url + ' not downloaded. Unknown reason')
+            yield url, None
+        if report and received:
+            elapsed = time.time() - start
+            pprint('Downloaded %.1f MB in %.1f s (%.2f MB/s)' %
+                   (received / 1e6, elapsed, received / 1e6 / max(elapsed, 1e-6)))
+    finally:
+        for thread in threads:
+            jobs.put(None)
@@ -9,3 +9,7 @@ class SeadasError(Exception):
 class TimeoutException(Exception):
     """Custom exception for when a set time limit is exceeded"""
     pass
+
+class ChecksumMismatch(Exception):
+    """Custom exception for when a file does not match its expected checksum"""
+    pass
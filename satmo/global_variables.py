@@ -127,6 +127,11 @@ COMPOSITES = {'DAY': 'Daily',
               '16DAY': '16 day composite',
               'MO': 'Monthly composite'}
 
+# Composite length (as expected by pre_compose and find_composite_date_list)
+COMPOSITE_DELTAS = {'8DAY': 8,
+                    '16DAY': 16,
+                    'MO': 'month'}
+
 SUBSCRIPTIONS = {'L2':{'nrt': {'day': [1823, 1821, 1825],
                                'night': [1824, 1822, 1826]},
                        'refined': {'day': [1857, 1859, 1861],
@@ -0,0 +1,87 @@
+"""Integrity verification of the archive with checksums
+
+The sha1 checksum of the files downloaded by satmo is recorded in the catalog
+(see satmo.catalog.register). Updating the archive from the checksum
+manifest published by the data provider (see get_subscription_checksums) then
+consists in comparing, in bulk, the manifest to the checksums of the local files,
+rather than sending a request per file to compare sizes: only the files that are
+missing or differ are downloaded. Checksums that are not recorded, or whose file
+changed since, are computed in parallel and recorded for the next comparison.
+"""
+import os
+
+from .catalog import get_catalog, register
+from .dependencies import file_checksum
+from .scheduler import parallel_map
+from .utils import path_builder
+
+
+def _checksum_item(filename):
+    """Compute the checksum of a file in a worker"""
+    return filename, file_checksum(filename)
+
+
+def local_checksums(file_list, n_workers=1):
+    """Retrieve or compute the sha1 checksums of local files
+
+    Checksums recorded in the default catalog (if one is set) are used for the
+    files that did not change since; the other checksums are computed in
+    parallel, and recorded in the catalog.
+
+    Args:
+        file_list (list): List of filenames. Files that do not exist are ignored
+        n_workers (int): Number of processes computing checksums. Defaults to 1
+
+    Returns:
+        dict: sha1 checksums by filename
+    """
+    file_list = [x for x in file_list if os.path.isfile(x)]
+    catalog = get_catalog()
+    checksums = catalog.checksums(file_list) if catalog is not None else {}
+    missing = [x for x in file_list if x not in checksums]
+    computed = dict(parallel_map(_checksum_item, missing, n_workers=n_workers))
+    register(list(computed), checksums=computed)
+    checksums.update(computed)
+    return checksums
+
+
+def compare_manifest(url_list, manifest, data_root, n_workers=1):
+    """Compare remote files to the local archive using a checksum manifest
+
+    Args:
+        url_list (list): Download urls of the remote files
+        manifest (dict): sha1 checksums of the remote files, by filename (see
+            get_subscription_checksums)
+        data_root (str): Root of the local archive
+        n_workers (int): Number of processes computing the checksums of local
+            files. Defaults to 1
+
+    Returns:
+        tuple: Three lists of urls: the files missing from the local archive,
+        the files whose local version differs from the remote one, and the files
+        that are present locally but absent from the manifest (which cannot be
+        verified)
+
+    Examples:
+        >>> import satmo
+        >>> urls = satmo.get_subscription_urls(1821)
+        >>> manifest = satmo.get_subscription_checksums(1821)
+        >>> missing, changed, unknown = satmo.compare_manifest(urls, manifest,
+                                                               '/export/isilon/datos2/satmo2_data',
+                                                               n_workers=8)
+    """
+    local = dict((url, path_builder(url, data_root=data_root)) for url in url_list)
+    missing = []
+    unknown = []
+    verified = []
+    for url in url_list:
+        if not os.path.isfile(local[url]):
+            missing.append(url)
+        elif os.path.basename(url) not in manifest:
+            unknown.append(url)
+        else:
+            verified.append(url)
+    checksums = local_checksums([local[url] for url in verified], n_workers=n_workers)
+    changed = [url for url in verified
+               if checksums.get(local[url]) != manifest[os.path.basename(url)]]
+    return missing, changed, unknown
@@ -0,0 +1,100 @@
+"""Journal of the completed units of long batch runs
+
+A journal is an append-only SQLite database recording, for every completed unit
+of work (e.g. a task of a TaskGraph), the file it produced together with the
+size, modification time and optionally sha1 checksum of that file. A run that
+died partway (node reboot, time limit, ...) can then be resumed: units whose
+output is still the one recorded are skipped, and all other units are processed
+again. Outputs of the SeaDAS wrappers and of the compositing functions are
+written under a temporary name and renamed once complete (see atomic_output),
+so that interrupted units never leave a partial file under the final name.
+"""
+import os
+import sqlite3
+from datetime import datetime
+
+from .dependencies import file_checksum
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    sha1 TEXT,
+    completed TEXT
+);
+CREATE INDEX IF NOT EXISTS units_name ON units (name);
+"""
+
+
+class Journal(object):
+    """Append-only journal of completed units
+
+    Args:
+        db_file (str): Filename of the SQLite database. Created if it does not exist
+
+    Examples:
+        >>> import satmo
+
+        >>> graph = satmo.processing_graph(...)
+        >>> graph.run(limits={'cpu': 8}, journal='/home/user/bin_map_2000_2017.journal')
+        >>> # After a crash, only run the units that did not complete
+        >>> graph.run(limits={'cpu': 8}, journal='/home/user/bin_map_2000_2017.journal',
+                      resume=True)
+    """
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._conn = sqlite3.connect(db_file, timeout=60)
+        with self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def record(self, name, path, sha1=None):
+        """Record a completed unit
+
+        Args:
+            name (str): Name of the unit
+            path (str): Output file of the unit
+            sha1 (str): Optional sha1 checksum of path, allowing to verify the
+                output when resuming. Not computed here, to keep recording cheap
+        """
+        stat = os.stat(path)
+        with self._conn:
+            self._conn.execute('INSERT INTO units (name, path, size, mtime, sha1, completed) '
+                               'VALUES (?, ?, ?, ?, ?, ?)',
+                               (name, os.path.abspath(path), stat.st_size, stat.st_mtime,
+                                sha1, datetime.now().isoformat()))
+
+    def completed(self, name, verify=False):
+        """Check whether a unit completed, and its output is still the recorded one
+
+        Args:
+            name (str): Name of the unit
+            verify (bool): Compare the checksum of the output to the recorded one.
+                Units recorded without checksum are then considered not completed.
+                Defaults to False, in which case only the size and modification
+                time of the output are compared
+
+        Returns:
+            str: The output file of the unit, None if the unit did not complete or
+            its output changed since
+        """
+        row = self._conn.execute('SELECT path, size, mtime, sha1 FROM units WHERE name = ? '
+                                 'ORDER BY id DESC LIMIT 1', (name,)).fetchone()
+        if row is None:
+            return None
+        path, size, mtime, sha1 = row
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_size != size or stat.st_mtime != mtime:
+            return None
+        if verify and (sha1 is None or file_checksum(path) != sha1):
+            return None
+        return path
@@ -13,6 +13,7 @@ from .utils import (filename_parser,
                     is_day, filename_builder, to_km,
                     viirs_geo_filename_builder, randomword)
 from .errors import SeadasError
+from .catalog import register
 from .global_variables import STANDARD_L3_SUITES
 
 
@@ -184,5 +185,6 @@ def l2gen(x, var_list, suite, data_root, get_anc=True):
         [os.remove(y) for y in del_files]
     if delete:
         os.remove(x)
+    register(output_filename)
     return output_filename
 
@@ -2,6 +2,11 @@ import os
 from glob import glob
 import subprocess
 import random
+import functools
+import itertools
+import hashlib
+import json
+from collections import OrderedDict
 
 import numpy as np
 import numpy.ma as ma
@@ -13,12 +18,16 @@ from pyproj import Proj
 from affine import Affine
 
 from .geo import geo_dict_from_nc, get_raster_meta
+from .catalog import register
+from .scheduler import parallel_map, in_worker
+from .dependencies import needs_build, write_inputs, input_record, INPUTS_NS
 from .utils import (filename_parser, file_finder, is_day,
-                    filename_builder, to_km)
+                    filename_builder, to_km, find_composite_date_list, atomic_output,
+                    atomic_outputs, randomword)
 from .visualization import make_preview
 from .errors import SeadasError
 from .global_variables import (L3_SUITE_FROM_VAR, QUAL_ARRAY_NAME_FROM_SUITE,
-                               STANDARD_L3_SUITES, FLAGS)
+                               STANDARD_L3_SUITES, FLAGS, COMPOSITE_DELTAS)
 
 def nc2tif(file, proj4string = None):
     """Generate geotiff from L3m netcdf array
@@ -58,8 +67,118 @@ def nc2tif(file, proj4string = None):
     return file_out
 
 
+def _read_layer(file, window=None):
+    """Read a single layer raster file (geoTiff or L3m netcdf) as a numpy array
+
+    Args:
+        file (str): Input file name
+        window (tuple): Optional ((row_start, row_stop), (col_start, col_stop))
+            window to read. Defaults to None (full array)
+    """
+    _, ext = os.path.splitext(file)
+    if ext == '.nc':
+        var = filename_parser(file)['variable']
+        if window is None:
+            window = ((None, None), (None, None))
+        rows, cols = window
+        # Read array
+        with nc.Dataset(file) as src:
+            array = src.variables[var][slice(*rows), slice(*cols)]
+    else:
+        with rasterio.open(file) as src:
+            array = src.read(1, window=window)
+    return array
+
+def _read_compositing_meta(file):
+    """Read the COMPOSITING_META tags of a file, empty dictionary if there are none
+    """
+    try:
+        with rasterio.open(file) as src:
+            composite_meta = src.tags(ns='COMPOSITING_META')
+    except:
+        composite_meta = {}
+    return composite_meta
+
+MEDIAN_BLOCK_SIZE = 2**20
+
+def _nanmedian(array_list, block_size=MEDIAN_BLOCK_SIZE):
+    """Exact median of a list of arrays, ignoring nan and masked values
+
+    Equivalent to ``np.nanmedian(ma.array(array_list), axis=0)`` but works on
+    blocks of lines of at most block_size stacked values, so that no full 3D
+    (masked) stack is ever built. In each block, half of the invalid values of
+    every cell are replaced by -inf and the other half left as nan (which are
+    placed last), so that the two middle valid values of every cell end up at
+    fixed ranks of the stack, around its middle. The stack is then partitioned
+    (rather than sorted) along the stacking dimension around these ranks only.
+
+    Args:
+        array_list (list): List of arrays (typically 2D, possibly masked) of
+            identical shape
+        block_size (int): Maximum number of stacked values processed at once
+
+    Returns:
+        np.ndarray: The median array (float32 unless inputs are float64), with
+        np.nan where there are no valid values
+    """
+    n = len(array_list)
+    shape = array_list[0].shape
+    dtype = np.result_type(np.float32, *[x.dtype for x in array_list])
+    median = np.empty(shape, dtype=dtype)
+    block_lines = max(1, block_size // (n * int(np.prod(shape[1:]))))
+    # Middle ranks of the stack. With as many invalid values below the valid ones
+    # as above (give or take one), the median of a cell is at low and high, or at
+    # low - 1 and low when its count of valid values is even while n is odd
+    low, high = (n - 1) // 2, n // 2
+    kth = sorted(set([max(low - 1, 0), low, high]))
+    for start in range(0, shape[0], block_lines):
+        lines = slice(start, start + block_lines)
+        stack = np.empty((n,) + median[lines].shape, dtype=dtype)
+        count = np.full(stack.shape[1:], n, dtype=np.int32)
+        for i, x in enumerate(array_list):
+            stack[i] = ma.filled(ma.asarray(x[lines]).astype(dtype), np.nan)
+            count -= np.isnan(stack[i])
+        n_below = (n - count) // 2
+        seen = np.zeros(count.shape, dtype=np.int32)
+        for layer in stack:
+            invalid = np.isnan(layer)
+            seen += invalid
+            invalid &= seen <= n_below
+            layer[invalid] = -np.inf
+        stack.partition(kth, axis=0)
+        odd = (n - count) % 2 == 1
+        cells = tuple(np.indices(count.shape))
+        block = stack[(np.where(odd & (count % 2 == 0), max(low - 1, 0), low),) + cells]
+        block += stack[(np.where(odd, low, high),) + cells]
+        block /= 2
+        block[count == 0] = np.nan
+        median[lines] = block
+    return median
+
+def _nancount(array_list):
+    """Number of valid (not nan and not masked) values of a list of arrays"""
+    count = np.zeros(array_list[0].shape, dtype=np.uint16)
+    for x in array_list:
+        count += ~np.isnan(ma.filled(ma.asarray(x).astype(np.float32), np.nan))
+    return count
+
+def _compose_arrays(fun, array_list):
+    """Apply a compositing function ('mean', 'median', 'max', 'min', 'std', 'count')
+    to a list of arrays
+    """
+    if fun in ['median', 'count']:
+        return _COMPOSITING_FUNCTIONS[fun](array_list)
+    return _COMPOSITING_FUNCTIONS[fun](ma.array(array_list), axis=0)
+
+_COMPOSITING_FUNCTIONS = {'mean': np.nanmean,
+                          'median': _nanmedian,
+                          'max': np.nanmax,
+                          'min': np.nanmin,
+                          'std': np.nanstd,
+                          'count': _nancount}
+
 class Composer(object):
-    """Compose arrays with min, max, median, max
+    """Compose arrays with min, max, median, max, std and count
     For inheritance only, not exported to package __init__"""
     def __init__(self, *args):
         """Instantiate Composer class
@@ -70,18 +189,33 @@ class Composer(object):
         self.array_list = args
         self.composed_array = None
         self.compositing_function = None
+        self.composed_arrays = None
+        self.compositing_functions = None
+    def _compose(self, fun):
+        self.composed_array = _compose_arrays(fun, self.array_list)
+        self.compositing_function = fun
     def mean(self):
-        self.composed_array = np.nanmean(ma.array(self.array_list), axis=0)
-        self.compositing_function = 'mean'
+        self._compose('mean')
     def median(self):
-        self.composed_array = np.nanmedian(ma.array(self.array_list), axis=0)
-        self.compositing_function = 'median'
+        self._compose('median')
     def max(self):
-        self.composed_array = np.nanmax(ma.array(self.array_list), axis=0)
-        self.compositing_function = 'max'
+        self._compose('max')
     def min(self):
-        self.composed_array = np.nanmin(ma.array(self.array_list), axis=0)
-        self.compositing_function = 'min'
+        self._compose('min')
+    def std(self):
+        self._compose('std')
+    def count(self):
+        """Number of valid observations"""
+        self._compose('count')
+    def compose_many(self, fun_list):
+        """Run several compositing functions on the same arrays
+
+        Args:
+            fun_list (list): List of compositing functions names (e.g.
+                ['mean', 'count', 'std'])
+        """
+        self.composed_arrays = [_compose_arrays(fun, self.array_list) for fun in fun_list]
+        self.compositing_functions = list(fun_list)
 
 # Compose time 
 
@@ -101,9 +235,20 @@ class FileComposer(Composer):
         >>> compose_class = satmo.FileComposer(file1, file2, file3)
         >>> compose_class.mean()
         >>> compose_class.to_file('combined/X2015001.L3m_DAY_CHL_chlor_a_1km_2.tif')
+
+        >>> # Large area composites, processed and written one window at a time
+        >>> compose_class = satmo.FileComposer(file1, file2, file3, windowed=True)
+        >>> compose_class.mean()
+        >>> compose_class.to_file('combined/X2015001.L3m_DAY_CHL_chlor_a_1km_2.tif')
+
+        >>> # Several statistics from a single read of the inputs
+        >>> compose_class = satmo.FileComposer(file1, file2, file3)
+        >>> compose_class.compose_many(['mean', 'count'])
+        >>> compose_class.to_files(['combined/X2015001.L3m_DAY_CHL_chlor_a_mean_1km.tif',
+                                    'combined/X2015001.L3m_DAY_CHL_chlor_a_count_1km.tif'])
     """
 
-    def _read_masked_array(self, file):
+    def _read_masked_array(self, file, window=None):
         """Util function to read a single layer raster file as masked np array
 
         The 'masked' part has been removed when input is a geotiff (most
@@ -112,17 +257,28 @@ class FileComposer(Composer):
 
         Args:
             file (str): Input file name
+            window (tuple): Optional ((row_start, row_stop), (col_start, col_stop))
+                window to read. Defaults to None (full array)
         """
-        _, ext = os.path.splitext(file)
-        if ext == '.nc':
-            var = filename_parser(file)['variable']
-            # Read array
-            with nc.Dataset(file) as src:
-                array = src.variables[var][:]
-        else:
-            with rasterio.open(file) as src:
-                array = src.read(1)
-        return array
+        return _read_layer(file, window)
+
+    def _windows(self):
+        """Generate the ((row_start, row_stop), (col_start, col_stop)) windows
+        over which the composite is computed in windowed mode
+
+        Block windows of the first input are used when it is a geoTiff and
+        window_lines is not set, row strips of window_lines lines otherwise
+        """
+        height, width = self.meta['height'], self.meta['width']
+        block_height, block_width = self.window_lines or 256, width
+        _, ext = os.path.splitext(self.file_list[0])
+        if self.window_lines is None and ext != '.nc':
+            with rasterio.open(self.file_list[0]) as src:
+                block_height, block_width = src.block_shapes[0]
+        for row in range(0, height, block_height):
+            for col in range(0, width, block_width):
+                yield ((row, min(row + block_height, height)),
+                       (col, min(col + block_width, width)))
 
     # TODO: Test function below
     def _read_compositing_meta(self, file):
@@ -134,19 +290,26 @@ class FileComposer(Composer):
         Args:
             file (str): Input file name
         """
-        try:
-            with rasterio.open(file) as src:
-                composite_meta = src.tags(ns='COMPOSITING_META')
-        except:
-            composite_meta = {}
-        return composite_meta
+        return _read_compositing_meta(file)
 
-    def __init__(self, *args):
+    def __init__(self, *args, **kwargs):
         """Instantiate FileComposer class
 
         Args:
             *args: Filenames pointing to raster files
+            windowed (bool): Process the inputs window by window rather than reading
+                them completely. In that mode the compositing methods only register
+                the compositing function, and the composite is computed and written
+                one window at a time by ``to_file``, so that peak memory is one window
+                times the number of input files. Defaults to False
+            window_lines (int): Number of lines of each window in windowed mode.
+                Defaults to None, in which case the block windows of the first
+                input are used
         """
+        self.windowed = kwargs.pop('windowed', False)
+        self.window_lines = kwargs.pop('window_lines', None)
+        if kwargs:
+            raise TypeError('Unexpected keyword argument(s): %s' % ', '.join(kwargs))
         self.file_list = args
         self.meta = get_raster_meta(args[0])
         # Get compositing metadata contained in input files, if there are none
@@ -154,9 +317,68 @@ class FileComposer(Composer):
         self.compositing_meta = {key: self._read_compositing_meta(key) for key in\
                                  self.file_list if\
                                  self._read_compositing_meta(key)}
-        array_list = [self._read_masked_array(x) for x in args]
+        if self.windowed:
+            array_list = []
+        else:
+            array_list = [self._read_masked_array(x) for x in args]
         super(FileComposer, self).__init__(*array_list)
 
+    def _compose(self, fun):
+        if self.windowed:
+            # Actual computation is deferred to to_file
+            self.compositing_function = fun
+        else:
+            super(FileComposer, self)._compose(fun)
+
+    def compose_many(self, fun_list):
+        if self.windowed:
+            # Actual computation is deferred to to_files
+            self.compositing_functions = list(fun_list)
+        else:
+            super(FileComposer, self).compose_many(fun_list)
+
+    def _write(self, fun_list, filename_list, composed_arrays=None):
+        """Write one or several composites of the inputs, each to its own file
+
+        In windowed mode, each window of the inputs is read once and all the
+        compositing functions are computed from it
+        """
+        if len(fun_list) != len(filename_list):
+            raise ValueError('One filename per compositing function is required')
+        inputs = json.dumps(input_record(self.file_list))
+        # Files are only renamed to their final names once all are complete
+        with atomic_outputs(filename_list) as tmp_list:
+            dst_list = []
+            try:
+                for fun, tmp_file in zip(fun_list, tmp_list):
+                    meta = self.meta.copy()
+                    if fun == 'count':
+                        meta.update(dtype=rasterio.uint16, nodata=None)
+                    dst_list.append(rasterio.open(tmp_file, 'w', **meta))
+                if self.windowed:
+                    for window in self._windows():
+                        array_list = [self._read_masked_array(x, window)
+                                      for x in self.file_list]
+                        for fun, dst in zip(fun_list, dst_list):
+                            composed_array = _compose_arrays(fun, array_list)
+                            dst.write(composed_array.astype(dst.dtypes[0]), 1,
+                                      window=window)
+                else:
+                    for composed_array, dst in zip(composed_arrays, dst_list):
+                        dst.write(composed_array.astype(dst.dtypes[0]), 1)
+                for fun, dst in zip(fun_list, dst_list):
+                    dst.update_tags(ns='COMPOSITING_META',
+                                    compositing_function=fun,
+                                    input_files=[os.path.basename(x)
+                                                 for x in self.file_list],
+                                    input_meta=self.compositing_meta)
+                    dst.update_tags(ns=INPUTS_NS, inputs=inputs)
+            finally:
+                for dst in dst_list:
+                    dst.close()
+        register(filename_list)
+        return filename_list
+
     def to_file(self, filename):
         """Write the composed array to file
 
@@ -165,18 +387,506 @@ class FileComposer(Composer):
         """
         # One of the method of the child class must have been ran before
         # running this method
-        with rasterio.open(filename, 'w', **self.meta) as dst:
-            dst.write(self.composed_array.astype(self.meta['dtype']), 1)
-            dst.update_tags(ns='COMPOSITING_META',
-                            compositing_function=self.compositing_function,
-                            input_files=[os.path.basename(x) for x in self.file_list],
-                           input_meta=self.compositing_meta)
+        self._write([self.compositing_function], [filename], [self.composed_array])
         return filename
 
+    def to_files(self, filename_list):
+        """Write the arrays composed with compose_many to file, one file per function
+
+        Args:
+            filename_list (list): List of filenames, in the order of the functions
+                passed to compose_many
+
+        Returns:
+            list: The list of written files
+        """
+        return self._write(self.compositing_functions, filename_list,
+                           self.composed_arrays)
+
     def to_scidb(self):
         pass
 
 
+class IncrementalComposer(object):
+    """Maintain a temporal composite from running statistics rather than from the
+    full list of inputs
+
+    The running sum and count (and optionally min and max) of the composite are
+    stored in a state directory next to the composite file (``<filename>.state``),
+    together with the modification time and size of every ingested input and a
+    copy of its contribution. Adding a new input therefore only requires reading
+    that input, and re-ingesting an input that has been replaced (e.g. refined
+    daily L3m) subtracts its previous contribution before adding the new one.
+    Only mean, min, max and count can be composed that way.
+
+    Changes are kept in memory until save() is called. The running statistics and
+    the inputs record are committed together in a single file, and contributions
+    are written under new names before that commit, so that a process interrupted
+    at any point leaves the previously saved state intact.
+
+    Args:
+        filename (str): Filename of the composite
+        extrema (bool): Also keep track of min and max. Defaults to False
+
+    Examples:
+        >>> import satmo
+        >>> compose_class = satmo.IncrementalComposer('combined/X2015001.L3m_8DAY_CHL_chlor_a_1km.tif')
+        >>> compose_class.add('combined/X2015003.L3m_DAY_CHL_chlor_a_1km.tif')
+        >>> compose_class.save()
+        >>> compose_class.to_file('mean')
+    """
+    def __init__(self, filename, extrema=False):
+        self.filename = filename
+        self.state_dir = '%s.state' % filename
+        self.extrema = extrema
+        self.inputs = {}
+        self.sum = None
+        self.count = None
+        self.min = None
+        self.max = None
+        # Contributions added since the last save, by input
+        self._staged = {}
+        state_file = os.path.join(self.state_dir, 'state.npz')
+        if os.path.isfile(state_file):
+            with np.load(state_file) as state:
+                self.inputs = json.loads(state['inputs'].item())
+                self.sum = state['sum']
+                self.count = state['count']
+                if extrema:
+                    if 'min' in state.files:
+                        self.min = state['min']
+                        self.max = state['max']
+                    else:
+                        # State was built without extrema
+                        self._update_extrema()
+
+    def _contribution(self, file):
+        """Contribution of an ingested input, staged or saved"""
+        if file in self._staged:
+            return self._staged[file]
+        return np.load(os.path.join(self.state_dir,
+                                    self.inputs[file]['contribution']))
+
+    def _update_extrema(self):
+        """Recompute min and max from the stored contributions"""
+        self.min = np.full(self.sum.shape, np.nan, dtype=np.float32)
+        self.max = np.full(self.sum.shape, np.nan, dtype=np.float32)
+        for file in self.inputs:
+            array = self._contribution(file)
+            np.fmin(self.min, array, out=self.min)
+            np.fmax(self.max, array, out=self.max)
+
+    def _subtract(self, file):
+        array = self._contribution(file)
+        valid = ~np.isnan(array)
+        self.sum[valid] -= array[valid]
+        self.count -= valid
+        del self.inputs[file]
+        self._staged.pop(file, None)
+
+    def add(self, file):
+        """Add an input to the composite, or update its contribution if it has changed
+
+        Args:
+            file (str): Single layer raster file (geoTiff or netcdf)
+
+        Returns:
+            bool: True if the state of the composite changed, False if the input was
+            already ingested in its current version
+        """
+        key = os.path.abspath(file)
+        stat = os.stat(file)
+        record = {'mtime': stat.st_mtime, 'size': stat.st_size}
+        replaced = key in self.inputs
+        if replaced:
+            if (self.inputs[key]['mtime'], self.inputs[key]['size']) == \
+               (record['mtime'], record['size']):
+                return False
+            self._subtract(key)
+        array = ma.filled(ma.asarray(_read_layer(file), dtype=np.float32), np.nan)
+        if self.sum is None:
+            self.sum = np.zeros(array.shape, dtype=np.float64)
+            self.count = np.zeros(array.shape, dtype=np.uint16)
+        valid = ~np.isnan(array)
+        self.sum[valid] += array[valid]
+        self.count += valid
+        self._staged[key] = array
+        record['compositing_meta'] = _read_compositing_meta(file)
+        self.inputs[key] = record
+        if self.extrema:
+            if replaced or self.min is None:
+                # min and max cannot be subtracted
+                self._update_extrema()
+            else:
+                np.fmin(self.min, array, out=self.min)
+                np.fmax(self.max, array, out=self.max)
+        return True
+
+    def remove(self, file):
+        """Remove the contribution of an input from the composite
+
+        Args:
+            file (str): Previously added input file
+
+        Returns:
+            bool: True if the input was part of the composite
+        """
+        key = os.path.abspath(file)
+        if key not in self.inputs:
+            return False
+        self._subtract(key)
+        if self.extrema:
+            self._update_extrema()
+        return True
+
+    def save(self):
+        """Write the running state of the composite to its state directory"""
+        if not os.path.exists(self.state_dir):
+            os.makedirs(self.state_dir)
+        # New contributions get new names, only referenced once the state file
+        # is replaced, so that the saved state stays consistent until then
+        for file, array in self._staged.items():
+            contribution = '%s.%s.npy' % (os.path.basename(file), randomword(8))
+            np.save(os.path.join(self.state_dir, contribution), array)
+            self.inputs[file]['contribution'] = contribution
+        state = {'sum': self.sum, 'count': self.count,
+                 'inputs': np.array(json.dumps(self.inputs))}
+        if self.extrema:
+            state.update(min=self.min, max=self.max)
+        state_file = os.path.join(self.state_dir, 'state.npz')
+        with atomic_output(state_file) as tmp_file:
+            with open(tmp_file, 'wb') as dst:
+                np.savez(dst, **state)
+        self._staged = {}
+        # Remove replaced contributions and leftovers of interrupted saves
+        referenced = set(v['contribution'] for v in self.inputs.values())
+        for x in os.listdir(self.state_dir):
+            if x.endswith('.npy') and x not in referenced:
+                os.remove(os.path.join(self.state_dir, x))
+
+    def composed_array(self, fun='mean'):
+        """Compute the composite from the running state
+
+        Args:
+            fun (str): One of 'mean', 'min', 'max' or 'count'
+
+        Returns:
+            np.ndarray: The composed array, with np.nan where no valid observations
+        """
+        if fun == 'count':
+            return self.count
+        if fun == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                array = (self.sum / self.count).astype(np.float32)
+            array[self.count == 0] = np.nan
+            return array
+        if fun in ['min', 'max']:
+            if not self.extrema:
+                raise ValueError('min and max require instantiating with extrema=True')
+            return getattr(self, fun)
+        raise ValueError('Incremental compositing only supports mean, min, max and count')
+
+    def to_file(self, fun='mean', filename=None):
+        """Write the composite to file, with the same COMPOSITING_META tags as FileComposer
+
+        The state of the inputs is recorded in the file (see satmo.dependencies) and
+        the file is registered in the archive catalog
+
+        Args:
+            fun (str): Compositing function (see composed_array)
+            filename (str): Output filename. Defaults to the filename of the composite
+
+        Returns:
+            str: The output filename
+        """
+        if not self.inputs:
+            raise ValueError('The composite does not contain any input')
+        if filename is None:
+            filename = self.filename
+        input_files = sorted(self.inputs)
+        meta = get_raster_meta(input_files[0])
+        array = self.composed_array(fun)
+        if fun == 'count':
+            meta.update(dtype=rasterio.uint16, nodata=None)
+        compositing_meta = {os.path.basename(k): v['compositing_meta'] for k, v in
+                            self.inputs.items() if v['compositing_meta']}
+        with atomic_output(filename) as tmp_file:
+            with rasterio.open(tmp_file, 'w', **meta) as dst:
+                dst.write(array.astype(meta['dtype']), 1)
+                dst.update_tags(ns='COMPOSITING_META',
+                                compositing_function=fun,
+                                input_files=[os.path.basename(x) for x in input_files],
+                                input_meta=compositing_meta)
+            write_inputs(tmp_file, input_files)
+        register(filename)
+        return filename
+
+
+def _flat_data(x, lines=slice(None)):
+    """Read a netCDF variable as a flattened numpy array
+
+    Values flagged by the variable _FillValue are kept (not masked), consistently
+    with the flag based masking applied later in the binning chain
+
+    Args:
+        x (netCDF4.Variable): The variable to read
+        lines (slice): Optional slice of lines (first dimension) to read. Defaults
+            to all lines
+
+    Returns:
+        np.array: Flattened numpy array
+    """
+    return ma.getdata(x[lines]).ravel()
+
+
+# Maximum total size (in bytes) of the swath to grid index maps kept in memory
+# by BasicBinMap, in every process. Least recently used maps are discarded first,
+# 0 disables the memory cache
+CELL_INDEX_CACHE_BYTES = 2**28
+_cell_index_cache = OrderedDict()
+
+def _grid_from_extent(south, north, west, east, resolution, proj4string):
+    """Define a regular output grid from a longlat extent
+
+    Args:
+        south (float): Southern border of output extent (in DD)
+        north (float): Northern border of output extent (in DD)
+        west (float): Western border of output extent (in DD)
+        east (float): Eastern border of output extent (in DD)
+        resolution (float): Output resolution (in the unit of the output coordinate reference system)
+        proj4string (str): Coordinate reference system of the output in proj4 format
+
+    Returns:
+        tuple: The pyproj.Proj object of the grid CRS, the affine transform of the
+        grid and its (height, width) shape
+    """
+    p = Proj(proj4string)
+    # Find output corner coordinates in bining grid CRS
+    # Note that this does not account for the extent deformation induced by the projection
+    top_left = p(west, north)
+    bottom_right = p(east, south)
+    # Define output array shape
+    destination_shape = ( int( abs(top_left[1] - bottom_right[1]) / float(resolution)), int( abs(top_left[0] - bottom_right[0]) / float(resolution)) )
+    # Define affine transform
+    aff = Affine(resolution, 0.0, top_left[0], 0.0, -resolution, top_left[1])
+    return p, aff, destination_shape
+
+
+def _cell_index(x, y, shape):
+    """Convert fractional array coordinates to flat cell indices of a regular grid
+
+    Pixels are assigned to cells the same way np.histogram2d does it with unit
+    bin edges (i.e. the last row/column is closed on its outer edge)
+
+    Args:
+        x (np.array): 1D array of fractional column coordinates
+        y (np.array): 1D array of fractional row coordinates
+        shape (tuple): (height, width) of the grid
+
+    Returns:
+        tuple: A 1D int array of flat cell indices of the pixels falling within
+        the grid, and a 1D boolean array (same length as x) indicating which pixels
+        fall within the grid
+    """
+    height, width = shape
+    valid = (x >= 0) & (x <= width) & (y >= 0) & (y <= height)
+    col = np.minimum(np.floor(x[valid]).astype(np.int64), width - 1)
+    row = np.minimum(np.floor(y[valid]).astype(np.int64), height - 1)
+    return row * width + col, valid
+
+
+class BinAccumulator(object):
+    """Per cell statistics of values binned to a regular grid
+
+    Sum, count and sum of squares (and optionally min and max) are accumulated
+    with np.bincount from flat cell indices, so that any number of batches of
+    pixels can be added before retrieving the statistics.
+    For inheritance or composition only, not exported to package __init__
+
+    Args:
+        shape (tuple): (height, width) of the output grid
+        extrema (bool): Also keep track of min and max per cell. Defaults to False
+
+    Attributes:
+        shape (tuple): Shape of the grid
+        sum (np.array): 1D float64 array of per cell sums
+        count (np.array): 1D int64 array of per cell counts
+        sum_sq (np.array): 1D float64 array of per cell sums of squares
+        min (np.array): 1D float64 array of per cell minimums (None if extrema is False)
+        max (np.array): 1D float64 array of per cell maximums (None if extrema is False)
+    """
+    def __init__(self, shape, extrema=False):
+        self.shape = tuple(shape)
+        size = self.shape[0] * self.shape[1]
+        self.sum = np.zeros(size, dtype=np.float64)
+        self.count = np.zeros(size, dtype=np.int64)
+        self.sum_sq = np.zeros(size, dtype=np.float64)
+        self.extrema = extrema
+        self.min = None
+        self.max = None
+        if extrema:
+            self.min = np.full(size, np.inf)
+            self.max = np.full(size, -np.inf)
+
+    def add(self, cell_ids, values):
+        """Add a batch of values to the grid
+
+        Args:
+            cell_ids (np.array): 1D int array of flat cell indices (see _cell_index)
+            values (np.array): 1D array of values, same length as cell_ids
+        """
+        size = self.sum.size
+        values = np.asarray(values, dtype=np.float64)
+        self.sum += np.bincount(cell_ids, weights=values, minlength=size)
+        self.sum_sq += np.bincount(cell_ids, weights=values * values, minlength=size)
+        self.count += np.bincount(cell_ids, minlength=size)
+        if self.extrema:
+            np.minimum.at(self.min, cell_ids, values)
+            np.maximum.at(self.max, cell_ids, values)
+
+    def merge(self, other):
+        """Add the statistics of another accumulator of the same grid
+
+        Used to reduce partial grids binned independently (e.g. in parallel)
+
+        Args:
+            other (BinAccumulator): Accumulator with the same shape (and extrema setting)
+        """
+        if other.shape != self.shape:
+            raise ValueError('Cannot merge accumulators of different shapes')
+        self.sum += other.sum
+        self.count += other.count
+        self.sum_sq += other.sum_sq
+        if self.extrema:
+            np.minimum(self.min, other.min, out=self.min)
+            np.maximum(self.max, other.max, out=self.max)
+
+    def get(self, stat='mean'):
+        """Retrieve a statistic as a 2D array
+
+        Args:
+            stat (str): One of 'mean', 'std', 'count', 'sum', 'min', 'max'
+
+        Returns:
+            np.array: A 2D float64 array, with np.nan in cells that did not receive
+            any value
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if stat == 'mean':
+                out = self.sum / self.count
+            elif stat == 'std':
+                mean = self.sum / self.count
+                # Guard against small negative values caused by rounding errors
+                out = np.sqrt(np.maximum(self.sum_sq / self.count - mean * mean, 0))
+            elif stat == 'count':
+                out = self.count.astype(np.float64)
+            elif stat == 'sum':
+                out = self.sum.copy()
+            elif stat in ['min', 'max']:
+                if not self.extrema:
+                    raise ValueError('min and max require instantiation with extrema=True')
+                out = getattr(self, stat).copy()
+            else:
+                raise ValueError('Unknown statistic %s' % stat)
+        out[self.count == 0] = np.nan
+        return out.reshape(self.shape)
+
+
+def _grid_output(accumulator, stat, aff, proj4string):
+    """Build the output array and geo_dict of a binned variable
+
+    Args:
+        accumulator (BinAccumulator): The accumulated binned values
+        stat (str): Statistic to retrieve (see BinAccumulator.get)
+        aff (affine.Affine): Affine transform of the grid
+        proj4string (str): Coordinate reference system of the grid in proj4 format
+
+    Returns:
+        tuple: The binned variable as a 2D masked array and the geo_dict used to write it
+    """
+    dst_array = accumulator.get(stat)
+    if stat not in ['std', 'count']:
+        # Replace zeros by a more appropriate no data value (-1 since we are
+        # writing to float and most values are between 0 and 1)
+        dst_array[dst_array == 0] = -1
+    dst_array = np.ma.masked_invalid(dst_array)
+    geo_dict = {'crs': CRS.from_string(proj4string),
+                'affine': aff,
+                'height': accumulator.shape[0],
+                'width': accumulator.shape[1],
+                'driver': u'GTiff',
+                'dtype': rasterio.float32,
+                'count': 1,
+                'compress':'lzw',
+                'nodata': -1}
+    return dst_array, geo_dict
+
+
+def _bin_swaths(file_list, products, grid, masks, qual_array=None, block_lines=None,
+                extrema=False):
+    """Bin L2 swaths one granule (or block of lines) at a time
+
+    Each block is read, masked and projected, its values are added to running per
+    cell statistics and discarded, so that memory use is driven by the size of the
+    output grid and not by the volume of input data.
+
+    Args:
+        file_list (list): List of L2 files
+        products (list): List of (band_list, fun) tuples, one per variable to bin.
+            fun is applied to the bands of band_list (see L3mProcess.calc), or is None
+            when band_list contains a single variable binned as is
+        grid (tuple): (south, north, west, east, resolution, proj4string) (see
+            BasicBinMap.bin_to_grid)
+        masks (list): List of (bit_mask, max_qual) tuples (see BasicBinMap.apply_mask)
+            combined to mask the data
+        qual_array (str): Optional name of the quality array
+        block_lines (int): Number of swath lines read at once. Defaults to None, in
+            which case granules are read entirely
+        extrema (bool): Keep track of min and max (see BinAccumulator)
+
+    Returns:
+        list: A list of BinAccumulator, one per element of products
+    """
+    p, aff, destination_shape = _grid_from_extent(*grid)
+    ffa = ~aff
+    accumulators = [BinAccumulator(destination_shape, extrema=extrema)
+                    for _ in products]
+    for file in file_list:
+        with nc.Dataset(file) as src:
+            nav = src.groups['navigation_data']
+            geo = src.groups['geophysical_data']
+            n_lines = nav.variables['longitude'].shape[0]
+            step = block_lines or n_lines
+            for start in range(0, n_lines, step):
+                lines = slice(start, start + step)
+                # Same dtypes as in the in memory mode of BasicBinMap
+                flag_array = _flat_data(geo.variables['l2_flags'], lines).astype(np.uint32)
+                if masks and qual_array is not None:
+                    qual = _flat_data(geo.variables[qual_array], lines).astype(np.int16)
+                mask_array = np.ones(flag_array.shape, dtype=np.bool_)
+                for bit_mask, max_qual in masks:
+                    mask_array &= np.bitwise_and(flag_array, np.array([bit_mask])) == 0
+                    if qual_array is not None:
+                        mask_array &= qual <= max_qual
+                lon = _flat_data(nav.variables['longitude'], lines)[mask_array]
+                lat = _flat_data(nav.variables['latitude'], lines)[mask_array]
+                if not lon.size:
+                    continue
+                lon_proj, lat_proj = p(lon, lat)
+                destination_ids = ffa * (lon_proj, lat_proj)
+                cell_ids, valid = _cell_index(destination_ids[0], destination_ids[1],
+                                              destination_shape)
+                for (band_list, fun), accumulator in zip(products, accumulators):
+                    bands = [_flat_data(geo.variables[x], lines).astype(np.float32)
+                             for x in band_list]
+                    if fun is None:
+                        values = bands[0]
+                    else:
+                        values = fun(*bands)
+                    accumulator.add(cell_ids, values[mask_array][valid])
+    return accumulators
+
+
 class BasicBinMap(object):
     """ Class to produce daily gridded data for a given date/variable from L2 files
 
@@ -192,16 +902,39 @@ class BasicBinMap(object):
             Used in a later filtering step by the apply_mask method. Mostly used for sst and nsst products.
             Defaults to None.
         var (str): Optional name of variable to bin. Use when binning a variable that is already present in the archive
+        cache_dir (str): Optional directory where the swath to grid index maps computed
+            by bin_to_grid are saved as .npy files, and re-used by later instances
+            binning the same files to the same grid. Index maps are also cached in
+            memory, up to CELL_INDEX_CACHE_BYTES.
+        stream (bool): Streaming mode. When True, nothing is read at instantiation;
+            masking, band math (L3mProcess.calc) and the variable to bin are recorded
+            and applied when binning, one granule (or block of lines) at a time, so
+            that peak memory scales with the output grid instead of the input volume.
+            Binned outputs are identical to the default (in memory) mode. set_variable
+            and the index map cache are not available in this mode. Defaults to False
+        block_lines (int): Number of swath lines read at once in streaming mode.
+            Defaults to None (whole granules)
+        n_workers (int): Number of processes used to bin granules in parallel. Each
+            process bins a subset of the granules to a partial grid and the partial grids
+            are reduced at the end. n_workers > 1 implies streaming mode. When the
+            class is used from a worker process (e.g. a TaskGraph task), granules are
+            binned serially. Defaults to 1
 
     Attributes:
         file_list (list): list of strings (the pathnames of individual L2 files)
-        lon_dd (np.array): 1D Np array containing longitude coordinates
-        lat_dd (np.array): 1D Np array containing latitude coordinates
-        flag_array (np.array): 1D np array containing flag values
+        swath_sizes (list): Number of pixels of each L2 file of file_list (None in streaming mode)
+        lon_dd (np.array): 1D float32 Np array containing longitude coordinates (lon_dd, lat_dd,
+            flag_array, qual_array and var_array are None in streaming mode)
+        lat_dd (np.array): 1D float32 Np array containing latitude coordinates
+        flag_array (np.array): 1D uint32 np array containing flag values
         qual_array (np.array): 1D np array containing pixel quality information (higher values
             mean lower quality)
-        var_array (np.array): 1D np array containing variable to bin
-        output_array (np.array): a 2D np array containing binned variable
+        var_array (np.array): 1D float32 np array containing variable to bin
+        valid_mask (np.array): 1D boolean np array of the pixels retained by apply_mask
+            (None if no mask has been applied)
+        output_array (np.array): a 2D np array containing binned variable (3D, one layer
+            per variable, after bin_many)
+        output_variables (list): Names of the variables of output_array layers (bin_many only)
         geo_dict (dict): A dictionary used to write the output_array using rasterio
 
     Examples:
@@ -221,32 +954,59 @@ class BasicBinMap(object):
         >>> # Write grid with binned data to a georeferenced file
         >>> bin_class.to_file('/home/ldutrieux/sandbox/satmo2_data/aqua/L3m/DAY/2016/001/A2016001.L3m_DAY_CHL_chlor_a_2km.tif')
     """
-    def __init__(self, file_list, qual_array = None, var = None):
+    def __init__(self, file_list, qual_array = None, var = None, cache_dir = None,
+                 stream = False, block_lines = None, n_workers = 1):
         self.file_list = file_list
-        self.lon_dd = np.array([])
-        self.lat_dd = np.array([])
-        self.flag_array = np.array([])
-        self.qual_array = np.array([])
+        self.cache_dir = cache_dir
+        self.n_workers = n_workers
+        # Parallel binning is done granule by granule, as in streaming mode
+        stream = stream or n_workers > 1
+        self.stream = stream
+        self.block_lines = block_lines
+        self.valid_mask = None
         self.var_array = None
         self.output_array = None
+        self.output_variables = None
         self.geo_dict = None
-        for file in self.file_list:
-            self.lon_dd = np.append(self.lon_dd, self._get_lon(file))
-            self.lat_dd = np.append(self.lat_dd, self._get_lat(file))
-            self.flag_array = np.append(self.flag_array, self._read_band(file, 'l2_flags'))
-            # Read using the same logic the qual_array if its name is given
-            if qual_array is not None:
-                self.qual_array = np.append(self.qual_array, self._read_band(file, qual_array))
-        self.flag_array = np.uint32(self.flag_array)
+        if stream:
+            # Only record what has to be read, see _bin_swaths
+            self.qual_name = qual_array
+            self.var_name = var
+            self.swath_sizes = None
+            self.lon_dd = self.lat_dd = self.flag_array = self.qual_array = None
+            self._masks = []
+            self._calc = None
+            return
+        # Read the dimensions of every swath first so that the arrays can be
+        # preallocated and filled, opening each file only once
+        self.swath_sizes = [self._get_swath_size(x) for x in self.file_list]
+        n_pixels = sum(self.swath_sizes)
+        self.lon_dd = np.empty(n_pixels, dtype=np.float32)
+        self.lat_dd = np.empty(n_pixels, dtype=np.float32)
+        self.flag_array = np.empty(n_pixels, dtype=np.uint32)
+        if qual_array is not None:
+            self.qual_array = np.empty(n_pixels, dtype=np.int16)
+        else:
+            self.qual_array = np.array([])
         if var is not None:
-            var_array = np.array([])
-            for file in file_list:
-                var_array = np.append(var_array, self._read_band(file, var))
-                self.var_array = var_array
+            self.var_array = np.empty(n_pixels, dtype=np.float32)
+        for file, sl in zip(self.file_list, self._swath_slices()):
+            with nc.Dataset(file) as src:
+                nav = src.groups['navigation_data']
+                geo = src.groups['geophysical_data']
+                self.lon_dd[sl] = _flat_data(nav.variables['longitude'])
+                self.lat_dd[sl] = _flat_data(nav.variables['latitude'])
+                self.flag_array[sl] = _flat_data(geo.variables['l2_flags'])
+                # Read using the same logic the qual_array if its name is given
+                if qual_array is not None:
+                    self.qual_array[sl] = _flat_data(geo.variables[qual_array])
+                if var is not None:
+                    self.var_array[sl] = _flat_data(geo.variables[var])
 
     @classmethod
     def from_sensor_date(cls, sensor_code, date, day, suite, data_root,
-                         qual_array = None, var = None):
+                         qual_array = None, var = None, cache_dir = None,
+                         stream = False, block_lines = None, n_workers = 1):
         """Alternative class buider that builds automatically the right file list
 
         Args:
@@ -259,14 +1019,43 @@ class BasicBinMap(object):
                 Used in a later filtering step by the apply_mask method. Mostly used for sst and nsst products.
                 Defaults to None.
             var (str): Optional name of variable to bin. Use when binning a variable that is already present in the archive
+            cache_dir (str): Optional directory of swath to grid index maps (see class doc)
+            stream (bool): Streaming mode (see class doc)
+            block_lines (int): Number of swath lines read at once in streaming mode
+            n_workers (int): Number of processes used for binning (see class doc)
         """
         file_list = file_finder(data_root, date, level = 'L2', suite = suite, sensor_code = sensor_code)
-        file_list = [x for x in file_list if is_day(x) == day]
+        file_list = list(itertools.compress(file_list, is_day(file_list) == day))
         if len(file_list) == 0:
             raise IOError('No L2 files found')
-        bin_class = cls(file_list, qual_array, var)
+        bin_class = cls(file_list, qual_array, var, cache_dir, stream, block_lines,
+                        n_workers)
         return bin_class
 
+    def _get_swath_size(self, file):
+        """Internal function to retrieve the number of pixels of a L2 swath
+
+        Only the file header is read
+
+        Args:
+            file (str): File name of the L2 swath
+
+        Return:
+            int: Number of pixels (lines x pixels per line) of the swath
+        """
+        with nc.Dataset(file) as src:
+            shape = src.groups['navigation_data'].variables['longitude'].shape
+        return int(np.prod(shape))
+
+    def _swath_slices(self):
+        """Internal generator of the slices occupied by each swath of self.file_list
+        in the flattened arrays
+        """
+        offset = 0
+        for size in self.swath_sizes:
+            yield slice(offset, offset + size)
+            offset += size
+
     def _read_band(self, file, var):
         """Internal function to read a band as a numpy array
 
@@ -278,8 +1067,9 @@ class BasicBinMap(object):
             Numpy.array: Flattened numpy array
         """
         with nc.Dataset(file) as src:
-            out = src.groups['geophysical_data'].variables[var][:].flatten()
+            out = _flat_data(src.groups['geophysical_data'].variables[var])
         return out
+
     def _read_band_all(self, var):
         """Utility to read a variable as a flattened numpy array from all files contained in self.file_list
 
@@ -288,11 +1078,11 @@ class BasicBinMap(object):
                 self.file_list
 
         Return:
-            np.array: A flattened numpy array
+            np.array: A flattened float32 numpy array
         """
-        out = np.array([])
-        for file in self.file_list:
-            out = np.append(out, self._read_band(file, var))
+        out = np.empty(sum(self.swath_sizes), dtype=np.float32)
+        for file, sl in zip(self.file_list, self._swath_slices()):
+            out[sl] = self._read_band(file, var)
         return out
 
     def _get_lon(self, file):
@@ -305,7 +1095,7 @@ class BasicBinMap(object):
             np.array: flattened numpy arrays representing long
         """
         with nc.Dataset(file) as src:
-            lon = src.groups['navigation_data'].variables['longitude'][:].flatten()
+            lon = _flat_data(src.groups['navigation_data'].variables['longitude'])
         return lon
 
     def _get_lat(self, file):
@@ -318,7 +1108,7 @@ class BasicBinMap(object):
             np.array: flattened numpy arrays representing lat
         """
         with nc.Dataset(file) as src:
-            lat = src.groups['navigation_data'].variables['latitude'][:].flatten()
+            lat = _flat_data(src.groups['navigation_data'].variables['latitude'])
         return lat
 
     def set_variable(self, x):
@@ -328,6 +1118,8 @@ class BasicBinMap(object):
             x (np.array): A flattened numpy array that should match with the self.lon_dd
                 self.lat_dd, self.flags_array
         """
+        if self.stream:
+            raise ValueError('set_variable is not available in streaming mode, use calc instead')
         if x.shape != self.lat_dd.shape:
             raise ValueError('Dimension missmatch')
         self.var_array = x
@@ -335,6 +1127,13 @@ class BasicBinMap(object):
     def apply_mask(self, bit_mask = 0x0669D73B, max_qual = 2):
         """Method to mask data using information from the flag array. And optionally the mask array (named qual_prod in l2bin documentation)
 
+        The mask is stored in the valid_mask attribute and applied to the variable
+        when binning; the coordinate and variable arrays are no longer subset in
+        place, so that the swath to grid index maps remain valid for any variable.
+        As a consequence, the variable can be set (or calc run) before or after
+        masking, and successive calls combine the masks (a pixel is retained only
+        if it passes all of them).
+
         Args:
             bit_mask (int): The mask to use for selecting active flags from the flag array
                 The array is coded bitwise so that the mask has to be built as a bit mask too.
@@ -434,20 +1233,86 @@ class BasicBinMap(object):
 
 
         """
-        if self.var_array is None:
-            raise ValueError('A variable needs to be set or selected before masking')
+        if self.stream:
+            self._masks.append((bit_mask, max_qual))
+            return
         # Create mask
         mask_array = np.bitwise_and(self.flag_array, np.array([bit_mask])) == 0
         # if qual_array exists, create another mask and combine it with mask_array (&)
         if self.qual_array.size:
             qual_mask = self.qual_array <= max_qual
             mask_array = mask_array & qual_mask
-        # Apply mask to various arrays
-        self.var_array = self.var_array[mask_array]
-        self.lon_dd = self.lon_dd[mask_array]
-        self.lat_dd = self.lat_dd[mask_array]
+        # The mask is only applied at binning time so that geolocation arrays
+        # and the swath to grid index maps remain valid for any variable
+        if self.valid_mask is not None:
+            mask_array = mask_array & self.valid_mask
+        self.valid_mask = mask_array
+
+    def _cell_index_key(self, *grid):
+        """Internal function building the key identifying a file list and grid pair
+
+        Args:
+            *grid: Grid definition (south, north, west, east, resolution, proj4string)
+
+        Returns:
+            str: A sha1 hex digest
+        """
+        file_info = []
+        for file in self.file_list:
+            st = os.stat(file)
+            file_info.append((os.path.abspath(file), st.st_size, st.st_mtime))
+        return hashlib.sha1(repr((file_info, grid)).encode('utf-8')).hexdigest()
+
+    def _get_cell_index(self, south, north, west, east, resolution, proj4string):
+        """Internal function to retrieve the swath to grid index map
 
-    def bin_to_grid(self, south, north, west, east, resolution, proj4string):
+        Projection of the geolocation arrays and inversion of the grid affine
+        transform are only performed when the map for the same files and grid is
+        neither in the memory cache nor in cache_dir
+
+        Args:
+            south, north, west, east, resolution, proj4string: See bin_to_grid
+
+        Returns:
+            tuple: A 1D int32 array of flat cell indices of the pixels falling within the
+            grid and a 1D boolean array (full swath length) of these pixels
+        """
+        grid = (south, north, west, east, resolution, proj4string)
+        key = self._cell_index_key(*grid)
+        if key in _cell_index_cache:
+            # Move to the most recently used end
+            _cell_index_cache[key] = _cell_index_cache.pop(key)
+            return _cell_index_cache[key]
+        if self.cache_dir is not None:
+            cell_file = os.path.join(self.cache_dir, '%s_cell_ids.npy' % key)
+            valid_file = os.path.join(self.cache_dir, '%s_valid.npy' % key)
+        if self.cache_dir is not None and os.path.isfile(cell_file) \
+                and os.path.isfile(valid_file):
+            cell_ids = np.load(cell_file)
+            valid = np.load(valid_file)
+        else:
+            p, aff, destination_shape = _grid_from_extent(*grid)
+            # Convert the lat and lon arrays to projected coordinates
+            lon_proj, lat_proj = p(self.lon_dd, self.lat_dd)
+            # Convert projected coordinates to destination array indices
+            destination_ids = ~aff * (lon_proj, lat_proj)
+            cell_ids, valid = _cell_index(destination_ids[0], destination_ids[1],
+                                          destination_shape)
+            cell_ids = cell_ids.astype(np.int32)
+            if self.cache_dir is not None:
+                if not os.path.exists(self.cache_dir):
+                    os.makedirs(self.cache_dir)
+                np.save(cell_file, cell_ids)
+                np.save(valid_file, valid)
+        _cell_index_cache[key] = (cell_ids, valid)
+        cache_bytes = sum(x.nbytes + y.nbytes for x, y in _cell_index_cache.values())
+        while cache_bytes > CELL_INDEX_CACHE_BYTES:
+            x, y = _cell_index_cache.popitem(last=False)[1]
+            cache_bytes -= x.nbytes + y.nbytes
+        return cell_ids, valid
+
+    def bin_to_grid(self, south, north, west, east, resolution, proj4string,
+                    stat='mean'):
         """Method for binning data to a defined grid
 
         A grid is defined by its extent (north, south, east, west), resolution, and
@@ -460,56 +1325,143 @@ class BasicBinMap(object):
             east (float): Eastern border of output extent (in DD)
             resolution (float): Output resolution (in the unit of the output coordinate reference system)
             proj4string (str): Coordinate reference system of the output in proj4 format
+            stat (str): Statistic computed for each output pixel. One of 'mean' (default),
+                'std', 'count', 'min' or 'max'
 
         """
-        p = Proj(proj4string)
+        if self.stream:
+            if self._calc is not None:
+                products = [self._calc]
+            elif self.var_name is not None:
+                products = [([self.var_name], None)]
+            else:
+                raise ValueError('A variable needs to be set or selected before binning')
+            grid = (south, north, west, east, resolution, proj4string)
+            self.output_array, self.geo_dict = self._bin_stream(products, grid, stat)[0]
+            self.output_variables = None
+            return
+        if self.var_array is None:
+            raise ValueError('A variable needs to be set or selected before binning')
+        self.output_array, self.geo_dict = self._bin_array(self.var_array, south, north,
+                                                           west, east, resolution,
+                                                           proj4string, stat)
+        self.output_variables = None
+
+    def bin_many(self, var_list, south, north, west, east, resolution, proj4string,
+                 stat='mean'):
+        """Method for binning several variables of the L2 files to the same grid
+
+        Geolocation, flags and the swath to grid index map are shared by all variables,
+        only each variable itself is read (once) from the L2 files. The binned variables
+        are stacked in a 3D output_array (one layer per variable, in the order of
+        var_list), that can be written as a multi-band file with to_file or as one
+        file per variable with to_files. The mask set with apply_mask applies to all
+        variables.
 
-        # Find output corner coordinates in bining grid CRS
-        # Note that this does not account for the extent deformation induced by the projection
-        top_left = p(west, north)
-        bottom_right = p(east, south)
+        Args:
+            var_list (list): List of variables present in the L2 files (e.g.:
+                ['Rrs_412', 'Rrs_443', 'chlor_a'])
+            south, north, west, east, resolution, proj4string, stat: See bin_to_grid
+
+        Examples:
+            >>> import satmo
+
+            >>> bin_class = satmo.L3mProcess.from_sensor_date('A', date = '2016-01-01', day = True, suite = 'OC',
+                                                               data_root = '/home/ldutrieux/sandbox/satmo2_data')
+            >>> bin_class.apply_mask()
+            >>> bin_class.bin_many(['chlor_a', 'Kd_490'], south = 3, north = 33, west = -122, east = -72,
+                                   resolution = 2000, proj4string = "+proj=laea +lat_0=20 +lon_0=-100")
+            >>> bin_class.to_files(['A2016001.L3m_DAY_CHL_chlor_a_2km.tif',
+                                    'A2016001.L3m_DAY_KD490_Kd_490_2km.tif'])
+        """
+        if not var_list:
+            raise ValueError('var_list is empty')
+        if self.stream:
+            # All variables are binned during the same pass over the granules
+            grid = (south, north, west, east, resolution, proj4string)
+            outputs = self._bin_stream([([x], None) for x in var_list], grid, stat)
+            layers = [x[0] for x in outputs]
+            geo_dict = outputs[0][1]
+        else:
+            layers = []
+            for var in var_list:
+                var_array = self._read_band_all(var)
+                layer, geo_dict = self._bin_array(var_array, south, north, west, east,
+                                                  resolution, proj4string, stat)
+                layers.append(layer)
+                # Release the swath data before reading the next variable
+                del var_array
+        self.output_array = ma.array(layers)
+        geo_dict.update(count=len(var_list))
+        self.geo_dict = geo_dict
+        self.output_variables = list(var_list)
 
-        # Define output array shape
-        destination_shape = ( int( abs(top_left[1] - bottom_right[1]) / float(resolution)), int( abs(top_left[0] - bottom_right[0]) / float(resolution)) )
-        # Define affine transform and the inverse transform
-        aff = Affine(resolution, 0.0, top_left[0], 0.0, -resolution, top_left[1])
-        ffa = ~aff
+    def _bin_stream(self, products, grid, stat='mean'):
+        """Internal function binning variables in streaming mode
 
-        # Convert the lat and lon arrays to projected coordinates
-        lon_proj, lat_proj = p(self.lon_dd, self.lat_dd)
+        Args:
+            products (list): List of (band_list, fun) tuples (see _bin_swaths)
+            grid (tuple): (south, north, west, east, resolution, proj4string)
+            stat (str): See bin_to_grid
 
-        # Convert projected coordinates to destination array indices
-        destination_ids = ffa * (lon_proj, lat_proj)
+        Returns:
+            list: A list of (2D masked array, geo_dict) tuples, one per product
+        """
+        _, aff, _ = _grid_from_extent(*grid)
+        bin_swaths = functools.partial(_bin_swaths, products=products, grid=grid,
+                                       masks=self._masks, qual_array=self.qual_name,
+                                       block_lines=self.block_lines,
+                                       extrema=stat in ['min', 'max'])
+        n_workers = min(self.n_workers, len(self.file_list))
+        if n_workers > 1 and not in_worker():
+            # One subset of granules per process, so that a single partial grid
+            # per process has to be sent back
+            chunks = [self.file_list[i::n_workers] for i in range(n_workers)]
+            # Partial grids are merged as they come back
+            accumulators = None
+            for partial in parallel_map(bin_swaths, chunks, n_workers):
+                if accumulators is None:
+                    accumulators = partial
+                    continue
+                for accumulator, other in zip(accumulators, partial):
+                    accumulator.merge(other)
+        else:
+            accumulators = bin_swaths(self.file_list)
+        return [_grid_output(x, stat, aff, grid[5]) for x in accumulators]
 
-        # Perform 2d data binning (to average all input coordinates falling withing the same outut pixel)
-        # 1 Sum up within each bin
-        dst_array, _, _ = np.histogram2d(destination_ids[1], destination_ids[0], bins=(range(0, destination_shape[0] + 1, 1), range(0, destination_shape[1] + 1, 1)), weights=self.var_array, normed=False)
-        # Retrieve count per bin
-        counts, _, _ = np.histogram2d(destination_ids[1], destination_ids[0], bins=(range(0, destination_shape[0] + 1, 1), range(0, destination_shape[1] + 1, 1)))
-        # Compute average value per bin
-        dst_array = dst_array / counts
-        # Replace zeros by a more appropriate no data value (-1 since we are
-        # writing to float and most values are between 0 and 1)
-        dst_array[dst_array == 0] = -1
-        dst_array = np.ma.masked_invalid(dst_array)
-        # Write array to slot
-        self.output_array = dst_array
-        # Build geodict and write it to a slot of the object
-        geo_dict = {'crs': CRS.from_string(proj4string),
-                    'affine': aff,
-                    'height': destination_shape[0],
-                    'width': destination_shape[1],
-                    'driver': u'GTiff',
-                    'dtype': rasterio.float32,
-                    'count': 1,
-                    'compress':'lzw',
-                    'nodata': -1}
+    def _bin_array(self, var_array, south, north, west, east, resolution,
+                   proj4string, stat='mean'):
+        """Internal function binning a flattened variable array to a grid
 
-        self.geo_dict = geo_dict
+        Args:
+            var_array (np.array): A flattened array matching self.lon_dd and self.lat_dd
+            south, north, west, east, resolution, proj4string, stat: See bin_to_grid
+
+        Returns:
+            tuple: The binned variable as a 2D masked array and the geo_dict used to write it
+        """
+        _, aff, destination_shape = _grid_from_extent(south, north, west, east,
+                                                      resolution, proj4string)
+        # Flat index of the output cell of every pixel falling within the grid
+        cell_ids, valid = self._get_cell_index(south, north, west, east,
+                                               resolution, proj4string)
+        values = var_array[valid]
+        if self.valid_mask is not None:
+            pixel_mask = self.valid_mask[valid]
+            cell_ids = cell_ids[pixel_mask]
+            values = values[pixel_mask]
+        # Accumulate all statistics per cell (sum, count, ...) from the cell index
+        accumulator = BinAccumulator(destination_shape,
+                                     extrema=stat in ['min', 'max'])
+        accumulator.add(cell_ids, values)
+        return _grid_output(accumulator, stat, aff, proj4string)
 
     def to_file(self, filename):
         """Writes a binned grid to a georeferenced tif file
 
+        When several variables were binned with bin_many, a multi-band file is
+        written, and the name of each variable is stored in a band tag (variable)
+
         Args:
             filename (str): Name of a tif file to write the frid to
 
@@ -519,7 +1471,33 @@ class BasicBinMap(object):
                              and/or the geo_dict, You probably have to run the \
                              bin_to_grid method')
         with rasterio.open(filename, 'w', **self.geo_dict) as dst:
-            dst.write_band(1, self.output_array.astype(rasterio.float32))
+            if self.output_array.ndim == 3:
+                dst.write(self.output_array.astype(rasterio.float32))
+                for bidx, var in enumerate(self.output_variables, start=1):
+                    dst.update_tags(bidx, variable=var)
+            else:
+                dst.write_band(1, self.output_array.astype(rasterio.float32))
+
+    def to_files(self, filename_list):
+        """Writes each variable binned with bin_many to its own georeferenced tif file
+
+        Args:
+            filename_list (list): List of tif filenames, one per variable and in the
+                order of the var_list passed to bin_many
+
+        Returns:
+            list: The list of written files
+        """
+        if self.output_array is None or self.output_array.ndim != 3:
+            raise ValueError('The class does not contain several binned variables, \
+                             You probably have to run the bin_many method')
+        if len(filename_list) != self.output_array.shape[0]:
+            raise ValueError('filename_list and binned variables lengths differ')
+        geo_dict = dict(self.geo_dict, count=1)
+        for layer, filename in zip(self.output_array, filename_list):
+            with rasterio.open(filename, 'w', **geo_dict) as dst:
+                dst.write_band(1, layer.astype(rasterio.float32))
+        return filename_list
 
     def to_scidb(self):
         pass
@@ -556,8 +1534,10 @@ class L3mProcess(BasicBinMap):
         >>> # Write grid with binned data to a geo-referenced file
         >>> bin_class.to_file('/home/ldutrieux/sandbox/satmo2_data/aqua/L3m/DAY/2016/001/A2016001.L3m_DAY_CHL_chlor_a_2km.tif')
     """
-    def __init__(self, file_list, qual_array = None, var = None):
-        super(L3mProcess, self).__init__(file_list, qual_array, var)
+    def __init__(self, file_list, qual_array = None, var = None, cache_dir = None,
+                 stream = False, block_lines = None, n_workers = 1):
+        super(L3mProcess, self).__init__(file_list, qual_array, var, cache_dir,
+                                         stream, block_lines, n_workers)
 
     def calc(self, band_list, fun):
         """Generic band math method
@@ -571,8 +1551,14 @@ class L3mProcess(BasicBinMap):
             fun (function): A function that takes len(band_list) arguments (all
                 them must be numpy array of the same dimension) performs some
                 element wise calculation on them and returns a single numpy array
-                with the same dimension than each input array.
+                with the same dimension than each input array. When binning in
+                parallel (n_workers > 1), fun must be picklable (e.g. a module level
+                function or a numpy ufunc, not a lambda).
         """
+        if self.stream:
+            # Band math is applied to each block of data while binning
+            self._calc = (band_list, fun)
+            return
         # Read the bands from band_list with a list comprehension
         array_list = [self._read_band_all(x) for x in band_list]
         # Pass the list of numpy arrays as *args to fun
@@ -598,7 +1584,9 @@ def l2bin(file_list, L3b_suite, var_list = None, resolution = 1, night = False,
             filename is automatically generated.
         data_root (str): Root of the data archive. Mandatory if filename is not provided
             ignored otherwise
-        overwrite (bool): Overwrite file if already exists? Defaults to False
+        overwrite (bool or str): Overwrite file if already exists? Defaults to False.
+            'auto' only rebuilds an existing file when its input L2 files changed
+            (see satmo.dependencies)
         flags (list): A list of flags to mask invalid data (e.g. ['CLDICE', 'LAND', 'HIGLINT'])
             If None (default), a default list of flag for the L3 suite is fetched from
             the global variable FLAGS
@@ -625,7 +1613,7 @@ def l2bin(file_list, L3b_suite, var_list = None, resolution = 1, night = False,
                                        filename = file_list[0], composite='DAY')
     if flags is None:
         flags = FLAGS[L3b_suite]
-    if not (os.path.isfile(filename) and not overwrite):
+    if needs_build(filename, file_list, overwrite):
         L3b_dir = os.path.dirname(filename)
         # Create directory if not already exists
         if not os.path.exists(L3b_dir):
@@ -640,23 +1628,26 @@ def l2bin(file_list, L3b_suite, var_list = None, resolution = 1, night = False,
         if var_list is None:
             var_list = STANDARD_L3_SUITES[L3b_suite][input_meta['sensor']]
         # BUild l3b command
-        l2bin_arg_list = ['l2bin',
-                          'l3bprod=%s' % ','.join(var_list),
-                          'infile=%s' % file_list_file,
-                          'resolve=' + str(resolution),
-                          'ofile=%s' % filename,
-                          'flaguse=%s' % ','.join(flags),
-                          'night=%d' % int(night),
-                          'prodtype=regional']
-        qual_array = QUAL_ARRAY_NAME_FROM_SUITE[L3b_suite]
-        if qual_array is not None:
-            l2bin_arg_list.append('qual_prod=%s' % qual_array)
-        # Execute command
-        with open(os.devnull, 'w') as FNULL:
-            # Run cli
-            status = subprocess.call(l2bin_arg_list, stdout=FNULL, stderr=subprocess.STDOUT)
-        if status == 1:
-            raise SeadasError('l2bin exited with status 1')
+        with atomic_output(filename) as tmp_file:
+            l2bin_arg_list = ['l2bin',
+                              'l3bprod=%s' % ','.join(var_list),
+                              'infile=%s' % file_list_file,
+                              'resolve=' + str(resolution),
+                              'ofile=%s' % tmp_file,
+                              'flaguse=%s' % ','.join(flags),
+                              'night=%d' % int(night),
+                              'prodtype=regional']
+            qual_array = QUAL_ARRAY_NAME_FROM_SUITE[L3b_suite]
+            if qual_array is not None:
+                l2bin_arg_list.append('qual_prod=%s' % qual_array)
+            # Execute command
+            with open(os.devnull, 'w') as FNULL:
+                # Run cli
+                status = subprocess.call(l2bin_arg_list, stdout=FNULL, stderr=subprocess.STDOUT)
+            if status == 1:
+                raise SeadasError('l2bin exited with status 1')
+            write_inputs(tmp_file, file_list)
+        register(filename)
     return filename
 
 def l3mapgen(x, variable, south, north, west, east, filename = None,
@@ -680,7 +1671,9 @@ def l3mapgen(x, variable, south, north, west, east, filename = None,
             ignored otherwise
         composite (str): Compositing period (DAY, 8DAY, MON). Used for building output filename
             Defaults to DAY
-        overwrite (bool): Overwrite file if already exists? Defaults to False
+        overwrite (bool or str): Overwrite file if already exists? Defaults to False.
+            'auto' only rebuilds an existing file when the input L3b file changed
+            (see satmo.dependencies)
 
     Returns:
         str: The output filename
@@ -698,7 +1691,7 @@ def l3mapgen(x, variable, south, north, west, east, filename = None,
         filename = filename_builder(level = 'L3m', full_path = True,
                                     data_root = data_root, filename = x, composite = composite,
                                     variable = variable, resolution = to_km(resolution))
-    if not (os.path.isfile(filename) and not overwrite):
+    if needs_build(filename, [x], overwrite):
         # Handle projection options
         if proj is None:
             proj = 'smi'
@@ -707,32 +1700,68 @@ def l3mapgen(x, variable, south, north, west, east, filename = None,
         if not os.path.exists(L3m_dir):
             os.makedirs(L3m_dir)
         # filename, composite, variable, resolution, (nc)
-        l3map_arg_list = ['l3mapgen',
-                          'ifile=%s' % x,
-                          'ofile=%s' % filename,
-                          'resolution=%s' % resolution,
-                          'south=%.1f' % south,
-                          'north=%.1f' % north,
-                          'west=%.1f' % west,
-                          'east=%.1f' % east,
-                          'product=%s' % variable,
-                          'interp=area',
-                          'apply_pal=0', # Otherwise color map is applied which implies generating a byte image only
-                          'oformat=tiff',
-                          'projection="%s"' % proj]
-        with open(os.devnull, 'w') as FNULL:
-            # Run cli
-            status = subprocess.call(l3map_arg_list, stdout=FNULL, stderr=subprocess.STDOUT)
-        if status == 1:
-            raise SeadasError('l3mapgen exited with status 1 for input file %s' % x)
-        # Update dataset nodata value using rasterio
-        with rasterio.open(filename, 'r+') as src:
-            src.nodata = -32767
+        with atomic_output(filename) as tmp_file:
+            l3map_arg_list = ['l3mapgen',
+                              'ifile=%s' % x,
+                              'ofile=%s' % tmp_file,
+                              'resolution=%s' % resolution,
+                              'south=%.1f' % south,
+                              'north=%.1f' % north,
+                              'west=%.1f' % west,
+                              'east=%.1f' % east,
+                              'product=%s' % variable,
+                              'interp=area',
+                              'apply_pal=0', # Otherwise color map is applied which implies generating a byte image only
+                              'oformat=tiff',
+                              'projection="%s"' % proj]
+            with open(os.devnull, 'w') as FNULL:
+                # Run cli
+                status = subprocess.call(l3map_arg_list, stdout=FNULL, stderr=subprocess.STDOUT)
+            if status == 1:
+                raise SeadasError('l3mapgen exited with status 1 for input file %s' % x)
+            # Update dataset nodata value using rasterio
+            with rasterio.open(tmp_file, 'r+') as src:
+                src.nodata = -32767
+            write_inputs(tmp_file, [x])
+        register(filename)
     return filename
 
+def compose_to_files(file_list, fun_list, filename_list, overwrite=False,
+                     preview=True, windowed=False):
+    """Compose files with several compositing functions from a single read of the inputs
+
+    Args:
+        file_list (list): List of input raster files
+        fun_list (list): List of compositing functions (see FileComposer)
+        filename_list (list): Output filenames, one per compositing function
+        overwrite (bool or str): Should existing output files be overwritten. Functions
+            whose output already exists are otherwise not computed. 'auto' only
+            recomputes the outputs whose inputs changed (see satmo.dependencies)
+        preview (bool): Should png previews be automatically generated
+        windowed (bool): Compute the composites window by window (see FileComposer)
+
+    Returns:
+        list: The list of output filenames
+    """
+    todo = [(fun, filename) for fun, filename in zip(fun_list, filename_list)
+            if needs_build(filename, file_list, overwrite)]
+    if todo:
+        compose_class = FileComposer(*file_list, windowed=windowed)
+        compose_class.compose_many([x[0] for x in todo])
+        for _, filename in todo:
+            # Create directory if not already exists
+            out_dir = os.path.dirname(filename)
+            if not os.path.exists(out_dir):
+                os.makedirs(out_dir)
+        compose_class.to_files([x[1] for x in todo])
+        if preview:
+            for _, filename in todo:
+                make_preview(filename)
+    return list(filename_list)
+
 def make_time_composite(date_list, var, suite, resolution, composite,
                         data_root, sensor_code='X', fun='mean', filename=None,
-                        overwrite=False, preview=True):
+                        overwrite=False, preview=True, windowed=False):
     """Make a time composite (L3m) from daily L3m data
 
     Args:
@@ -745,14 +1774,22 @@ def make_time_composite(date_list, var, suite, resolution, composite,
         data_root (str): Root of the data archive
         sensor_code (str): Sensor to composite (defaults to 'X', which
             corresponds to daily (cross sensors) composites.
-        fun (str): compositing function, defaults to mean
-        filename (str): Optional output filename. Auto generated if not provided
-        overwrite (bool): Should output file be overwritten if it already
-            exists.
+        fun (str or list): compositing function, defaults to mean. When a list of
+            functions is provided (e.g. ['mean', 'median', 'count']), all the
+            statistics are computed from a single read of the inputs and each is
+            written to its own file, with the function name appended to the variable
+            (e.g. X2016001.L3m_16DAY_CHL_chlor_a_count_2km.tif)
+        filename (str or list): Optional output filename (a list of filenames, one
+            per function, when fun is a list). Auto generated if not provided
+        overwrite (bool or str): Should output file be overwritten if it already
+            exists. 'auto' only rebuilds an existing composite when its inputs
+            changed (see satmo.dependencies)
         preview (bool): Should a png preview be automatically generated
+        windowed (bool): Compute the composite window by window to bound memory
+            usage (see ``FileComposer``). Defaults to False
 
     Returns:
-        str: The filename of the produced file.
+        str: The filename of the produced file (list of filenames when fun is a list).
         In case no file is produced (because no input files were found, the function exits without return value.
         When automatically generated the date of the composite corresponds to the first day of the composite.
 
@@ -766,6 +1803,10 @@ def make_time_composite(date_list, var, suite, resolution, composite,
                                       '16DAY',
                                       '/home/ldutrieux/sandbox/satmo2_data',
                                       overwrite=True)
+        >>> satmo.make_time_composite(date_list, 'chlor_a', 'CHL', '2km',
+                                      '16DAY',
+                                      '/home/ldutrieux/sandbox/satmo2_data',
+                                      fun=['mean', 'std', 'count'])
     """
     # Search for the list of files
     file_list = []
@@ -778,11 +1819,17 @@ def make_time_composite(date_list, var, suite, resolution, composite,
     # Exit if list of files is empty
     if not file_list:
         return
-    # COmpose files
-    compose_class = FileComposer(*file_list)
-    # Run the compositing method using string provided in fun= argument
-    func = getattr(compose_class, fun)
-    func()
+    if isinstance(fun, (list, tuple)):
+        if filename is None:
+            filename = [filename_builder(level='L3m', full_path=True,
+                                         data_root=data_root, date=min(date_list),
+                                         sensor_code=sensor_code,
+                                         suite=suite,
+                                         composite=composite,
+                                         variable='%s_%s' % (var, x),
+                                         resolution=resolution) for x in fun]
+        return compose_to_files(file_list, fun, filename, overwrite=overwrite,
+                                preview=preview, windowed=windowed)
     # Generate filename if not provided
     if filename is None:
         filename = filename_builder(level='L3m', full_path=True,
@@ -791,8 +1838,12 @@ def make_time_composite(date_list, var, suite, resolution, composite,
                                        suite=suite,
                                        composite=composite, variable=var,
                                        resolution=resolution)
-    # Write to file (if overwrite conditions are met)
-    if not (os.path.isfile(filename) and not overwrite):
+    # Compose and write to file (if overwrite conditions are met)
+    if needs_build(filename, file_list, overwrite):
+        compose_class = FileComposer(*file_list, windowed=windowed)
+        # Run the compositing method using string provided in fun= argument
+        func = getattr(compose_class, fun)
+        func()
         # Create directory if not already exists
         out_dir = os.path.dirname(filename)
         if not os.path.exists(out_dir):
@@ -804,6 +1855,84 @@ def make_time_composite(date_list, var, suite, resolution, composite,
 
 
 
+def update_time_composite(date, var, suite, resolution, composite, data_root,
+                          sensor_code='X', fun='mean', filename=None, preview=True):
+    """Incrementally update the time composite (L3m) to which a date belongs
+
+    Incremental counterpart of make_time_composite, based on IncrementalComposer.
+    All the daily L3m files of the compositing period of ``date`` are synced
+    with the running state of the composite; files already ingested and unchanged
+    since are not read again, new files are added and replaced files have their
+    previous contribution subtracted. The composite is only rewritten when its
+    state changed.
+
+    Args:
+        date (datetime.datetime): Date of a newly produced (or updated) daily L3m file
+        var (str): L3m variable to composite
+        suite (str): L3m suite
+        resolution (str): Resolution of data to compose (e.g.: '2km')
+        composite (str): Type/name of the composite, one of the keys of
+            COMPOSITE_DELTAS ('8DAY', '16DAY' or 'MO')
+        data_root (str): Root of the data archive
+        sensor_code (str): Sensor to composite (defaults to 'X', which
+            corresponds to daily (cross sensors) composites.
+        fun (str): compositing function, one of 'mean' (default), 'min' or 'max'
+        filename (str): Optional output filename. Auto generated if not provided
+        preview (bool): Should a png preview be automatically generated
+
+    Returns:
+        str: The filename of the composite. In case no input file exists for the
+        compositing period, the function exits without return value.
+
+    Examples:
+        >>> import datetime
+        >>> import satmo
+
+        >>> satmo.update_time_composite(datetime.datetime(2016, 01, 05), 'chlor_a',
+                                        'CHL', '2km', '8DAY',
+                                        '/home/ldutrieux/sandbox/satmo2_data')
+    """
+    if fun not in ['mean', 'min', 'max']:
+        raise ValueError('Incremental compositing only supports mean, min and max')
+    date_list = find_composite_date_list(date, COMPOSITE_DELTAS[composite])
+    file_list = []
+    for dt in date_list:
+        file_query = file_finder(data_root=data_root, date=dt, level='L3m', suite=suite,
+                                 sensor_code=sensor_code, resolution=resolution,
+                                 variable=var, composite='DAY')
+        if file_query:
+            file_list.append(file_query[0])
+    if not file_list:
+        return
+    # Generate filename if not provided
+    if filename is None:
+        filename = filename_builder(level='L3m', full_path=True,
+                                    data_root=data_root, date=min(date_list),
+                                    sensor_code=sensor_code,
+                                    suite=suite,
+                                    composite=composite, variable=var,
+                                    resolution=resolution)
+    compose_class = IncrementalComposer(filename, extrema=fun in ['min', 'max'])
+    # Sync the state with the inputs currently present in the archive
+    updated = [compose_class.add(x) for x in file_list]
+    input_files = set(os.path.abspath(x) for x in file_list)
+    removed = [compose_class.remove(x) for x in list(compose_class.inputs)
+               if x not in input_files]
+    # Also rewrite when the existing composite was made with another function
+    current_fun = _read_compositing_meta(filename).get('compositing_function') \
+            if os.path.isfile(filename) else None
+    if any(updated) or any(removed) or current_fun != fun:
+        compose_class.save()
+        # Create directory if not already exists
+        out_dir = os.path.dirname(filename)
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        compose_class.to_file(fun)
+        if preview:
+            make_preview(filename)
+    return filename
+
+
 def l2_append(x, bands, formula, short_name, long_name, standard_name,
               valid_min, valid_max):
     """Compute a new array and append it to an existing OBPG L2 file
@@ -855,8 +1984,9 @@ def l2mapgen(x, north, south, west, east, prod, flags, data_root, filename=None,
         width (int): Width in pixels of the output image
         outmode (str): See seadas l2mapgen doc
         threshold (float): Minimum percentage of the filled pixels
-        overwrite (bool): Overwrite existing files? Return ValueError if file exists
-            and overwrite is set to False (default)
+        overwrite (bool or str): Overwrite existing files? Return ValueError if file exists
+            and overwrite is set to False (default). With 'auto', an existing file
+            is only rebuilt when the input L2 file changed (see satmo.dependencies)
 
     Examples:
         >>> import satmo
@@ -879,7 +2009,9 @@ def l2mapgen(x, north, south, west, east, prod, flags, data_root, filename=None,
             dn = 'night'
         filename = filename_builder(level='L2m', filename=x, suite=L3_SUITE_FROM_VAR[dn][prod],
                                        variable=prod, full_path=True, data_root=data_root)
-    if os.path.isfile(filename) and not overwrite:
+    if not needs_build(filename, [x], overwrite):
+        if overwrite == 'auto':
+            return filename
         raise ValueError('Error while running l2mapgen on %s; file exists and overwrite set to False' % filename)
 
     # Create output dir in case it does not exist
@@ -887,35 +2019,37 @@ def l2mapgen(x, north, south, west, east, prod, flags, data_root, filename=None,
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
-    # Prepare inputs
-    cli_args = ['l2mapgen',
-                'ifile=%s' % x,
-                'ofile=%s' % filename,
-                'prod=%s' % prod,
-                'flaguse=%s' % ','.join(flags),
-                'south=%f' % south,
-                'north=%f' % north,
-                'west=%f' % west,
-                'east=%f' % east,
-                'mask=true',
-                'width=%d' % width,
-                'apply_pal=0',
-                'threshold=%f' % threshold,
-                'outmode=%s' % outmode]
-
-    # l2mapgen is very verbose, therefore redirect output to devnull
-    with open(os.devnull, 'w') as FNULL:
-        # Run cli
-        status = subprocess.call(cli_args, stdout=FNULL, stderr=subprocess.STDOUT)
-        # l2mapgen ifile=A2015077191500.L2_LAC_AFAI.nc ofile=A2015077191500.L2m_afai.tif prod=afai south=3 north=33 west=-122 east=-72 flaguse=LAND,HIGLINT,CLDICE mask=true width=5000 outmode=tiff
-
-    # Check status (return error in case )
-    if status != 0:
-        raise SeadasError('l2mapgen exited with status %d during L2 mapping' % status)
-
-    # Update dataset nodata value using rasterio
-    with rasterio.open(filename, 'r+') as src:
-        src.nodata = -32767
+    with atomic_output(filename) as tmp_file:
+        # Prepare inputs
+        cli_args = ['l2mapgen',
+                    'ifile=%s' % x,
+                    'ofile=%s' % tmp_file,
+                    'prod=%s' % prod,
+                    'flaguse=%s' % ','.join(flags),
+                    'south=%f' % south,
+                    'north=%f' % north,
+                    'west=%f' % west,
+                    'east=%f' % east,
+                    'mask=true',
+                    'width=%d' % width,
+                    'apply_pal=0',
+                    'threshold=%f' % threshold,
+                    'outmode=%s' % outmode]
+
+        # l2mapgen is very verbose, therefore redirect output to devnull
+        with open(os.devnull, 'w') as FNULL:
+            # Run cli
+            status = subprocess.call(cli_args, stdout=FNULL, stderr=subprocess.STDOUT)
+            # l2mapgen ifile=A2015077191500.L2_LAC_AFAI.nc ofile=A2015077191500.L2m_afai.tif prod=afai south=3 north=33 west=-122 east=-72 flaguse=LAND,HIGLINT,CLDICE mask=true width=5000 outmode=tiff
+
+        # Check status (return error in case )
+        if status != 0:
+            raise SeadasError('l2mapgen exited with status %d during L2 mapping' % status)
+
+        # Update dataset nodata value using rasterio
+        with rasterio.open(tmp_file, 'r+') as src:
+            src.nodata = -32767
+        write_inputs(tmp_file, [x])
 
     return filename
 
@@ -931,14 +2065,16 @@ def l3bin(file_list, north, south, west, east, filename, overwrite=False):
         west (float): Western border of output extent (in DD)
         east (float): Eastern border of output extent (in DD)
         filename (str): Optional output filename
-        overwrite (bool): Overwrite existing files?
+        overwrite (bool or str): Overwrite existing files? With 'auto', an existing
+            file is only rebuilt when its input L3b files changed (see
+            satmo.dependencies)
 
     Return:
         str: The output filename. Mostly used for its side effects of generating
             a L3b temporal composite file.
     """
     output_meta = filename_parser(filename)
-    if not (os.path.isfile(filename) and not overwrite):
+    if needs_build(filename, file_list, overwrite):
         L3b_dir = os.path.dirname(filename)
         # Create directory if not already exists
         if not os.path.exists(L3b_dir):
@@ -950,19 +2086,21 @@ def l3bin(file_list, north, south, west, east, filename, overwrite=False):
         with open(file_list_file, 'w') as dst:
             for item in file_list:
                 dst.write(item + '\n')
-        cli_args = ['l3bin',
-                    'in=%s' % file_list_file,
-                    'loneast=%f' % east,
-                    'lonwest=%f' % west,
-                    'latnorth=%f' % north,
-                    'latsouth=%f' % south,
-                    'out=%s' % filename]
-        with open(os.devnull, 'w') as FNULL:
-            # Run cli
-            status = subprocess.call(cli_args, stdout=FNULL, stderr=subprocess.STDOUT)
-        if status != 0:
-            raise SeadasError('l3bin exited with status %d during temporal binning' % status)
-    else:
+        with atomic_output(filename) as tmp_file:
+            cli_args = ['l3bin',
+                        'in=%s' % file_list_file,
+                        'loneast=%f' % east,
+                        'lonwest=%f' % west,
+                        'latnorth=%f' % north,
+                        'latsouth=%f' % south,
+                        'out=%s' % tmp_file]
+            with open(os.devnull, 'w') as FNULL:
+                # Run cli
+                status = subprocess.call(cli_args, stdout=FNULL, stderr=subprocess.STDOUT)
+            if status != 0:
+                raise SeadasError('l3bin exited with status %d during temporal binning' % status)
+            write_inputs(tmp_file, file_list)
+    elif overwrite != 'auto':
         raise ValueError('File exists, set overwrite to True for overwriting file')
     return filename
 
@@ -1,10 +1,10 @@
 import requests
-from requests.packages.urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
 import re
 from datetime import datetime
 import os.path
 
+from . import session
+
 def query_from_extent(sensors, date_begin, per, north, south, west, east, day = True,
                       night = True, product = 'L1A', base_url = 'https://oceancolor.gsfc.nasa.gov/cgi/browse.pl'):
     """Query L1A data for a given period and spatial extent
@@ -34,10 +34,6 @@ def query_from_extent(sensors, date_begin, per, north, south, west, east, day =
          list: List of filenames
 
     """
-    # Instantiate a requests session and set number of retries and pause between them
-    s = requests.Session()
-    retries = Retry(total = 15, backoff_factor = 0.1, status_forcelist = [500, 502, 503, 504])
-    s.mount('https://', HTTPAdapter(max_retries = retries))
     # Collect elements to build the first request url
     if type(sensors) is not list:
         raise TypeError('sensors must be a list')
@@ -75,7 +71,8 @@ def query_from_extent(sensors, date_begin, per, north, south, west, east, day =
                    'e': east}
     # This first query will return an html page from which the order id can be retrieved
     # and used to send a second request
-    r0 = s.get(base_url, params=query0_args)
+    # Requests use the shared session (retries and timeouts, see satmo.session)
+    r0 = session.get(base_url, params=query0_args)
     if r0.status_code != 200:
         raise requests.HTTPError
     # regular expression to find the orderid in the html page
@@ -84,7 +81,7 @@ def query_from_extent(sensors, date_begin, per, north, south, west, east, day =
     query1_args = {'sub': 'filenamelist',
                    'id': m.group(1),
                    'prm': prm}
-    r1 = s.get(base_url, params=query1_args)
+    r1 = session.get(base_url, params=query1_args)
     if r1.status_code != 200:
         raise requests.HTTPError
     file_list = r1.text.split('\n')
@@ -128,7 +125,35 @@ def get_subscription_urls(id):
     args_dict = {'subID': id,
                  'addurl': 1,
                  'results_as_file': 1}
-    r = requests.get("https://oceandata.sci.gsfc.nasa.gov/search/file_search.cgi",
+    r = session.get("https://oceandata.sci.gsfc.nasa.gov/search/file_search.cgi",
                     params=args_dict)
     url_list = r.text.split('\n')[:-1]
     return url_list
+
+def get_subscription_checksums(id):
+    """Retrieve the checksum manifest of a subscription
+
+    The manifest published by the oceancolor DAAC holds the sha1 checksum of
+    every file of the subscription. A single request retrieves the checksums of
+    all files, so that they can be compared in bulk to those of the local archive
+    (see satmo.integrity)
+
+    Args:
+        id (int): Ocean color subscription number
+
+    Returns:
+        dict: sha1 checksums by filename
+    """
+    args_dict = {'subID': id,
+                 'cksum': 1,
+                 'results_as_file': 1}
+    r = session.get("https://oceandata.sci.gsfc.nasa.gov/search/file_search.cgi",
+                    params=args_dict)
+    r.raise_for_status()
+    manifest = {}
+    for line in r.text.split('\n'):
+        fields = line.split()
+        # Skip blank lines and messages (e.g. 'No Results Found')
+        if len(fields) == 2 and len(fields[0]) == 40:
+            manifest[str(fields[1])] = str(fields[0])
+    return manifest
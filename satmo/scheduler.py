@@ -0,0 +1,317 @@
+"""Execution of processing tasks organized as a dependency graph
+
+Each task (download of a granule, l2gen, l2bin, l3mapgen, compositing, ...) is
+a node of a TaskGraph with declared dependencies. Tasks run in worker processes
+as soon as their dependencies completed, so that independent sensors, suites and
+dates do not wait on each other. Every task uses a resource (e.g. 'cpu' for
+SeaDAS processing, 'io' for downloads), and the number of tasks running
+simultaneously is limited per resource.
+
+Worker processes are kept in module level pools (see get_pool) that are reused
+by the batchers and by successive graph runs, rather than started for every
+call. They are shut down when the interpreter exits, or explicitly with
+shutdown_pools.
+"""
+import os
+import atexit
+import Queue
+import itertools
+import multiprocessing as mp
+from collections import OrderedDict, defaultdict, namedtuple
+from pprint import pprint
+
+from .journal import Journal
+from .dependencies import file_checksum
+
+
+DEFAULT_LIMITS = {'cpu': 1, 'io': 1}
+
+Task = namedtuple('Task', ['fun', 'args', 'kwargs', 'deps', 'resource'])
+
+# Shared pools by (name, n_workers), with the id of the process that created them
+_pools = {}
+
+
+def get_pool(n_workers, name='default'):
+    """Return a shared pool of worker processes, started on first use
+
+    Workers are forked when the pool is created, so module level settings (e.g.
+    set_catalog) must be made before the first parallel call to be seen by them.
+
+    Args:
+        n_workers (int): Number of worker processes
+        name (str): Name of the pool. Pools of different names never share
+            workers, which allows independent limits (e.g. per resource of a
+            TaskGraph)
+
+    Returns:
+        multiprocessing.Pool: The pool
+    """
+    key = (name, n_workers)
+    pool, pid = _pools.get(key, (None, None))
+    # Pools inherited from a parent process cannot be used
+    if pool is None or pid != os.getpid():
+        pool = mp.Pool(n_workers)
+        _pools[key] = (pool, os.getpid())
+    return pool
+
+
+def shutdown_pools(terminate=False, names=None):
+    """Shut down the shared pools
+
+    Called automatically when the interpreter exits
+
+    Args:
+        terminate (bool): Stop the workers immediately, abandoning the pending
+            tasks. Defaults to False (wait for the pending tasks to complete)
+        names (list): Names of the pools to shut down (see get_pool). Defaults to
+            None, in which case all the pools are shut down
+    """
+    for key, (pool, pid) in _pools.items():
+        if names is not None and key[0] not in names:
+            continue
+        if pid == os.getpid():
+            if terminate:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+        del _pools[key]
+
+atexit.register(shutdown_pools)
+
+
+def in_worker():
+    """Whether the current process is a pool worker
+
+    Pool workers are daemonic processes, which are not allowed to have children
+
+    Returns:
+        bool: True when called from a worker process
+    """
+    return mp.current_process().daemon
+
+
+def parallel_map(fun, iterable, n_workers=1, chunksize=1):
+    """Apply a function to every element of an iterable, in parallel
+
+    Results are yielded as they complete, in no particular order. The shared
+    pool of n_workers processes is used (see get_pool); with a single worker, fun
+    runs in the current process. So it does when called from a worker process
+    (e.g. a task of a TaskGraph), since these cannot start processes of their own.
+
+    Args:
+        fun (function): Function to apply. Must be picklable (defined at the top
+            level of a module, or a functools.partial of such a function)
+        iterable (iterable): Arguments of fun
+        n_workers (int): Number of worker processes. Defaults to 1
+        chunksize (int): Number of elements sent to a worker at once. Larger
+            chunks reduce the communication overhead of short tasks
+
+    Returns:
+        generator: The return values of fun
+
+    Examples:
+        >>> import satmo
+        >>> import functools
+
+        >>> fun = functools.partial(satmo.bin_map_wrapper, **kwargs)
+        >>> for _ in satmo.parallel_map(fun, date_list, n_workers=8):
+        ...     pass
+    """
+    if n_workers <= 1 or in_worker():
+        for x in iterable:
+            yield fun(x)
+        return
+    # Chunks are built here rather than by imap_unordered, whose chunked results
+    # cannot be waited on with a timeout
+    iterable = iter(iterable)
+    chunks = iter(lambda: (fun, list(itertools.islice(iterable, chunksize))), (fun, []))
+    results = get_pool(n_workers).imap_unordered(_map_chunk, chunks)
+    while True:
+        try:
+            # A timeout is required for KeyboardInterrupt to work
+            chunk = results.next(9999999)
+        except StopIteration:
+            return
+        except KeyboardInterrupt:
+            shutdown_pools(terminate=True, names=['default'])
+            raise
+        for result in chunk:
+            yield result
+
+
+def _map_chunk(chunk):
+    """Apply a function to a chunk of arguments in a worker"""
+    fun, args = chunk
+    return [fun(x) for x in args]
+
+
+def _call(fun, args, kwargs, checksum=False):
+    """Run a task in a worker; exceptions are returned rather than raised
+
+    With checksum, the sha1 of the output file returned by the task is computed
+    too, by the worker rather than by the scheduling loop
+    """
+    try:
+        value = fun(*args, **kwargs)
+        sha1 = None
+        if checksum and isinstance(value, basestring) and os.path.isfile(value):
+            sha1 = file_checksum(value)
+        return True, value, sha1
+    except Exception as e:
+        return False, '%s: %s' % (type(e).__name__, e), None
+
+
+class TaskGraph(object):
+    """Directed acyclic graph of processing tasks
+
+    Tasks can only depend on tasks added before them, which guarantees that the
+    graph has no cycle. When a task fails, the tasks depending on it (directly or
+    not) are skipped; other tasks are not affected.
+
+    Attributes:
+        tasks (OrderedDict): Tasks of the graph, by name
+        status (dict): Status of every task after run ('done', 'failed' or 'skipped')
+        results (dict): Return values of the tasks that completed
+        errors (dict): Error messages of the tasks that failed
+
+    Examples:
+        >>> import satmo
+
+        >>> graph = satmo.TaskGraph()
+        >>> graph.add('A2016001.L3b_DAY_CHL.nc', satmo.l2bin, kwargs={...})
+        >>> graph.add('A2016001.L3m_DAY_CHL_chlor_a_1km.tif', satmo.l3mapgen,
+                      kwargs={...}, deps=['A2016001.L3b_DAY_CHL.nc'])
+        >>> graph.run(limits={'cpu': 8, 'io': 4})
+    """
+    def __init__(self):
+        self.tasks = OrderedDict()
+        self.status = {}
+        self.results = {}
+        self.errors = {}
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __contains__(self, name):
+        return name in self.tasks
+
+    def add(self, name, fun, args=(), kwargs=None, deps=(), resource='cpu'):
+        """Add a task to the graph
+
+        Args:
+            name (str): Unique name of the task (e.g. the name of the file it produces)
+            fun (function): Function to run. Must be picklable (defined at the top
+                level of a module)
+            args (tuple): Positional arguments of fun
+            kwargs (dict): Keyword arguments of fun
+            deps (list): Names of the tasks that must complete before this one
+            resource (str): Resource used by the task (e.g. 'cpu', 'io')
+
+        Returns:
+            str: The name of the task
+        """
+        if name in self.tasks:
+            raise ValueError('Task %s already exists' % name)
+        unknown = [x for x in deps if x not in self.tasks]
+        if unknown:
+            raise ValueError('Unknown dependencies for task %s: %s' % (name, ', '.join(unknown)))
+        self.tasks[name] = Task(fun, tuple(args), kwargs or {},
+                                tuple(OrderedDict.fromkeys(deps)), resource)
+        return name
+
+    def _skip(self, name, dependents):
+        for dependent in dependents[name]:
+            if self.status[dependent] == 'pending':
+                self.status[dependent] = 'skipped'
+                self._skip(dependent, dependents)
+
+    def run(self, limits=None, journal=None, resume=False, verify=False):
+        """Run the tasks of the graph
+
+        Args:
+            limits (dict): Maximum number of simultaneously running tasks, per
+                resource (e.g. {'cpu': 8, 'io': 4}). Resources that are not
+                specified default to DEFAULT_LIMITS, or 1
+            journal (Journal or str): Journal (or filename of the journal) in which
+                the tasks returning the filename of an existing file are recorded
+                (see satmo.journal)
+            resume (bool): Do not run the tasks recorded in the journal whose
+                output did not change since; they are considered done, with their
+                output as result. Defaults to False
+            verify (bool): Record the checksum of the outputs in the journal, and
+                when resuming, also compare the checksum of the recorded outputs
+                (see Journal.completed). Defaults to False
+
+        Returns:
+            dict: The status of every task
+        """
+        limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        if journal is not None and not isinstance(journal, Journal):
+            journal = Journal(journal)
+            own_journal = True
+        else:
+            own_journal = False
+        dependents = defaultdict(list)
+        n_deps = {}
+        for name, task in self.tasks.items():
+            n_deps[name] = len(task.deps)
+            for dep in task.deps:
+                dependents[dep].append(name)
+        self.status = dict.fromkeys(self.tasks, 'pending')
+        ready = [name for name in self.tasks if n_deps[name] == 0]
+        done = Queue.Queue()
+        running = 0
+        used_pools = set()
+
+        def _done(name, value):
+            self.status[name] = 'done'
+            self.results[name] = value
+            for dependent in dependents[name]:
+                n_deps[dependent] -= 1
+                if n_deps[dependent] == 0:
+                    ready.append(dependent)
+
+        try:
+            while ready or running:
+                while ready:
+                    name = ready.pop(0)
+                    if resume and journal is not None:
+                        output = journal.completed(name, verify=verify)
+                        if output is not None:
+                            _done(name, output)
+                            continue
+                    task = self.tasks[name]
+                    pool = get_pool(limits.get(task.resource, 1), name=task.resource)
+                    used_pools.add(task.resource)
+                    pool.apply_async(
+                        _call, (task.fun, task.args, task.kwargs,
+                                journal is not None and verify),
+                        callback=lambda result, name=name: done.put((name, result)))
+                    self.status[name] = 'running'
+                    running += 1
+                if not running:
+                    break
+                # A timeout is required for KeyboardInterrupt to work
+                name, (success, value, sha1) = done.get(True, 9999999)
+                running -= 1
+                if success:
+                    if journal is not None and isinstance(value, basestring) and \
+                            os.path.isfile(value):
+                        journal.record(name, value, sha1=sha1)
+                    _done(name, value)
+                else:
+                    self.status[name] = 'failed'
+                    self.errors[name] = value
+                    pprint('Task %s failed. %s' % (name, value))
+                    self._skip(name, dependents)
+        except BaseException:
+            # Abandon the tasks still running; pools of other resources may be in
+            # use elsewhere in the process and are left untouched
+            shutdown_pools(terminate=True, names=used_pools)
+            raise
+        finally:
+            if own_journal:
+                journal.close()
+        return self.status
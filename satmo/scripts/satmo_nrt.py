@@ -12,7 +12,7 @@ Details: The script does a bit of parsing and calls several time the nrt_wrapper
 
 import argparse
 from satmo import (nrt_wrapper, time_limit, TimeoutException,
-                   refined_processing_wrapper_l1, nrt_wrapper_l1)
+                   refined_processing_wrapper_l1, nrt_wrapper_l1, set_catalog)
 import schedule
 import time
 from pprint import pprint
@@ -24,7 +24,10 @@ import os
 
 def main(day_vars, night_vars, l1a_vars, refined, eight_day, month, data_root,
          binning_resolution, mapping_resolution, north, south, west, east,
-         flags, proj, delay, n_threads):
+         flags, proj, delay, n_threads, incremental, catalog):
+    # Before any parallel call, for the workers to inherit it
+    if catalog is not None:
+        set_catalog(catalog)
 
     pprint(os.environ['OCSSWROOT'] + '\n')
 
@@ -34,7 +37,8 @@ def main(day_vars, night_vars, l1a_vars, refined, eight_day, month, data_root,
                 nrt_wrapper(day_or_night='day', pp_type='nrt', var_list=day_vars, north=north,
                             south=south, west=west, east=east, binning_resolution=binning_resolution,
                             mapping_resolution=mapping_resolution, data_root=data_root,
-                            eight_day=eight_day, month=month, flags=flags, proj=proj)
+                            eight_day=eight_day, month=month, flags=flags, proj=proj,
+                            incremental=incremental)
         except TimeoutException:
             pprint('A process timed out for not completing after 2hr!')
 
@@ -44,7 +48,8 @@ def main(day_vars, night_vars, l1a_vars, refined, eight_day, month, data_root,
                 nrt_wrapper(day_or_night='day', pp_type='refined', var_list=day_vars, north=north,
                             south=south, west=west, east=east, binning_resolution=binning_resolution,
                             mapping_resolution=mapping_resolution, data_root=data_root,
-                            eight_day=eight_day, month=month, flags=flags, proj=proj)
+                            eight_day=eight_day, month=month, flags=flags, proj=proj,
+                            incremental=incremental)
         except TimeoutException:
             pprint('A processed timed out for not completing after 2hr!')
 
@@ -54,7 +59,8 @@ def main(day_vars, night_vars, l1a_vars, refined, eight_day, month, data_root,
                 nrt_wrapper(day_or_night='night', pp_type='nrt', var_list=night_vars, north=north,
                             south=south, west=west, east=east, binning_resolution=binning_resolution,
                             mapping_resolution=mapping_resolution, data_root=data_root,
-                            eight_day=eight_day, month=month, flags=flags, proj=proj)
+                            eight_day=eight_day, month=month, flags=flags, proj=proj,
+                            incremental=incremental)
         except TimeoutException:
             pprint('A processed timed out for not completing after 2hr!')
 
@@ -64,7 +70,8 @@ def main(day_vars, night_vars, l1a_vars, refined, eight_day, month, data_root,
                 nrt_wrapper(day_or_night='night', pp_type='refined', var_list=night_vars, north=north,
                             south=south, west=west, east=east, binning_resolution=binning_resolution,
                             mapping_resolution=mapping_resolution, data_root=data_root,
-                            eight_day=eight_day, month=month, flags=flags, proj=proj)
+                            eight_day=eight_day, month=month, flags=flags, proj=proj,
+                            incremental=incremental)
         except TimeoutException:
             pprint('A processed timed out for not completing after 2hr!')
 
@@ -153,6 +160,9 @@ satmo_nrt.py --day_vars chlor_a nflh sst Kd_490 --night_vars sst --l1a_vars afai
     parser.add_argument('--no-month', dest='month', action='store_false',
                         help='Disable processing of monthly temporal composites')
 
+    parser.add_argument('--incremental', action='store_true',
+                        help='Update temporal composites incrementally from the daily L3m of each sensor instead of recomputing them from L3b')
+
     parser.add_argument("-d", "--data_root",
                         required=True,
                         type = str,
@@ -217,6 +227,12 @@ satmo_nrt.py --day_vars chlor_a nflh sst Kd_490 --night_vars sst --l1a_vars afai
                         help = 'Number of threads to use for parallel implementation')
     parser.set_defaults(n_threads=1)
 
+    parser.add_argument('-catalog', '--catalog',
+                        required=False,
+                        help=('Optional archive catalog (SQLite, see update_catalog.py) used to'
+                              ' look up files instead of listing the archive directories'))
+    parser.set_defaults(catalog=None)
+
     parsed_args = parser.parse_args()
 
     main(**vars(parsed_args))
@@ -12,7 +12,10 @@ import argparse
 import satmo
 
 def main(aqua, terra, viirs, seawifs, begin, end, data_root, n_threads, var,
-         suite):
+         suite, catalog):
+    # Before any parallel call, for the workers to inherit it
+    if catalog is not None:
+        satmo.set_catalog(catalog)
     if not any([aqua, terra, viirs, seawifs]):
         raise ValueError('You need to set at least one of the sensors flag')
     sensor_codes = []
@@ -85,6 +88,12 @@ timerange_L2_append.py --aqua --terra --viirs -b 2014-01-01 -e 2014-12-31
                         required=True,
                         help="Name of the L2 suite containing the input bands, and to with the new variable will be appended")
 
+    parser.add_argument('-catalog', '--catalog',
+                        required=False,
+                        help=('Optional archive catalog (SQLite, see update_catalog.py) used to'
+                              ' look up files instead of listing the archive directories'))
+    parser.set_defaults(catalog=None)
+
     parsed_args = parser.parse_args()
 
     main(**vars(parsed_args))
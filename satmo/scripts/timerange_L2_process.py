@@ -11,7 +11,10 @@ import argparse
 import satmo
 
 def main(aqua, terra, viirs, seawifs, begin, end, data_root, night,
-         n_threads, var_list, suite, get_anc):
+         n_threads, var_list, suite, get_anc, catalog):
+    # Before any parallel call, for the workers to inherit it
+    if catalog is not None:
+        satmo.set_catalog(catalog)
     if not any([aqua, terra, viirs, seawifs]):
         raise ValueError('You need to set at least one of the sensors flag')
     sensor_codes = []
@@ -91,6 +94,12 @@ if __name__ == '__main__':
                         help='Use climatologies instead of ancillary data for atmospheric correction.')
     parser.set_defaults(get_anc=True)
 
+    parser.add_argument('-catalog', '--catalog',
+                        required=False,
+                        help=('Optional archive catalog (SQLite, see update_catalog.py) used to'
+                              ' look up files instead of listing the archive directories'))
+    parser.set_defaults(catalog=None)
+
     parsed_args = parser.parse_args()
 
     main(**vars(parsed_args))
@@ -12,9 +12,16 @@ import satmo
 
 def main(aqua, terra, viirs, seawifs, begin, end, var, north, south,
          west, east, data_root, night, flags, n_threads, overwrite,
-         width, outmode, threshold):
+         width, outmode, threshold, journal, resume, verify, catalog):
+    # Before any parallel call, for the workers to inherit it
+    if catalog is not None:
+        satmo.set_catalog(catalog)
     if not any([aqua, terra, viirs, seawifs]):
         raise ValueError('You need to set at least one of the sensors flag')
+    if resume and journal is None:
+        raise ValueError('--resume requires a journal (-journal)')
+    if verify and journal is None:
+        raise ValueError('--verify requires a journal (-journal)')
     sensor_codes = []
     if aqua:
         sensor_codes.append('A')
@@ -29,7 +36,9 @@ def main(aqua, terra, viirs, seawifs, begin, end, var, north, south,
                            var=var, n_threads=n_threads, south=south, north=north,
                            west=west, east=east, data_root=data_root,
                            night=night, flags=flags, width=width,
-                           outmode=outmode, threshold=threshold, overwrite=overwrite)
+                           outmode=outmode, threshold=threshold, overwrite=overwrite,
+                           journal=journal, resume=resume,
+                           verify=verify)
 
 if __name__ == '__main__':
     epilog = ("""
@@ -133,6 +142,27 @@ if __name__ == '__main__':
                         type=float,
                         help='Minimum percentage of filled pixels for the file to be generated, defaults to 0')
     parser.set_defaults(threshold=0)
+
+    parser.add_argument('-journal', '--journal',
+                        required=False,
+                        help=('Optional journal file (SQLite) recording the completed files,'
+                              ' to allow resuming an interrupted run with --resume'))
+    parser.set_defaults(journal=None)
+
+    parser.add_argument('--resume', action='store_true',
+                        help=('Skip the files recorded as completed in the journal, when they'
+                              ' did not change since'))
+
+    parser.add_argument('--verify', action='store_true',
+                        help=('Record the checksum of the completed files in the journal and,'
+                              ' with --resume, also compare it to skip a file'))
+
+    parser.add_argument('-catalog', '--catalog',
+                        required=False,
+                        help=('Optional archive catalog (SQLite, see update_catalog.py) used to'
+                              ' look up files instead of listing the archive directories'))
+    parser.set_defaults(catalog=None)
+
     parsed_args = parser.parse_args()
 
     main(**vars(parsed_args))
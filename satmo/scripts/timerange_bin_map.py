@@ -12,9 +12,16 @@ import satmo
 
 def main(aqua, terra, viirs, seawifs, begin, end, north, south, west, east,
          data_root, binning_resolution, mapping_resolution, proj, flags,
-         day_vars, night_vars, overwrite, n_threads):
+         day_vars, night_vars, overwrite, n_threads, journal, resume, verify, catalog):
+    # Before any parallel call, for the workers to inherit it
+    if catalog is not None:
+        satmo.set_catalog(catalog)
     if not any([aqua, terra, viirs, seawifs]):
         raise ValueError('You need to set at least one of the sensors flag')
+    if resume and journal is None:
+        raise ValueError('--resume requires a journal (-journal)')
+    if verify and journal is None:
+        raise ValueError('--verify requires a journal (-journal)')
     sensor_codes = []
     if aqua:
         sensor_codes.append('A')
@@ -30,7 +37,8 @@ def main(aqua, terra, viirs, seawifs, begin, end, north, south, west, east,
                           data_root=data_root, binning_resolution=binning_resolution,
                           mapping_resolution=mapping_resolution, day_vars=day_vars,
                           night_vars=night_vars, flags=flags, proj=proj, overwrite=overwrite,
-                          n_threads=n_threads)
+                          n_threads=n_threads, journal=journal, resume=resume,
+                          verify=verify)
 
 if __name__ == '__main__':
     epilog = """
@@ -47,6 +55,12 @@ Examples usage
 timerange_bin_map.py --aqua --terra --viirs -b 2000-01-01 -e 2017-12-31 -south 3 -north 33 -west -122 -east -72 \
 -d /export/isilon/datos2/satmo2_data -bin_res 1 -map_res 1000 -day_vars chlor_a chl_ocx sst \
 -night_vars sst -multi 6
+
+# Same processing, recording completed files in a journal; after an interruption, add --resume
+# to the same command to skip the files already produced
+timerange_bin_map.py --aqua --terra --viirs -b 2000-01-01 -e 2017-12-31 -south 3 -north 33 -west -122 -east -72 \
+-d /export/isilon/datos2/satmo2_data -day_vars chlor_a sst -night_vars sst -multi 6 \
+-journal ~/bin_map_2000_2017.sqlite
     """
 
     parser = argparse.ArgumentParser(epilog=epilog, formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -130,15 +144,40 @@ timerange_bin_map.py --aqua --terra --viirs -b 2000-01-01 -e 2017-12-31 -south 3
                                 ' for each L3 suite independently from the satmo global variable FLAGS'))
     parser.set_defaults(flags=None)
 
+    parser.add_argument('--overwrite', action='store_const', const=True, dest='overwrite',
+                        help = ('Overwrite all existing files. By default, existing files are only'
+                                ' rebuilt when their inputs changed'))
+
     parser.add_argument('--no-overwrite', action='store_false', dest='overwrite',
-                       help = 'Disable defaults overwritting of existing files')
-    parser.set_defaults(overwrite=True)
+                       help = 'Never overwrite existing files')
+    parser.set_defaults(overwrite='auto')
 
     parser.add_argument('-multi', '--n_threads',
                         type = int,
                         required = False,
                         help = 'Number of threads to use for parallel implementation')
     parser.set_defaults(n_threads=1)
+
+    parser.add_argument('-journal', '--journal',
+                        required=False,
+                        help=('Optional journal file (SQLite) recording the completed files,'
+                              ' to allow resuming an interrupted run with --resume'))
+    parser.set_defaults(journal=None)
+
+    parser.add_argument('--resume', action='store_true',
+                        help=('Skip the files recorded as completed in the journal, when they'
+                              ' did not change since'))
+
+    parser.add_argument('--verify', action='store_true',
+                        help=('Record the checksum of the completed files in the journal and,'
+                              ' with --resume, also compare it to skip a file'))
+
+    parser.add_argument('-catalog', '--catalog',
+                        required=False,
+                        help=('Optional archive catalog (SQLite, see update_catalog.py) used to'
+                              ' look up files instead of listing the archive directories'))
+    parser.set_defaults(catalog=None)
+
     parsed_args = parser.parse_args()
 
     main(**vars(parsed_args))
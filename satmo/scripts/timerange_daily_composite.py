@@ -12,7 +12,10 @@ import argparse
 import satmo
 
 def main(aqua, terra, viirs, seawifs, begin, end, var, suite, data_root, resolution,
-         fun, preview, overwrite, n_threads):
+         fun, preview, overwrite, n_threads, catalog):
+    # Before any parallel call, for the workers to inherit it
+    if catalog is not None:
+        satmo.set_catalog(catalog)
     # Handle the sensor_codes argument of timerange_daily_composites
     if any([aqua, terra, viirs, seawifs]):
         sensor_codes = []
@@ -26,6 +29,9 @@ def main(aqua, terra, viirs, seawifs, begin, end, var, suite, data_root, resolut
             sensor_codes.append('V')
     else:
         sensor_codes = 'all'
+    # Several functions are composed from a single read and written to their own files
+    if len(fun) == 1:
+        fun = fun[0]
 
     satmo.timerange_daily_composite(begin=begin, end=end, variable=var,
                                     suite=suite, data_root=data_root,
@@ -81,8 +87,11 @@ if __name__ == '__main__':
 
     parser.add_argument("-f", "--fun",
                         required=False,
-                        help="Compositing function (can be mean (default), median, max, min")
-    parser.set_defaults(fun='mean')
+                        nargs='+',
+                        help=("Compositing function (can be mean (default), median, max, min, std, count)."
+                              " When several functions are provided, each statistic is written to its own"
+                              " file, with the function name appended to the variable name"))
+    parser.set_defaults(fun=['mean'])
 
     parser.add_argument('--overwrite', action='store_true',
                         help = 'overwrite existing files?')
@@ -96,6 +105,12 @@ if __name__ == '__main__':
                         help = 'Number of threads to use for parallel implementation')
     parser.set_defaults(n_threads=1)
 
+    parser.add_argument('-catalog', '--catalog',
+                        required=False,
+                        help=('Optional archive catalog (SQLite, see update_catalog.py) used to'
+                              ' look up files instead of listing the archive directories'))
+    parser.set_defaults(catalog=None)
+
     parsed_args = parser.parse_args()
 
     main(**vars(parsed_args))
@@ -14,7 +14,11 @@ import satmo
 
 
 def main(aqua, terra, seawifs, viirs, begin, end,\
-         north, south, east, west, day, night, product, write_dir, overwrite, check_integrity):
+         north, south, east, west, day, night, product, write_dir, overwrite, check_integrity,\
+         n_workers, catalog):
+    # Before any parallel call, for the workers to inherit it
+    if catalog is not None:
+        satmo.set_catalog(catalog)
     sensors = []
     if aqua:
         sensors.append('am')
@@ -27,7 +31,8 @@ def main(aqua, terra, seawifs, viirs, begin, end,\
 
     satmo.timerange_download(sensors = sensors, begin = begin, end = end, write_dir = write_dir,\
                 north = north, south = south, west = west, east = east, day = day, night = night,\
-                product = product, overwrite = overwrite, check_integrity = check_integrity)
+                product = product, overwrite = overwrite, check_integrity = check_integrity,\
+                n_workers = n_workers)
 
 
 if __name__ == '__main__':
@@ -112,6 +117,18 @@ if __name__ == '__main__':
                         help = 'Only makes sense if overwrite is not set. Should existing data be checked for integrity?')
     parser.set_defaults(check_integrity=False)
 
+    parser.add_argument('-multi', '--n_workers',
+                        type = int,
+                        required = False,
+                        help = 'Number of simultaneous downloads (defaults to 4)')
+    parser.set_defaults(n_workers=4)
+
+    parser.add_argument('-catalog', '--catalog',
+                        required=False,
+                        help=('Optional archive catalog (SQLite, see update_catalog.py) in which'
+                              ' the downloaded files are registered'))
+    parser.set_defaults(catalog=None)
+
     parsed_args = parser.parse_args()
 
     main(**vars(parsed_args))
\ No newline at end of file
@@ -11,7 +11,10 @@ import argparse
 
 def main(aqua, terra, viirs, seawifs, begin, end, delta, day_vars, night_vars,
          south, north, west, east, mapping_resolution, proj, data_root,
-         overwrite, n_threads):
+         overwrite, n_threads, catalog):
+    # Before any parallel call, for the workers to inherit it
+    if catalog is not None:
+        satmo.set_catalog(catalog)
     if not any([aqua, terra, viirs, seawifs]):
         raise ValueError('You need to set at least one of the sensors flag')
     sensor_codes = []
@@ -135,15 +138,25 @@ timerange_time_compositing.py --aqua --terra --viirs -b 2000-01-01 -e 2017-12-31
                                 ' +proj=eqc +lon_0=0 is used'))
     parser.set_defaults(proj=None)
 
+    parser.add_argument('--overwrite', action='store_const', const=True, dest='overwrite',
+                        help = ('Overwrite all existing files. By default, existing files are only'
+                                ' rebuilt when their inputs changed'))
+
     parser.add_argument('--no-overwrite', action='store_false', dest='overwrite',
-                       help = 'Disable defaults overwritting of existing files')
-    parser.set_defaults(overwrite=True)
+                       help = 'Never overwrite existing files')
+    parser.set_defaults(overwrite='auto')
 
     parser.add_argument('-multi', '--n_threads',
                         type = int,
                         required = False,
                         help = 'Number of threads to use for parallel implementation')
     parser.set_defaults(n_threads=1)
+    parser.add_argument('-catalog', '--catalog',
+                        required=False,
+                        help=('Optional archive catalog (SQLite, see update_catalog.py) used to'
+                              ' look up files instead of listing the archive directories'))
+    parser.set_defaults(catalog=None)
+
     parsed_args = parser.parse_args()
 
     main(**vars(parsed_args))
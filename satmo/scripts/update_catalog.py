@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+"""
+Date: 2026-10-16
+Purpose: Command line utility to create or update the catalog of a local archive
+
+"""
+
+import satmo
+import argparse
+
+def main(data_root, catalog, full):
+    catalog = satmo.Catalog(catalog)
+    if full:
+        n = catalog.scan(data_root)
+    else:
+        n = catalog.update(data_root)
+    print('%d files registered' % n)
+
+
+if __name__ == '__main__':
+
+    epilog = ('Command line utility to create or update the SQLite catalog of a satmo archive\n\n'
+              'Only the directories modified since the previous update are listed, unless\n'
+              '--full is set.\n\n'
+              '------------\n'
+              'Example usage:\n'
+              '------------\n'
+              'update_catalog.py -d /export/isilon/datos2/satmo2_data -c /export/isilon/datos2/satmo2_data/catalog.sqlite\n\n'
+              '\n ')
+
+    parser = argparse.ArgumentParser(epilog=epilog, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("-d", "--data_root",
+                        required=True,
+                        help="Root of the local archive")
+
+    parser.add_argument("-c", "--catalog",
+                        required=True,
+                        help="Catalog database file (created if it does not exist)")
+
+    parser.add_argument('--full', action='store_true',
+                        help='Rescan the full archive instead of the modified directories only')
+
+    parsed_args = parser.parse_args()
+
+    main(**vars(parsed_args))
@@ -0,0 +1,108 @@
+"""Shared HTTP session of the query and download functions
+
+All requests to the oceancolor servers go through a single requests Session per
+process, so that connections are kept alive and reused between queries and
+downloads instead of paying a new TCP and TLS handshake for every file. The
+session applies a common retry policy (transient connection errors and server
+errors are retried with an exponential backoff) and default timeouts, which can
+be changed with configure_session.
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+
+SESSION_DEFAULTS = {'retries': 5,
+                    'backoff_factor': 0.5,
+                    'status_forcelist': (500, 502, 503, 504),
+                    'pool_maxsize': 10,
+                    'timeout': (15, 60)}
+
+_config = dict(SESSION_DEFAULTS)
+_session = None
+_pid = None
+_lock = threading.Lock()
+
+
+def configure_session(**kwargs):
+    """Change the settings of the shared session
+
+    Args:
+        retries (int): Number of retries of failed requests (connection errors,
+            read errors and status codes of status_forcelist)
+        backoff_factor (float): Pause before the n-th retry is backoff_factor * 2 ** (n - 1)
+            seconds
+        status_forcelist (tuple): HTTP status codes that are retried
+        pool_maxsize (int): Number of connections kept alive per host. Should be at
+            least the number of simultaneous downloads (see download_many)
+        timeout (float or tuple): Default timeout in seconds of the requests,
+            or (connect timeout, read timeout) tuple
+
+    Examples:
+        >>> import satmo
+        >>> satmo.configure_session(retries=10, pool_maxsize=16, timeout=(10, 120))
+    """
+    global _session
+    unknown = set(kwargs) - set(SESSION_DEFAULTS)
+    if unknown:
+        raise ValueError('Unknown session settings: %s' % ', '.join(sorted(unknown)))
+    with _lock:
+        _config.update(kwargs)
+        # A new session is created with the new settings on next use
+        _session = None
+
+
+def get_session():
+    """Return the shared session of the current process
+
+    Returns:
+        requests.Session: The session
+    """
+    global _session, _pid
+    with _lock:
+        # Connections cannot be shared with forked processes
+        if _session is None or _pid != os.getpid():
+            retries = Retry(total=_config['retries'], backoff_factor=_config['backoff_factor'],
+                            status_forcelist=_config['status_forcelist'])
+            adapter = HTTPAdapter(max_retries=retries, pool_maxsize=_config['pool_maxsize'])
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+            _pid = os.getpid()
+        return _session
+
+
+def get(url, **kwargs):
+    """Send a GET request with the shared session
+
+    Args:
+        url (str): Url of the request
+        **kwargs: Arguments of requests.Session.get. timeout defaults to the
+            timeout of the session settings
+
+    Returns:
+        requests.Response: The response
+    """
+    if kwargs.get('timeout') is None:
+        kwargs['timeout'] = _config['timeout']
+    return get_session().get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    """Send a HEAD request with the shared session
+
+    Args:
+        url (str): Url of the request
+        **kwargs: Arguments of requests.Session.head. timeout defaults to the
+            timeout of the session settings
+
+    Returns:
+        requests.Response: The response
+    """
+    if kwargs.get('timeout') is None:
+        kwargs['timeout'] = _config['timeout']
+    return get_session().head(url, **kwargs)
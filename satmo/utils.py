@@ -1,6 +1,8 @@
 import re
 import glob
-from datetime import datetime, time, timedelta
+import fnmatch
+from datetime import datetime, date, time, timedelta
+from collections import namedtuple, OrderedDict
 from dateutil.relativedelta import relativedelta
 import calendar
 import os
@@ -9,6 +11,9 @@ import signal
 from contextlib import contextmanager
 import random
 import string
+import threading
+
+import numpy as np
 
 from .errors import TimeoutException
 from .global_variables import SENSOR_CODES, DATA_LEVELS, VARS_FROM_L2_SUITE
@@ -17,10 +22,136 @@ from .global_variables import SENSOR_CODES, DATA_LEVELS, VARS_FROM_L2_SUITE
 # unit database for pint
 ureg = UnitRegistry()
 
-def filename_parser(filename, raiseError = True):
+FILE_META_FIELDS = ['sensor', 'sensor_code', 'date', 'time', 'year', 'month', 'doy',
+                    'dom', 'level', 'filename', 'climatology', 'anomaly', 'resolution',
+                    'variable', 'suite', 'composite', 'begin_year', 'end_year']
+
+class FileMeta(namedtuple('FileMeta', FILE_META_FIELDS)):
+    """Immutable record of the metadata extracted from a filename by filename_parser
+
+    Fields can be accessed as attributes (``meta.date``) or, as with the dictionary
+    returned by default by filename_parser, by key (``meta['date']``).
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, slice)):
+            return tuple.__getitem__(self, key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return list(self._fields)
+
+    def items(self):
+        return list(zip(self._fields, self))
+
+    def to_dict(self):
+        return dict(zip(self._fields, self))
+
+
+# Patterns are compiled once, at import
+_PATTERN_0 = re.compile(r'(?P<sensor_code>CLIM\.|ANOM\.|[A-Z]{1})(?P<time_info>\d{3}\.|\d{7}\.|\d{13}\.)(?P<level>L0|L1A|L1B|GEO|GEO-M|L2|L2m|L3b|L3m)_.*')
+_PATTERN_CLIM = re.compile(r'CLIM\.(?P<doy>\d{3})\.(?P<level>[A-Za-z1-3]{3,4})_(?P<composite>.*?)' \
+                           r'_(?P<suite>.*?)_(?P<variable>.*)_(?P<resolution>.*?)_(?P<begin_year>\d{4})_(?P<end_year>\d{4})\..*')
+_PATTERN_ANOM = re.compile(r'ANOM\.(?P<date>\d{7})\.(?P<level>[A-Za-z1-3]{3,4})_(?P<composite>.*?)' \
+                           '_(?P<suite>.*?)_(?P<variable>.*)_(?P<resolution>.*?)\..*')
+_PATTERN_L1 = re.compile(r'(?P<sensor>[A-Z])(?P<date>\d{7})(?P<time>\d{6})\.(?P<level>[A-Za-z1-3]{3,4})_.*')
+_PATTERN_GEO = re.compile(r'(?P<sensor>[A-Z])(?P<date>\d{7})(?P<time>\d{6})\..*')
+_PATTERN_L2 = re.compile(r'(?P<sensor>[A-Z])(?P<date>\d{7})(?P<time>\d{6})\.(?P<level>L2)_(.*?)_(?P<suite>.*)\..*')
+_PATTERN_L2m = re.compile(r'(?P<sensor>[A-Z])(?P<date>\d{7})(?P<time>\d{6})\.(?P<level>L2m)_(?P<suite>.*?)_(?P<variable>.*)\..*')
+_PATTERN_L3b = re.compile(r'(?P<sensor>[A-Z])(?P<date>\d{7})\.(?P<level>L3b)_(?P<composite>.*?)_(?P<suite>.*)\..*')
+_PATTERN_L3m = re.compile(r'(?P<sensor>[A-Z])(?P<date>\d{7})\.(?P<level>L3m)_(?P<composite>.*?)' \
+                          r'_(?P<suite>.*?)_(?P<variable>.*)_(?P<resolution>.*)\..*')
+
+FILENAME_CACHE_SIZE = 2**16
+_filename_cache = OrderedDict()
+# filename_parser is called from the download threads (see download_many)
+_filename_cache_lock = threading.Lock()
+
+def _parse_yday(x):
+    """Equivalent of datetime.strptime(x, "%Y%j").date()"""
+    doy = int(x[4:7])
+    if not 1 <= doy <= 366:
+        raise ValueError('Invalid day of year in %s' % x)
+    return date(int(x[:4]), 1, 1) + timedelta(days=doy - 1)
+
+def _parse_time(x):
+    """Equivalent of datetime.strptime(x, "%H%M%S").time()"""
+    return time(int(x[:2]), int(x[2:4]), int(x[4:6]))
+
+def _parse_filename(filename):
+    """Parse a filename (basename) into a FileMeta record; level is None when the name
+    is not a valid data name"""
+    m_0 = _PATTERN_0.search(filename)
+    if m_0 is None:
+        return FileMeta(*[None] * len(FILE_META_FIELDS))._replace(filename=filename)
+    # filename with eventual prefixes removed
+    filename = m_0.group()
+    meta_dict = dict.fromkeys(FILE_META_FIELDS)
+    meta_dict.update(filename=filename, climatology=False, anomaly=False)
+    # Treat each level indepndently
+    if m_0.group('sensor_code') == 'CLIM.':
+        m = _PATTERN_CLIM.search(filename)
+        meta_dict.update(doy=int(m.group('doy')),
+                         level=m.group('level'),
+                         climatology=True,
+                         resolution=m.group('resolution'),
+                         variable=m.group('variable'),
+                         suite=m.group('suite'),
+                         composite=m.group('composite'),
+                         begin_year=int(m.group('begin_year')),
+                         end_year=int(m.group('end_year')))
+        return FileMeta(**meta_dict)
+    if m_0.group('sensor_code') == 'ANOM.':
+        m = _PATTERN_ANOM.match(filename)
+        meta_dict.update(anomaly=True)
+    elif m_0.group('level') in ['L1A', 'L1B']:
+        m = _PATTERN_L1.match(filename)
+    elif m_0.group('level') in ['GEO', 'GEO-M']:
+        m = _PATTERN_GEO.match(filename)
+        meta_dict.update(level='GEO')
+    elif m_0.group('level') == 'L2':
+        m = _PATTERN_L2.match(filename)
+    elif m_0.group('level') == 'L2m':
+        m = _PATTERN_L2m.match(filename)
+    elif m_0.group('level') == 'L3b':
+        m = _PATTERN_L3b.match(filename)
+    elif m_0.group('level') == 'L3m':
+        m = _PATTERN_L3m.match(filename)
+    else:
+        # L0, only the level is known
+        meta_dict.update(level=m_0.group('level'))
+        return FileMeta(**meta_dict)
+    groups = m.groupdict()
+    dt_date = _parse_yday(groups['date'])
+    meta_dict.update(date=dt_date,
+                     year=dt_date.year,
+                     month=dt_date.month,
+                     doy=dt_date.timetuple().tm_yday,
+                     dom=dt_date.day)
+    if 'sensor' in groups:
+        meta_dict.update(sensor=SENSOR_CODES[groups['sensor']],
+                         sensor_code=groups['sensor'])
+    if 'time' in groups:
+        meta_dict.update(time=_parse_time(groups['time']))
+    for key in ['level', 'resolution', 'variable', 'suite', 'composite']:
+        if key in groups and meta_dict[key] is None:
+            meta_dict[key] = groups[key]
+    return FileMeta(**meta_dict)
+
+def filename_parser(filename, raiseError = True, record = False):
     """File parser for ocean color products
 
     Extract metadata information from a typical ocean color file name
+
+    Parsing results are cached (keyed on the basename of the file), so that
+    repeated calls on the same file are cheap. The function is thread safe.
     
     The parser will probably fail for the following products:
         * L0
@@ -32,10 +163,13 @@ def filename_parser(filename, raiseError = True):
         raiseError (bool): Behavior when no valid pattern is found.
         True (default) returns a ValueError, false returns a dictionaries of
             Nones
+        record (bool): Return an immutable FileMeta record (supporting both
+            attribute and dictionary style access) instead of a dictionary.
+            Defaults to False
 
 
     Returns:
-        dict: A dictionary with the following keys::
+        dict: A dictionary (or FileMeta record) with the following keys::
 
             sensor (str)
             sensor_code (str)
@@ -58,214 +192,77 @@ def filename_parser(filename, raiseError = True):
         
         Key values are set to None when not applicable
     """
-    pattern_0 = re.compile(r'(?P<sensor_code>CLIM\.|ANOM\.|[A-Z]{1})(?P<time_info>\d{3}\.|\d{7}\.|\d{13}\.)(?P<level>L0|L1A|L1B|GEO|GEO-M|L2|L2m|L3b|L3m)_.*')
-    m_0 = pattern_0.search(filename)
-    if m_0 is None:
-        if raiseError:
-            raise ValueError('No valid data name found for %s' % filename)
+    key = os.path.basename(filename)
+    with _filename_cache_lock:
+        meta = _filename_cache.pop(key, None)
+    if meta is None:
+        meta = _parse_filename(key)
+    with _filename_cache_lock:
+        # (Re-)insert as most recently used
+        _filename_cache.pop(key, None)
+        _filename_cache[key] = meta
+        while len(_filename_cache) > FILENAME_CACHE_SIZE:
+            _filename_cache.popitem(last=False)
+    # climatology is None only for invalid names
+    if meta.climatology is None and raiseError:
+        raise ValueError('No valid data name found for %s' % filename)
+    if record:
+        return meta
+    return meta.to_dict()
+
+PARSE_MANY_FIELDS = ['filename', 'sensor_code', 'date', 'time', 'level', 'suite',
+                     'variable', 'resolution', 'composite']
+
+def parse_many(filenames, raiseError = True):
+    """Parse a list of filenames into columnar arrays
+
+    Bulk counterpart of filename_parser, meant for archive wide operations
+    (inventories, filtering of long file lists by date, time, sensor, etc) where
+    selections can then be expressed as vectorized masks.
+
+    Args:
+        filenames (list): List of ocean color filenames
+        raiseError (bool): Raise a ValueError when a filename cannot be parsed
+            (default). Otherwise, the fields of invalid filenames are empty strings
+            and NaT
+
+    Returns:
+        numpy.recarray: A record array with one record per filename and the following
+        fields (also accessible as attributes)::
+
+            filename (str): filename with eventual prefixes removed
+            sensor_code (str)
+            date (datetime64[D])
+            time (timedelta64[s]): Time since midnight, NaT if not applicable
+            level (str)
+            suite (str)
+            variable (str)
+            resolution (str)
+            composite (str)
+
+        String fields are empty when not applicable
+
+    Examples:
+        >>> import satmo
+        >>> import numpy as np
+        >>> meta = satmo.parse_many(file_list)
+        >>> # Aqua files of 2016
+        >>> mask = (meta.sensor_code == 'A') & (meta.date >= np.datetime64('2016-01-01'))
+    """
+    records = [filename_parser(x, raiseError=raiseError, record=True) for x in filenames]
+    columns = []
+    for field in PARSE_MANY_FIELDS:
+        if field == 'date':
+            column = np.array([x.date for x in records], dtype='datetime64[D]')
+        elif field == 'time':
+            column = np.array([np.timedelta64(x.time.hour * 3600 + x.time.minute * 60 +
+                                              x.time.second, 's')
+                               if x.time is not None else np.timedelta64('NaT', 's')
+                               for x in records], dtype='timedelta64[s]')
         else:
-            meta_dict = {'sensor': None,
-                         'sensor_code': None,
-                         'date': None,
-                         'time': None,
-                         'year': None,
-                         'month': None,
-                         'doy': None,
-                         'dom': None,
-                         'level': None,
-                         'filename': os.path.basename(filename),
-                         'climatology': None,
-                         'anomaly': None,
-                         'resolution': None,
-                         'variable': None,
-                         'suite': None,
-                         'composite': None,
-                         'begin_year': None,
-                         'end_year': None}
-            return meta_dict
-    # filename with eventual prefixes removed
-    filename = m_0.group()
-    # Treat each level indepndently
-    if m_0.group('sensor_code') == 'CLIM.':
-        pattern = re.compile(r'CLIM\.(?P<doy>\d{3})\.(?P<level>[A-Za-z1-3]{3,4})_(?P<composite>.*?)' \
-                             r'_(?P<suite>.*?)_(?P<variable>.*)_(?P<resolution>.*?)_(?P<begin_year>\d{4})_(?P<end_year>\d{4})\..*')
-        m = pattern.search(filename)
-        meta_dict = {'sensor': None,
-                     'sensor_code': None,
-                     'date': None,
-                     'time': None,
-                     'year': None,
-                     'month': None,
-                     'doy': int(m.group('doy')),
-                     'dom': None,
-                     'level': m.group('level'),
-                     'filename': filename,
-                     'climatology': True,
-                     'anomaly': False,
-                     'resolution': m.group('resolution'),
-                     'variable': m.group('variable'),
-                     'suite': m.group('suite'),
-                     'composite': m.group('composite'),
-                     'begin_year': int(m.group('begin_year')),
-                     'end_year': int(m.group('end_year'))}
-
-    elif m_0.group('sensor_code') == 'ANOM.':
-        pattern = re.compile(r'ANOM\.(?P<date>\d{7})\.(?P<level>[A-Za-z1-3]{3,4})_(?P<composite>.*?)' \
-                              '_(?P<suite>.*?)_(?P<variable>.*)_(?P<resolution>.*?)\..*')
-        m = pattern.match(filename)
-        dt_date = datetime.strptime(m.group('date'), "%Y%j")
-        meta_dict = {'sensor': None,
-                     'sensor_code': None,
-                     'date': dt_date.date(),
-                     'time': None,
-                     'year': dt_date.year,
-                     'month': dt_date.month,
-                     'doy': dt_date.timetuple().tm_yday,
-                     'dom': dt_date.timetuple().tm_mday,
-                     'level': m.group('level'),
-                     'filename': filename,
-                     'climatology': False,
-                     'anomaly': True,
-                     'resolution': m.group('resolution'),
-                     'variable': m.group('variable'),
-                     'suite': m.group('suite'),
-                     'composite': m.group('composite'),
-                     'begin_year': None,
-                     'end_year': None}
-    elif m_0.group('level') in ['L1A', 'L1B']:
-        pattern = re.compile(r'(?P<sensor>[A-Z])(?P<date>\d{7})(?P<time>\d{6})\.(?P<level>[A-Za-z1-3]{3,4})_.*')
-        m = pattern.match(filename)
-        dt_date = datetime.strptime(m.group('date'), "%Y%j")
-        meta_dict = {'sensor': SENSOR_CODES[m.group('sensor')],
-                     'sensor_code': m.group('sensor'),
-                     'date': dt_date.date(),
-                     'time': datetime.strptime(m.group('time'), "%H%M%S").time(),
-                     'year': dt_date.year,
-                     'month': dt_date.month,
-                     'doy': dt_date.timetuple().tm_yday,
-                     'dom': dt_date.timetuple().tm_mday,
-                     'level': m.group('level'),
-                     'filename': filename,
-                     'climatology': False,
-                     'anomaly': False,
-                     'resolution': None,
-                     'variable': None,
-                     'suite': None,
-                     'composite': None,
-                     'begin_year': None,
-                     'end_year': None}
-    elif m_0.group('level') in ['GEO', 'GEO-M']:
-        pattern = re.compile(r'(?P<sensor>[A-Z])(?P<date>\d{7})(?P<time>\d{6})\..*')
-        m = pattern.match(filename)
-        dt_date = datetime.strptime(m.group('date'), "%Y%j")
-        meta_dict = {'sensor': SENSOR_CODES[m.group('sensor')],
-                     'sensor_code': m.group('sensor'),
-                     'date': dt_date.date(),
-                     'time': datetime.strptime(m.group('time'), "%H%M%S").time(),
-                     'year': dt_date.year,
-                     'month': dt_date.month,
-                     'doy': dt_date.timetuple().tm_yday,
-                     'dom': dt_date.timetuple().tm_mday,
-                     'level': 'GEO',
-                     'filename': filename,
-                     'climatology': False,
-                     'anomaly': False,
-                     'resolution': None,
-                     'variable': None,
-                     'suite': None,
-                     'composite': None,
-                     'begin_year': None,
-                     'end_year': None}
-    elif m_0.group('level') == 'L2':
-        pattern = re.compile(r'(?P<sensor>[A-Z])(?P<date>\d{7})(?P<time>\d{6})\.(?P<level>L2)_(.*?)_(?P<suite>.*)\..*')
-        m = pattern.match(filename)
-        dt_date = datetime.strptime(m.group('date'), "%Y%j")
-        meta_dict = {'sensor': SENSOR_CODES[m.group('sensor')],
-                     'sensor_code': m.group('sensor'),
-                     'date': dt_date.date(),
-                     'time': datetime.strptime(m.group('time'), "%H%M%S").time(),
-                     'year': dt_date.year,
-                     'month': dt_date.month,
-                     'doy': dt_date.timetuple().tm_yday,
-                     'dom': dt_date.timetuple().tm_mday,
-                     'level': m.group('level'),
-                     'filename': filename,
-                     'climatology': False,
-                     'anomaly': False,
-                     'resolution': None,
-                     'variable': None,
-                     'suite': m.group('suite'),
-                     'composite': None,
-                     'begin_year': None,
-                     'end_year': None}
-    elif m_0.group('level') == 'L2m':
-        pattern = re.compile(r'(?P<sensor>[A-Z])(?P<date>\d{7})(?P<time>\d{6})\.(?P<level>L2m)_(?P<suite>.*?)_(?P<variable>.*)\..*')
-        m = pattern.match(filename)
-        dt_date = datetime.strptime(m.group('date'), "%Y%j")
-        meta_dict = {'sensor': SENSOR_CODES[m.group('sensor')],
-                     'sensor_code': m.group('sensor'),
-                     'date': dt_date.date(),
-                     'time': datetime.strptime(m.group('time'), "%H%M%S").time(),
-                     'year': dt_date.year,
-                     'month': dt_date.month,
-                     'doy': dt_date.timetuple().tm_yday,
-                     'dom': dt_date.timetuple().tm_mday,
-                     'level': m.group('level'),
-                     'filename': filename,
-                     'climatology': False,
-                     'anomaly': False,
-                     'resolution': None,
-                     'variable': m.group('variable'),
-                     'suite': m.group('suite'),
-                     'composite': None,
-                     'begin_year': None,
-                     'end_year': None}
-    elif m_0.group('level') == 'L3b':
-        pattern = re.compile(r'(?P<sensor>[A-Z])(?P<date>\d{7})\.(?P<level>L3b)_(?P<composite>.*?)_(?P<suite>.*)\..*')
-        m = pattern.match(filename)
-        dt_date = datetime.strptime(m.group('date'), "%Y%j")
-        meta_dict = {'sensor': SENSOR_CODES[m.group('sensor')],
-                     'sensor_code': m.group('sensor'),
-                     'date': dt_date.date(),
-                     'time': None,
-                     'year': dt_date.year,
-                     'month': dt_date.month,
-                     'doy': dt_date.timetuple().tm_yday,
-                     'dom': dt_date.timetuple().tm_mday,
-                     'level': m.group('level'),
-                     'filename': filename,
-                     'climatology': False,
-                     'anomaly': False,
-                     'resolution': None,
-                     'variable': None,
-                     'suite': m.group('suite'),
-                     'composite': m.group('composite'),
-                     'begin_year': None,
-                     'end_year': None}
-    elif m_0.group('level') == 'L3m':
-        pattern = re.compile(r'(?P<sensor>[A-Z])(?P<date>\d{7})\.(?P<level>L3m)_(?P<composite>.*?)' \
-                             r'_(?P<suite>.*?)_(?P<variable>.*)_(?P<resolution>.*)\..*')
-        m = pattern.match(filename)
-        dt_date = datetime.strptime(m.group('date'), "%Y%j")
-        meta_dict = {'sensor': SENSOR_CODES[m.group('sensor')],
-                     'sensor_code': m.group('sensor'),
-                     'date': dt_date.date(),
-                     'time': None,
-                     'year': dt_date.year,
-                     'month': dt_date.month,
-                     'doy': dt_date.timetuple().tm_yday,
-                     'dom': dt_date.timetuple().tm_mday,
-                     'level': m.group('level'),
-                     'filename': filename,
-                     'climatology': False,
-                     'anomaly': False,
-                     'resolution': m.group('resolution'),
-                     'variable': m.group('variable'),
-                     'suite': m.group('suite'),
-                     'composite': m.group('composite'),
-                     'begin_year': None,
-                     'end_year': None}
-    return meta_dict
+            column = np.array([getattr(x, field) or u'' for x in records], dtype=np.unicode_)
+        columns.append(column)
+    return np.rec.fromarrays(columns, names=PARSE_MANY_FIELDS)
 
 def filename_builder(level, climatology = False, anomaly = False, full_path = False, data_root = None, **kwargs):
     """Utility to build valid ocean color filenames for every level
@@ -501,10 +498,24 @@ def path_builder(filename, data_root = None, add_file = True):
     file_path = os.path.join(*path_elements)
     return file_path
 
-def path_finder(data_root, date, level, sensor_code = None, composite = None, anomaly = False, climatology = False, search = True):
+def _default_catalog(catalog):
+    """Resolve the catalog argument of file_finder and path_finder"""
+    if catalog is None:
+        from .catalog import get_catalog
+        return get_catalog()
+    if catalog is False:
+        return None
+    if not hasattr(catalog, 'query'):
+        from .catalog import Catalog
+        catalog = Catalog(catalog)
+    return catalog
+
+def path_finder(data_root, date, level, sensor_code = None, composite = None, anomaly = False, climatology = False, search = True,
+                catalog = None):
     """Builds and find existing paths from meta information
 
     Builds a pseudo path name using provided metadata and runs glob.glob on it.
+    When a catalog is used, the existing paths are retrieved from the catalog instead.
 
     If composite or anomaly is True, you only need to provide composite and date
 
@@ -518,6 +529,9 @@ def path_finder(data_root, date, level, sensor_code = None, composite = None, an
         climatology (bool): Are we looking for a directory of climatologies
         search (bool): Should the function return the output of glob.glob() on the generated. Otherwise the glob pattern
             itself is returned. Defaults to True
+        catalog (Catalog or str): Catalog (or catalog database filename) to search instead of
+            running glob. Defaults to None, in which case the default catalog (see
+            satmo.set_catalog) is used if set. False forces a glob search.
 
     Returns:
         list: A list of existing paths matching the 'query'
@@ -540,15 +554,21 @@ def path_finder(data_root, date, level, sensor_code = None, composite = None, an
         path_elements = [data_root, sensor, level, date.year, str(date.timetuple().tm_yday).zfill(3)]
     path_pattern = os.path.join(*[str(x) for x in path_elements])
     if search:
+        catalog = _default_catalog(catalog)
+        if catalog is not None:
+            dir_list = catalog.query(date=date, data_root=data_root, columns='DISTINCT dir')
+            return [x for x in dir_list if fnmatch.fnmatch(x, os.path.abspath(path_pattern))]
         path_list = glob.glob(path_pattern)
         return path_list
     return path_pattern
 
 
-def file_finder(data_root, date, level, suite = None, variable = None, sensor_code = None, resolution = None, composite = None):
+def file_finder(data_root, date, level, suite = None, variable = None, sensor_code = None, resolution = None, composite = None,
+                catalog = None):
     """Finds existing files on the system from meta information (date, level, variable, sensor_code, ...)
 
-    Builds a glob pattern from the provided information and runs glob.glob on it. THis function is not fully generic, and so mostly
+    Builds a glob pattern from the provided information and runs glob.glob on it, or runs the equivalent indexed
+    query on the archive catalog when a catalog is used. THis function is not fully generic, and so mostly
     targeted at L1A, L2, and L3m file (no climatologies or anomalies). Example applications include:
 
         * list all L2 files required to produce a L3b binned product (don't forget filtering using isDay() as well)
@@ -570,12 +590,31 @@ def file_finder(data_root, date, level, suite = None, variable = None, sensor_co
         sensor_code (str): Sensor code (e.g. 'A', 'T', 'V') of the files to query. If None (default), is replaced by * in a glob search
         resolution (str): e.g. '1km'
         composite (str): Composite period of the files to query
+        catalog (Catalog or str): Catalog (or catalog database filename) to query instead of
+            running glob. Defaults to None, in which case the default catalog (see
+            satmo.set_catalog) is used if set. False forces a glob search.
 
     Returns:
         list: A list of filenames (empty if no matches)
     """
     if type(date) is str:
         date = datetime.strptime(date, "%Y-%m-%d")
+    catalog = _default_catalog(catalog)
+    if catalog is not None:
+        if level not in ['L1A', 'L2', 'L3m', 'L3b']:
+            raise ValueError('Unsuported data level')
+        extension = {'L2': '.nc', 'L3m': '.tif', 'L3b': '.nc'}.get(level)
+        file_list = catalog.query(level=level, date=date, sensor_code=sensor_code,
+                                  suite=suite if level != 'L1A' else None,
+                                  variable=variable if level == 'L3m' else None,
+                                  resolution=resolution if level == 'L3m' else None,
+                                  composite=composite if level in ['L3m', 'L3b'] else None,
+                                  data_root=data_root, extension=extension)
+        # Only files at their expected location in the archive
+        path_pattern = os.path.abspath(path_finder(data_root=data_root, level=level, date=date,
+                                                   composite=composite, search=False,
+                                                   sensor_code=sensor_code))
+        return [x for x in file_list if fnmatch.fnmatch(os.path.dirname(x), path_pattern)]
     path_pattern = path_finder(data_root = data_root, level = level, date = date, composite = composite, search = False, sensor_code = sensor_code)
     if sensor_code is None:
         sensor_code = '*'
@@ -619,11 +658,15 @@ def is_day(filename):
     and is only valid for that area
 
     Args:
-        filename (str): file name of a dataset
+        filename (str or list): file name of a dataset, or list of file names
 
     Returns:
-        bool: True if day file, False otherwise
+        bool: True if day file, False otherwise. A boolean array when a list of
+        file names is provided
     """
+    if isinstance(filename, (list, tuple, np.ndarray)):
+        file_time = parse_many(filename).time
+        return ~np.isnat(file_time) & (file_time > np.timedelta64(12 * 3600, 's'))
     dt_time = filename_parser(filename)['time']
     # 12pm threshold validated against a full year for aqua, terra, viirs
     if dt_time > time(12, 0):
@@ -639,11 +682,14 @@ def is_night(filename):
     and is only valid for that area
 
     Args:
-        filename (str): file name of a dataset
+        filename (str or list): file name of a dataset, or list of file names
 
     Returns:
-        bool: True if night file, False otherwise
+        bool: True if night file, False otherwise. A boolean array when a list of
+        file names is provided
     """
+    if isinstance(filename, (list, tuple, np.ndarray)):
+        return ~is_day(filename)
     return not is_day(filename)
 
 def to_km(x):
@@ -844,13 +890,8 @@ def get_date_list(file_list):
     Returns:
         list: A list of datetime.
     """
-    def _get_date(x):
-        d = filename_parser(x)['date']
-        dt = datetime.combine(d, time())
-        return dt
-    date_list = [_get_date(x) for x in file_list]
-    date_list_unique = list(set(date_list))
-    return date_list_unique
+    date_array = np.unique(parse_many(file_list).date)
+    return [datetime.combine(x.tolist(), time()) for x in date_array]
 
 def find_composite_date_list(date, delta):
     """Find, given a date and delta, all the dates that compose the composite to which the input date belong
@@ -901,6 +942,57 @@ def time_limit(seconds):
     finally:
         signal.alarm(0)
 
+@contextmanager
+def atomic_output(filename):
+    """Write a file under a temporary name, renamed to its final name on success
+
+    The temporary file is a hidden file of the output directory with the same
+    extension as filename, so that an interrupted write never leaves a partial
+    file under the final name. It is removed when the block raises, and
+    overwritten by the next attempt if the process was killed.
+
+    Args:
+        filename (str): Final output filename
+
+    Examples:
+        >>> import subprocess
+        >>> from satmo import atomic_output
+
+        >>> with atomic_output('/data/A2016001.L3b_DAY_CHL.nc') as tmp_file:
+        >>>     subprocess.call(['l2bin', 'ofile=%s' % tmp_file, ...])
+    """
+    out_dir, basename = os.path.split(filename)
+    tmp_file = os.path.join(out_dir, '.%s.tmp%s' % os.path.splitext(basename))
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    try:
+        yield tmp_file
+        os.rename(tmp_file, filename)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+@contextmanager
+def atomic_outputs(filename_list):
+    """atomic_output for several files written together
+
+    Args:
+        filename_list (list): Final output filenames
+
+    Examples:
+        >>> from satmo.utils import atomic_outputs
+
+        >>> with atomic_outputs(['mean.tif', 'count.tif']) as tmp_list:
+        >>>     write_composites(tmp_list)
+    """
+    if not filename_list:
+        yield []
+        return
+    with atomic_output(filename_list[0]) as tmp_file:
+        with atomic_outputs(filename_list[1:]) as tmp_list:
+            yield [tmp_file] + tmp_list
+
 def randomword(length):
     """Generate a random string of desired length
     """
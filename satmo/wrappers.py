@@ -1,32 +1,41 @@
 from datetime import datetime, timedelta
 import itertools
-import multiprocessing as mp
 import functools
 import os
 from pprint import pprint
 import warnings
+from collections import defaultdict, OrderedDict
 
-from .query import query_from_extent, make_download_url, get_subscription_urls
-from .download import download_robust
+import numpy as np
+
+from .query import (query_from_extent, make_download_url, get_subscription_urls,
+                    get_subscription_checksums)
+from .download import download_robust, download_many
 from .utils import (file_finder, is_day,
                     is_night, resolution_to_km_str, filename_builder,
                     filename_parser, pre_compose, processing_meta_from_list,
                     find_composite_date_list, time_limit, viirs_geo_filename_builder,
-                    get_date_list)
+                    get_date_list, parse_many, path_builder, to_km)
 from .preprocessors import l2gen
 
 from .global_variables import (L2_L3_SUITES_CORRESPONDENCES, SUBSCRIPTIONS, L3_SUITE_FROM_VAR,
                                BIT_MASK_FROM_L3_SUITE, QUAL_ARRAY_NAME_FROM_SUITE,
                                BAND_MATH_FUNCTIONS, FLAGS, VARS_FROM_L2_SUITE,
-                               SENSOR_CODES, STANDARD_L3_SUITES)
+                               SENSOR_CODES, STANDARD_L3_SUITES, COMPOSITE_DELTAS)
 from .processors import (L3mProcess, FileComposer, make_time_composite, l2_append,
-                         l2mapgen, l3mapgen, l2bin, l3bin)
+                         l2mapgen, l3mapgen, l2bin, l3bin, update_time_composite,
+                         compose_to_files)
 from .visualization import make_preview
 from .errors import TimeoutException
+from .dependencies import needs_build
+from .completeness import _suite_vars
+from .scheduler import TaskGraph, parallel_map, get_pool, shutdown_pools, in_worker
+from .integrity import compare_manifest
 
 def timerange_download(sensors, begin, end, write_dir,\
                 north, south, west, east, day = True, night = True,\
-                product = 'L1A', overwrite = False, check_integrity = False):
+                product = 'L1A', overwrite = False, check_integrity = False,
+                n_workers = 4):
     """Queries and download data for a given timerange
 
     Wrapper around downdload and query
@@ -47,9 +56,11 @@ def timerange_download(sensors, begin, end, write_dir,\
             'CHL' for L2_OC, 'SST' for L2_SST, and 'SST4' for L2_SST4
         overwrite (bool): Should existing files on the host be overwritten
         check_integrity (bool): Only makes sense if overwrite is set to False (when updating the archive)
+        n_workers (int): Number of simultaneous downloads (see download_many)
 
     Returns:
-        list: list of boolean
+        list: list of downloaded files (None for files that were not downloaded),
+        in completion order
     """
     if type(begin) is str:
         begin = datetime.strptime(begin, "%Y-%m-%d")
@@ -57,7 +68,7 @@ def timerange_download(sensors, begin, end, write_dir,\
         end = datetime.strptime(end, "%Y-%m-%d")
     ndays = (end - begin).days + 1
     date_range = [begin + timedelta(days=x) for x in range(0, ndays)]
-    local_files_list = []
+    url_list = []
     for item in date_range:
         try:
             file_list = query_from_extent(sensors, item, 'DAY', north, south, west, east,
@@ -66,14 +77,13 @@ def timerange_download(sensors, begin, end, write_dir,\
             pprint('Error encountered for %s' % item.isoformat())
             pprint(e.message)
             continue
-        url_list = [make_download_url(x) for x in file_list]
+        date_url_list = [make_download_url(x) for x in file_list]
         # Viirs only: Build urls of GEO files and append to url list
-        geo_files = [viirs_geo_filename_builder(x) for x in url_list if filename_parser(x)['sensor'] == 'viirs']
-        url_list += geo_files
-        for url in url_list:
-            local_file = download_robust(url, write_dir, overwrite = overwrite,
-                                         check_integrity = check_integrity)
-            local_files_list.append(local_file)
+        geo_files = [viirs_geo_filename_builder(x) for x in date_url_list if filename_parser(x)['sensor'] == 'viirs']
+        url_list += date_url_list + geo_files
+    local_files_list = [x for _, x in download_many(url_list, write_dir, n_workers=n_workers,
+                                                    overwrite=overwrite,
+                                                    check_integrity=check_integrity)]
     return local_files_list
 
 def make_daily_composite(date, variable, suite, data_root, resolution,
@@ -91,15 +101,21 @@ def make_daily_composite(date, variable, suite, data_root, resolution,
         sensor_codes (list): Sensors to include in the composite. Defaults to
             'all', which is automatically transformed to ['A', 'T', 'V'] for
             aqua, terra and viirs.
-        fun (str): Compositing function. Can be 'mean', 'median', 'min', 'max'.
-            Defaults to 'mean'
-        filename (str): Optional output filename. Defaults to None, in which
-            case the filename is automatically generated.
+        fun (str or list): Compositing function. Can be 'mean', 'median', 'min', 'max',
+            'std' or 'count'. Defaults to 'mean'. A list of functions computes all
+            of them from a single read of the inputs and writes each to its own file,
+            with the function name appended to the variable (see make_time_composite)
+        filename (str or list): Optional output filename (one per function when fun
+            is a list). Defaults to None, in which case the filename is automatically
+            generated.
         preview (bool): Generate a png preview. Defaults to True
-        overwrite (bool): Overwrite existing L3m file. Defaults to False
+        overwrite (bool or str): Overwrite existing L3m file. Defaults to False.
+            'auto' only rebuilds an existing composite when its inputs changed
+            (see satmo.dependencies)
 
     Returns:
-        str: The filename of the created composite.
+        str: The filename of the created composite (list of filenames when fun
+        is a list).
 
     Examples:
         >>> import satmo
@@ -119,12 +135,19 @@ def make_daily_composite(date, variable, suite, data_root, resolution,
     # Filter in case only a subset of the sensors is asked
     if sensor_codes == 'all':
         sensor_codes = ['A', 'T', 'V']
-    file_list = [x for x in file_list if filename_parser(x)['sensor_code'] in sensor_codes]
-    # Given a date (string or datetime), a variable (e.g. chlor_a) and a list of sensors, make 
-    compositing_class = FileComposer(*file_list)
-    # Run the compositing method using string provided in fun= argument
-    func = getattr(compositing_class, fun)
-    func()
+    file_list = list(itertools.compress(file_list, np.in1d(parse_many(file_list).sensor_code,
+                                                           sensor_codes)))
+    if isinstance(fun, (list, tuple)):
+        if filename is None:
+            filename = [filename_builder(level='L3m', full_path=True,
+                                         data_root=data_root, date=date,
+                                         sensor_code='X',
+                                         suite=suite,
+                                         composite='DAY',
+                                         variable='%s_%s' % (variable, x),
+                                         resolution=resolution) for x in fun]
+        return compose_to_files(file_list, fun, filename, overwrite=overwrite,
+                                preview=preview)
     # Generate filename if not provided
     if filename is None:
         filename = filename_builder(level='L3m', full_path=True,
@@ -133,7 +156,12 @@ def make_daily_composite(date, variable, suite, data_root, resolution,
                                        suite=suite,
                                        composite='DAY', variable=variable,
                                        resolution=resolution)
-    if not (os.path.isfile(filename) and not overwrite):
+    if needs_build(filename, file_list, overwrite):
+        # Given a date (string or datetime), a variable (e.g. chlor_a) and a list of sensors, make 
+        compositing_class = FileComposer(*file_list)
+        # Run the compositing method using string provided in fun= argument
+        func = getattr(compositing_class, fun)
+        func()
         # Create directory if not already exists
         out_dir = os.path.dirname(filename)
         if not os.path.exists(out_dir):
@@ -161,7 +189,8 @@ def make_daily_composite_error_catcher(date, variable, suite, data_root, resolut
 
 def timerange_daily_composite(begin, end, variable, suite, data_root,
                               resolution, sensor_codes='all', fun='mean',
-                              preview=True, overwrite=False, n_threads=1):
+                              preview=True, overwrite=False, n_threads=1,
+                              date_list=None):
     """Produce daily composite for individual dates in a time-range in batch
 
     Args:
@@ -169,6 +198,8 @@ def timerange_daily_composite(begin, end, variable, suite, data_root,
         end (datetime or str): End of time range. 'yyyy-mm-dd' if str
         n_threads (int): Number of threads to use for running the
             make_daily_composite function in parallel.
+        date_list (list): Optional list of dates to process (e.g. obtained with
+            satmo.work_dates). begin and end are ignored when set
         others (*): See help of make_daily_composite for the other parameters.
 
     Examples:
@@ -180,12 +211,13 @@ def timerange_daily_composite(begin, end, variable, suite, data_root,
                                             resolution='2km')
 
     """
-    if type(begin) is str:
-        begin = datetime.strptime(begin, "%Y-%m-%d")
-    if type(end) is str:
-        end = datetime.strptime(end, "%Y-%m-%d")
-    ndays = (end - begin).days + 1
-    date_range = [begin + timedelta(days=x) for x in range(0, ndays)]
+    if date_list is None:
+        if type(begin) is str:
+            begin = datetime.strptime(begin, "%Y-%m-%d")
+        if type(end) is str:
+            end = datetime.strptime(end, "%Y-%m-%d")
+        ndays = (end - begin).days + 1
+        date_list = [begin + timedelta(days=x) for x in range(0, ndays)]
     kwargs = {'sensor_codes': sensor_codes,
               'suite': suite,
               'variable': variable,
@@ -194,10 +226,8 @@ def timerange_daily_composite(begin, end, variable, suite, data_root,
               'fun': fun,
               'overwrite': overwrite,
               'preview': preview}
-    pool = mp.Pool(n_threads)
-    # Use of map_async().get(9999999) enables KeyboardInterrupt to work
-    pool.map_async(functools.partial(make_daily_composite_error_catcher,
-                                         **kwargs), date_range).get(9999999)
+    list(parallel_map(functools.partial(make_daily_composite_error_catcher, **kwargs),
+                      date_list, n_threads))
 
 def l2mapgen_wrapper(date, sensor_codes, var, south, north, west, east, data_root,
                      night=False, flags=None, width=5000, outmode='tiff',
@@ -252,8 +282,17 @@ def l2mapgen_wrapper(date, sensor_codes, var, south, north, west, east, data_roo
 
 def l2mapgen_batcher(begin, end, sensor_codes, var, south, north, west, east,
                      data_root, night=False, flags=None, width=5000,
-                     outmode='tiff', overwrite=False, threshold=0, n_threads=1):
+                     outmode='tiff', overwrite=False, threshold=0, n_threads=1,
+                     journal=None, resume=False, verify=False):
     """Batch L2m processing with parallel support; to be ran from cli
+
+    Every L2 file is mapped by a separate task of a TaskGraph; files whose output
+    does not need to be built (see overwrite) are skipped. journal, resume and
+    verify allow resuming an interrupted run (see TaskGraph.run). See l2mapgen_wrapper
+    for the other arguments.
+
+    Returns:
+        dict: The status of every task (see TaskGraph.run)
     """
     if type(begin) is str:
         begin = datetime.strptime(begin, "%Y-%m-%d")
@@ -262,23 +301,33 @@ def l2mapgen_batcher(begin, end, sensor_codes, var, south, north, west, east,
     # Get list of individual dates between begin and end
     ndays = (end - begin).days + 1
     date_list = [begin + timedelta(days=x) for x in range(0, ndays)]
-    # Build kwargs
-    kwargs = {'sensor_codes': sensor_codes,
-              'var': var,
-              'south': south,
-              'north': north,
-              'west': west,
-              'east': east,
-              'data_root': data_root,
-              'night': night,
-              'flags': flags,
-              'width': width,
-              'outmode': outmode,
-              'overwrite': overwrite,
-              'threshold': threshold}
-    # Run wrapper for every date with // support
-    pool = mp.Pool(n_threads)
-    pool.map_async(functools.partial(l2mapgen_wrapper, **kwargs), date_list).get(9999999)
+    dn = 'night' if night else 'day'
+    l3_suite = L3_SUITE_FROM_VAR[dn][var]
+    l2_suite = L2_L3_SUITES_CORRESPONDENCES[l3_suite]
+    if flags is None:
+        flags = FLAGS[l3_suite]
+    graph = TaskGraph()
+    for date, sensor_code in itertools.product(date_list, sensor_codes):
+        for x in file_finder(data_root=data_root, date=date, level='L2',
+                             suite=l2_suite, sensor_code=sensor_code):
+            # Output filename, as built by l2mapgen
+            x_dn = 'day' if is_day(x) else 'night'
+            if var not in L3_SUITE_FROM_VAR[x_dn]:
+                pprint('%s file skipped, %s is not a %s variable' % (x, var, x_dn))
+                continue
+            suite = L3_SUITE_FROM_VAR[x_dn][var]
+            filename = filename_builder(level='L2m', filename=x, suite=suite, variable=var,
+                                        full_path=True, data_root=data_root)
+            if not needs_build(filename, [x], overwrite):
+                continue
+            graph.add(os.path.basename(filename), l2mapgen,
+                      kwargs={'x': x, 'north': north, 'south': south, 'west': west,
+                              'east': east, 'prod': var, 'flags': flags,
+                              'data_root': data_root, 'filename': filename,
+                              'width': width, 'outmode': outmode, 'threshold': threshold,
+                              'overwrite': overwrite})
+    return graph.run(limits={'cpu': n_threads}, journal=journal, resume=resume,
+                     verify=verify)
 
 def l2gen_wrapper(date, sensor_codes, var_list, suite, data_root, night=False,
                   get_anc=True):
@@ -313,7 +362,7 @@ def l2gen_wrapper(date, sensor_codes, var_list, suite, data_root, night=False,
         file_list = file_finder(data_root=data_root, date=date, level='L1A',
                                    sensor_code=sensor_code)
         # Filter for day/night files
-        file_list = [x for x in file_list if is_night(x) is night]
+        file_list = list(itertools.compress(file_list, is_night(file_list) == night))
         if file_list:
             for file in file_list:
                 try:
@@ -375,20 +424,23 @@ def l2_append_batcher(begin, end, sensor_codes, var, suite, data_root,
               'suite': suite,
               'data_root': data_root}
     # Run wrapper for every date with // support
-    pool = mp.Pool(n_threads)
-    pool.map_async(functools.partial(l2_append_wrapper, **kwargs), date_list).get(9999999)
+    list(parallel_map(functools.partial(l2_append_wrapper, **kwargs), date_list, n_threads))
 
 def l2gen_batcher(begin, end, sensor_codes, var_list, suite, data_root, night=False,
-                  get_anc=True, n_threads=1):
+                  get_anc=True, n_threads=1, date_list=None):
     """Batch L2 processing with parallel support; to be ran from cli
+
+    date_list optionally replaces begin and end by an explicit list of dates
+    (e.g. obtained with satmo.work_dates)
     """
-    if type(begin) is str:
-        begin = datetime.strptime(begin, "%Y-%m-%d")
-    if type(end) is str:
-        end = datetime.strptime(end, "%Y-%m-%d")
-    # Get list of individual dates between begin and end
-    ndays = (end - begin).days + 1
-    date_list = [begin + timedelta(days=x) for x in range(0, ndays)]
+    if date_list is None:
+        if type(begin) is str:
+            begin = datetime.strptime(begin, "%Y-%m-%d")
+        if type(end) is str:
+            end = datetime.strptime(end, "%Y-%m-%d")
+        # Get list of individual dates between begin and end
+        ndays = (end - begin).days + 1
+        date_list = [begin + timedelta(days=x) for x in range(0, ndays)]
     # Build kwargs
     kwargs = {'sensor_codes': sensor_codes,
               'var_list': var_list,
@@ -397,8 +449,7 @@ def l2gen_batcher(begin, end, sensor_codes, var_list, suite, data_root, night=Fa
               'data_root': data_root,
               'night': night}
     # Run wrapper for every date with // support
-    pool = mp.Pool(n_threads)
-    pool.map_async(functools.partial(l2gen_wrapper, **kwargs), date_list).get(9999999)
+    list(parallel_map(functools.partial(l2gen_wrapper, **kwargs), date_list, n_threads))
 
 def bin_map_wrapper(date, sensor_codes, south, north, west, east, data_root,
                     binning_resolution = 1, mapping_resolution = 1000,
@@ -430,7 +481,8 @@ def bin_map_wrapper(date, sensor_codes, south, north, west, east, data_root,
             normally differ between suites.
         proj (str): Optional proj4 string. If None (default), a lambert Azimutal Equal Area projection (laea), centered
             on the provided extent is used.
-        overwrite (bool): Overwrite existing final (L3m) and intermediary (L3b) files
+        overwrite (bool or str): Overwrite existing final (L3m) and intermediary (L3b) files.
+            'auto' only rebuilds the files whose inputs changed (see satmo.dependencies)
 
     Returns:
         This function is used for its side effects of binning and then mapping data,
@@ -459,7 +511,7 @@ def bin_map_wrapper(date, sensor_codes, south, north, west, east, data_root,
                         l2_file_list = file_finder(data_root=data_root, date=date, level='L2',
                                                       suite=l2_suite, sensor_code=sensor_code)
                         # Filter to keep day data only
-                        l2_file_list = [x for x in l2_file_list if is_day(x)]
+                        l2_file_list = list(itertools.compress(l2_file_list, is_day(l2_file_list)))
                         # Run l2bin
                         l3b_file = l2bin(file_list=l2_file_list, L3b_suite=suite, var_list=var_dict[suite],
                                          resolution=binning_resolution, night=False, data_root=data_root,
@@ -498,7 +550,7 @@ def bin_map_wrapper(date, sensor_codes, south, north, west, east, data_root,
                         l2_file_list = file_finder(data_root=data_root, date=date, level='L2',
                                                       suite=l2_suite, sensor_code=sensor_code)
                         # Filter to keep night data only
-                        l2_file_list = [x for x in l2_file_list if is_night(x)]
+                        l2_file_list = list(itertools.compress(l2_file_list, is_night(l2_file_list)))
                         # Run l2bin
                         l3b_file = l2bin(file_list=l2_file_list, L3b_suite=suite, var_list=var_dict[suite],
                                          resolution=binning_resolution, night=True, data_root=data_root,
@@ -518,33 +570,34 @@ def bin_map_wrapper(date, sensor_codes, south, north, west, east, data_root,
 def bin_map_batcher(begin, end, sensor_codes, south, north, west, east, data_root,
                     binning_resolution = 1, mapping_resolution = 1000,
                     day_vars = None, night_vars = None, flags = None,
-                    proj = None, overwrite = True, n_threads = 1):
+                    proj = None, overwrite = True, n_threads = 1, date_list = None,
+                    journal = None, resume = False, verify = False):
     """Batch processing of L3m data from L2 for several dates, sensors and variables
+
+    date_list optionally replaces begin and end by an explicit list of dates
+    (e.g. obtained with satmo.work_dates)
+
+    Every L3b file (date, sensor, suite) and every L3m file (date, sensor, variable)
+    is a separate task of a processing graph (see processing_graph), so that
+    n_threads are used even when processing a single date. journal, resume and
+    verify allow resuming an interrupted run (see TaskGraph.run). See bin_map_wrapper
+    for the other arguments.
     """
-    if type(begin) is str:
-        begin = datetime.strptime(begin, "%Y-%m-%d")
-    if type(end) is str:
-        end = datetime.strptime(end, "%Y-%m-%d")
-    # Get list of individual dates between begin and end
-    ndays = (end - begin).days + 1
-    date_list = [begin + timedelta(days=x) for x in range(0, ndays)]
-    # Build kwargs
-    kwargs = {'sensor_codes': sensor_codes,
-              'south': south,
-              'north': north,
-              'west': west,
-              'east': east,
-              'data_root': data_root,
-              'binning_resolution': binning_resolution,
-              'mapping_resolution': mapping_resolution,
-              'day_vars': day_vars,
-              'night_vars': night_vars,
-              'flags': flags,
-              'proj': proj,
-              'overwrite': overwrite}
-    # Run wrapper for every date with // support
-    pool = mp.Pool(n_threads)
-    pool.map_async(functools.partial(bin_map_wrapper, **kwargs), date_list).get(9999999)
+    if date_list is None:
+        if type(begin) is str:
+            begin = datetime.strptime(begin, "%Y-%m-%d")
+        if type(end) is str:
+            end = datetime.strptime(end, "%Y-%m-%d")
+        # Get list of individual dates between begin and end
+        ndays = (end - begin).days + 1
+        date_list = [begin + timedelta(days=x) for x in range(0, ndays)]
+    graph = processing_graph(data_root, south=south, north=north, west=west, east=east,
+                             date_list=date_list, sensor_codes=sensor_codes,
+                             day_vars=day_vars, night_vars=night_vars,
+                             binning_resolution=binning_resolution,
+                             mapping_resolution=mapping_resolution, flags=flags,
+                             proj=proj, overwrite=overwrite)
+    graph.run(limits={'cpu': n_threads}, journal=journal, resume=resume, verify=verify)
 
 def l3bin_wrapper(sensor_codes, date_list, suite_list, south, north, west, east,
                   composite, data_root, overwrite=False):
@@ -560,7 +613,8 @@ def l3bin_wrapper(sensor_codes, date_list, suite_list, south, north, west, east,
         east (float): Eastern border of output extent (in DD)
         data_root (str): Root of the data archive
         composite (str): Composite type (8DAY, MON)
-        overwrite (bool): Overwrite existing files?
+        overwrite (bool or str): Overwrite existing files? 'auto' only rebuilds the
+            files whose inputs changed (see satmo.dependencies)
 
     Returns:
         list: List of L3b files generated. Mostly used for its side effect of generating
@@ -641,9 +695,74 @@ def l3bin_map_wrapper(date_list, sensor_codes, var_list, south, north, west, eas
                         pprint('Error while running l3mapgen on %s, %s composite. %s' % (var, composite, e))
 
 
+def l3bin_map_graph(dateList_list, sensor_codes, var_list, south, north, west, east,
+                    composite, data_root, mapping_resolution=1000, night=False,
+                    proj=None, overwrite=False):
+    """Build the graph of the l3bin and l3mapgen tasks of temporal composites
+
+    Same processing as l3bin_map_wrapper, with one task per L3b composite (period,
+    sensor, suite) and one task per L3m file (period, sensor, variable), depending
+    on its L3b composite. Combinations without daily L3b input are left out.
+
+    Args:
+        dateList_list (list): List of composite periods, each a list of dates (see
+            pre_compose)
+        others (*): See l3bin_map_wrapper
+
+    Returns:
+        satmo.TaskGraph: The graph, ready to run
+
+    Examples:
+        >>> import satmo
+
+        >>> graph = satmo.l3bin_map_graph(satmo.pre_compose('2017-01-01', '2017-01-31', 8),
+                                          ['A', 'T', 'V'], ['chlor_a', 'nflh'], 3, 33,
+                                          -122, -72, '8DAY',
+                                          '/export/isilon/datos2/satmo2_data')
+        >>> graph.run(limits={'cpu': 8})
+    """
+    graph = TaskGraph()
+    dn = 'night' if night else 'day'
+    var_dict = defaultdict(list)
+    for var in OrderedDict.fromkeys(var_list):
+        var_dict[L3_SUITE_FROM_VAR[dn][var]].append(var)
+    resolution = to_km('%dm' % mapping_resolution)
+    for date_list in dateList_list:
+        for sensor_code in sensor_codes:
+            for suite, suite_vars in sorted(var_dict.items()):
+                file_list = []
+                for date in date_list:
+                    file_list += file_finder(data_root=data_root, date=date, level='L3b',
+                                             suite=suite, sensor_code=sensor_code,
+                                             composite='DAY')[:1]
+                if not file_list:
+                    continue
+                l3b_file = filename_builder(level='L3b', full_path=True, data_root=data_root,
+                                            date=min(date_list), sensor_code=sensor_code,
+                                            suite=suite, composite=composite)
+                l3b_task = graph.add(os.path.basename(l3b_file), l3bin,
+                                     kwargs={'file_list': file_list, 'north': north,
+                                             'south': south, 'west': west, 'east': east,
+                                             'filename': l3b_file, 'overwrite': overwrite})
+                for var in suite_vars:
+                    l3m_file = filename_builder(level='L3m', full_path=True,
+                                                data_root=data_root, filename=l3b_file,
+                                                composite=composite, variable=var,
+                                                resolution=resolution)
+                    graph.add(os.path.basename(l3m_file), l3mapgen,
+                              kwargs={'x': l3b_file, 'variable': var, 'south': south,
+                                      'north': north, 'west': west, 'east': east,
+                                      'filename': l3m_file, 'resolution': mapping_resolution,
+                                      'proj': proj, 'composite': composite,
+                                      'overwrite': overwrite},
+                              deps=[l3b_task])
+    return graph
+
+
 def l3bin_map_batcher(begin, end, delta, sensor_codes, var_list, south, north,
                       west, east, composite, data_root, mapping_resolution=1000,
-                      night=False, proj=None, overwrite=False, n_threads=1):
+                      night=False, proj=None, overwrite=False, n_threads=1,
+                      date_list=None):
     """Takes a begin date, an end date and a compositing period to batch process temporal composites
 
     Uses the l3bin and l3mapgen seadas utilities and support parallel processing
@@ -652,38 +771,47 @@ def l3bin_map_batcher(begin, end, delta, sensor_codes, var_list, south, north,
         begin (datetime.datetime or str): Begin date of the first composite
         end (datetime.datetime or str): Begin date of the last composite
         delta (int or str): composite length in days if int, 'month' if str.
+        date_list (list): Optional list of dates (e.g. begin dates of composites
+            obtained with satmo.work_dates). The composites these dates belong to
+            are processed; begin and end are ignored when set
+        n_threads (int): Number of l3bin and l3mapgen runs in parallel. Composites,
+            sensors, suites and variables are processed concurrently (see
+            l3bin_map_graph)
+        others (*): See l3bin_map_wrapper
     """
-    if type(begin) is str:
-        begin = datetime.strptime(begin, "%Y-%m-%d")
-    if type(end) is str:
-        end = datetime.strptime(end, "%Y-%m-%d")
-    dateList_list = pre_compose(begin, end, delta)
-    kwargs = {'sensor_codes': sensor_codes,
-              'var_list': var_list,
-              'south': south,
-              'north': north,
-              'west': west,
-              'east': east,
-              'composite': composite,
-              'data_root': data_root,
-              'mapping_resolution': mapping_resolution,
-              'night': night,
-              'proj': proj,
-              'overwrite': overwrite}
-    # Run wrapper for every date with // support
-    pool = mp.Pool(n_threads)
-    pool.map_async(functools.partial(l3bin_map_wrapper, **kwargs), dateList_list).get(9999999)
-
-
-def subscriptions_download(sub_list, data_root, refined=False):
+    if date_list is not None:
+        dateList_list = []
+        for date in date_list:
+            dates = find_composite_date_list(date, delta)
+            if dates not in dateList_list:
+                dateList_list.append(dates)
+    else:
+        if type(begin) is str:
+            begin = datetime.strptime(begin, "%Y-%m-%d")
+        if type(end) is str:
+            end = datetime.strptime(end, "%Y-%m-%d")
+        dateList_list = pre_compose(begin, end, delta)
+    graph = l3bin_map_graph(dateList_list, sensor_codes=sensor_codes, var_list=var_list,
+                            south=south, north=north, west=west, east=east,
+                            composite=composite, data_root=data_root,
+                            mapping_resolution=mapping_resolution, night=night,
+                            proj=proj, overwrite=overwrite)
+    graph.run(limits={'cpu': n_threads})
+
+
+def subscriptions_download(sub_list, data_root, refined=False, n_workers=4):
     """Update a local archive using a list of data subscription numbers
 
     Args:
         sub_list (list of int): List of subscription numbers
         data_root (str): Root of the data archive
         refined (bool): Do the subscriptions refer to refined processing data (defaults
-            to True), in which case the function will compare file size between the
-            local and remote archives before deciding or not to download the file.
+            to True), in which case files already present in the local archive are
+            compared to the remote ones using the checksum manifests of the
+            subscriptions, and only downloaded again when they differ. Files absent
+            from the manifests are compared by size.
+        n_workers (int): Number of simultaneous downloads (see download_many), and
+            of processes verifying local files
 
     Returns:
         list: A list of file paths corresponding to the local paths of downloaded files
@@ -703,21 +831,33 @@ def subscriptions_download(sub_list, data_root, refined=False):
         url_list_list = [get_subscription_urls(x) for x in sub_list]
         # Flatten list (becuase it would be a list of lists)
         url_list = [item for sublist in url_list_list for item in sublist]
-        # Run download_robust for each element of the list (for loop)
+        manifest = {}
+        if refined:
+            # One request per subscription instead of one per file
+            for x in sub_list:
+                manifest.update(get_subscription_checksums(x))
+            missing, changed, unknown = compare_manifest(url_list, manifest, data_root,
+                                                         n_workers=n_workers)
+            jobs = [(missing + changed, True, False), (unknown, False, True)]
+        else:
+            jobs = [(url_list, False, False)]
+        # Download concurrently, and filter the files that were not downloaded
         dl_list = []
-        for url in url_list:
-            dl_list.append(download_robust(url, base_dir=data_root,
-                            check_integrity=refined))
-        # Filter dl_list
-        dl_list = [x for x in dl_list if x is not None]
-        return dl_list
+        for urls, overwrite, check_integrity in jobs:
+            dl_list += [x for _, x in download_many(urls, base_dir=data_root,
+                                                    n_workers=n_workers,
+                                                    overwrite=overwrite,
+                                                    check_integrity=check_integrity,
+                                                    checksums=manifest)]
+        return [x for x in dl_list if x is not None]
     except Exception as e:
         pprint('There was a problem on %s with download. %s' % (datetime.now().strftime('%d %h at %H:%M'), e))
         return []
 
 def nrt_wrapper(day_or_night, pp_type, var_list, north, south, west, east,
                 data_root, binning_resolution = 1, mapping_resolution = 1000,
-                eight_day=False, month=False, flags=None, proj=None):
+                eight_day=False, month=False, flags=None, proj=None,
+                incremental=False):
     """Main wrapper to be called from CLI for NRT operation of the system
 
     Args:
@@ -739,6 +879,10 @@ def nrt_wrapper(day_or_night, pp_type, var_list, north, south, west, east,
         proj (str): Optional proj4 string. If None (default), a longlat is used
         eight_day (bool): Generate 8 days temporal composites (defaults to False)
         month (bool): Generate monthly temporal composites (defaults to False)
+        incremental (bool): Update the 8 days and monthly composites incrementally
+            from the daily L3m of each sensor (see update_time_composite), rather
+            than re-running l3bin and l3mapgen on the full compositing period.
+            Defaults to False
 
     Returns:
         The function is used for it's side effects of downloading data, and processing
@@ -796,7 +940,7 @@ def nrt_wrapper(day_or_night, pp_type, var_list, north, south, west, east,
             try:
                 suite = L3_SUITE_FROM_VAR[day_or_night][var]
                 l2mapgen(f, south=south, north=north, west=west, east=east,
-                         prod=var, flags=FLAGS[suite], data_root=data_root, overwrite=True)
+                         prod=var, flags=FLAGS[suite], data_root=data_root, overwrite='auto')
             except Exception as e:
                 pprint('L2m file not generated for %s, variable %s. %s' % (f, var, e))
     date_list = get_date_list(dl_list)
@@ -805,17 +949,31 @@ def nrt_wrapper(day_or_night, pp_type, var_list, north, south, west, east,
                         south=south, west=west, east=east, data_root=data_root,
                         binning_resolution=binning_resolution,
                         mapping_resolution=mapping_resolution, day_vars=day_vars,
-                        night_vars=night_vars, flags=flags, proj=proj, overwrite=True)
+                        night_vars=night_vars, flags=flags, proj=proj, overwrite='auto')
+    if incremental:
+        composites = [c for c, b in [('8DAY', eight_day), ('MO', month)] if b]
+        resolution = resolution_to_km_str(mapping_resolution)
+        for composite, dt, sensor_code, var in itertools.product(composites, date_list,
+                                                                 ['A', 'T', 'V'], var_list):
+            try:
+                suite = L3_SUITE_FROM_VAR[day_or_night][var]
+                update_time_composite(date=dt, var=var, suite=suite,
+                                      resolution=resolution, composite=composite,
+                                      data_root=data_root, sensor_code=sensor_code)
+            except Exception as e:
+                pprint('%s composite not updated for %s, %s. %s' % (composite, var,
+                                                                    sensor_code, e))
+        return
     if eight_day:
-        # Might re-run several times the same composite, but this is not so computationally
-        # expensive
+        # Might run several times on the same composite, but only the outdated
+        # files get rebuilt
         for dt in date_list:
             input_dates = find_composite_date_list(dt, 8)
             l3bin_map_wrapper(date_list=input_dates, sensor_codes=['A', 'T', 'V'],
                               var_list=var_list, south=south, north=north, west=west,
                               east=east, composite='8DAY', data_root=data_root,
                               mapping_resolution=mapping_resolution, night=not(day),
-                              proj=proj, overwrite=True)
+                              proj=proj, overwrite='auto')
 
     if month:
             input_dates = find_composite_date_list(dt, 'month')
@@ -823,7 +981,7 @@ def nrt_wrapper(day_or_night, pp_type, var_list, north, south, west, east,
                               var_list=var_list, south=south, north=north, west=west,
                               east=east, composite='MO', data_root=data_root,
                               mapping_resolution=mapping_resolution, night=not(day),
-                              proj=proj, overwrite=True)
+                              proj=proj, overwrite='auto')
 
 def _l2gen_safe(x, suite, data_root, night, get_anc):
     """Custom function for l2gen that allows calling it in parallel on a list of L1A files
@@ -861,29 +1019,56 @@ def nrt_wrapper_l1(north, south, west, east, var_list, data_root, n_threads=1):
     """
     # 1 - Download data
     try:
-        file_list = subscriptions_download(SUBSCRIPTIONS['L1A']['day'],
-                                           data_root=data_root, refined=False)
+        url_list = [url for sub in SUBSCRIPTIONS['L1A']['day']
+                    for url in get_subscription_urls(sub)]
     except Exception as e:
         # Exit function if the download did not work because there would be nothing
         # to do anyway
         pprint('Data download did not work properly. %s' % e)
         return
-    # Check that something got downloaded
-    if not file_list:
-        # Exit function in case no files were downloaded
-        return
-    # Process every L1A file to L2 with error catching
-    L2_list = []
-    # Remove Geo files from file_list
-    file_list = [x for x in file_list if filename_parser(x)['level'] != 'GEO']
+    # 2 - Process every L1A file to L2 with error catching, as soon as it is
+    # downloaded. VIIRS granules also wait for their GEO file
     kwargs = {'suite': 'OC2',
               'data_root': data_root,
               'night': False,
               'get_anc': True}
-    # Run wrapper for every L1a file with // support
-    pool = mp.Pool(n_threads)
-    L2_list = pool.map_async(functools.partial(_l2gen_safe, **kwargs),
-                             file_list).get(9999999)
+    # As in parallel_map, l2gen runs in the current process with a single thread
+    if n_threads > 1 and not in_worker():
+        pool = get_pool(n_threads)
+    else:
+        pool = None
+    geo_files = set(path_builder(x, data_root=data_root) for x in url_list
+                    if filename_parser(x)['level'] == 'GEO')
+    waiting = {}
+    results = []
+    def process(x):
+        if pool is None:
+            results.append(_l2gen_safe(x, **kwargs))
+        else:
+            results.append(pool.apply_async(_l2gen_safe, (x,), kwargs))
+    try:
+        for url, x in download_many(url_list, base_dir=data_root):
+            local_file = path_builder(url, data_root=data_root)
+            if filename_parser(local_file)['level'] == 'GEO':
+                geo_files.discard(local_file)
+                if local_file in waiting:
+                    process(waiting.pop(local_file))
+                continue
+            if x is None:
+                continue
+            if viirs_geo_filename_builder(x) in geo_files:
+                waiting[viirs_geo_filename_builder(x)] = x
+                continue
+            process(x)
+        if pool is None:
+            L2_list = results
+        else:
+            # Use of get(9999999) enables KeyboardInterrupt to work
+            L2_list = [x.get(9999999) for x in results]
+    except KeyboardInterrupt:
+        if pool is not None:
+            shutdown_pools(terminate=True, names=['default'])
+        raise
     # Clean list (may contain Nones where l2gen failed)
     L2_list = [x for x in L2_list if x is not None]
     # For each L2 file, append AFAI to netCDF file
@@ -936,3 +1121,253 @@ def refined_processing_wrapper_l1(north, south, west, east, var_list, data_root,
                          prod=var, flags=FLAGS[suite], data_root=data_root)
             except Exception as e:
                 pprint('Problem while generating L2m file from %s. %s' % (L2_file, e))
+
+def processing_graph(data_root, south, north, west, east, date_list=None, urls=None,
+                     sensor_codes=('A', 'T', 'V'), day_vars=None, night_vars=None,
+                     l2m_vars=None, l1a=False, binning_resolution=1,
+                     mapping_resolution=1000, flags=None, proj=None,
+                     daily_composite=False, composites=None, fun='mean', preview=False,
+                     overwrite='auto', get_anc=True):
+    """Build the graph of the processing tasks of the full processing chain
+
+    Every product is a task of a TaskGraph, with the tasks producing its inputs as
+    dependencies:
+
+        - download of a granule (resource 'io')
+        - L2 from L1A with l2gen (when l1a is True)
+        - L2m with l2mapgen
+        - daily L3b with l2bin, and L3m with l3mapgen
+        - daily multi-sensor composites (when daily_composite is True)
+        - temporal composites of the daily L3m files (of the daily multi-sensor
+          composites when daily_composite is True)
+        - png previews (when preview is True)
+
+    Inputs are the files of the archive for the dates of date_list, and the files
+    of urls, which do not need to be downloaded yet. Running the graph
+    (TaskGraph.run) processes independent sensors, suites and dates concurrently.
+
+    Args:
+        data_root (str): Root of the data archive
+        south (float): Southern border of output extent (in DD)
+        north (float): Northern border of output extent (in DD)
+        west (float): Western border of output extent (in DD)
+        east (float): Eastern border of output extent (in DD)
+        date_list (list): List of dates (datetime or 'yyyy-mm-dd') to process
+        urls (list): List of urls of L1A, GEO or L2 granules to download and
+            process. Their dates are added to date_list
+        sensor_codes (list): List of sensor codes to process
+        day_vars (list): Day variables to bin and map (see bin_map_wrapper)
+        night_vars (list): Night variables to bin and map (see bin_map_wrapper)
+        l2m_vars (list): Variables to map from individual L2 files with l2mapgen
+        l1a (bool): Process L1A files to L2. Defaults to False
+        binning_resolution (int or str): See resolve argument in l2bin doc
+        mapping_resolution (int): Resolution of the L3m files in meters
+        flags (list): Flags used by l2bin (see bin_map_wrapper)
+        proj (str): Optional proj4 string of the L3m files (see l3mapgen)
+        daily_composite (bool): Produce daily multi-sensor composites
+        composites (list): Temporal composites to produce (e.g. ['8DAY', 'MO'])
+        fun (str): Compositing function of the composites. Defaults to 'mean'
+        preview (bool): Produce png previews of the L3m files
+        overwrite (bool or str): See l2bin. Defaults to 'auto', which only
+            rebuilds the outdated files (see satmo.dependencies)
+        get_anc (bool): Download ancillary data for l2gen
+
+    Returns:
+        satmo.TaskGraph: The graph, ready to run
+
+    Examples:
+        >>> import satmo
+
+        >>> graph = satmo.processing_graph('/export/isilon/datos2/satmo2_data', 3, 33, -122, -72,
+                                           date_list=['2017-06-01', '2017-06-02'],
+                                           day_vars=['chlor_a', 'sst'], night_vars=['sst'],
+                                           daily_composite=True, composites=['8DAY', 'MO'],
+                                           preview=True)
+        >>> graph.run(limits={'cpu': 16, 'io': 4})
+    """
+    graph = TaskGraph()
+    resolution = to_km('%dm' % mapping_resolution)
+
+    def _day(x):
+        return datetime(x.year, x.month, x.day)
+
+    def _preview(filename):
+        if preview:
+            graph.add(os.path.splitext(os.path.basename(filename))[0] + '.png', make_preview,
+                      args=(filename,), deps=[pending[filename]])
+
+    dates = set()
+    for date in date_list or []:
+        if type(date) is str:
+            date = datetime.strptime(date, "%Y-%m-%d")
+        dates.add(_day(date))
+    # Files that do not exist yet, and the task that produces them
+    pending = {}
+    for url in urls or []:
+        filename = path_builder(url, data_root=data_root)
+        pending[filename] = graph.add(os.path.basename(filename), download_robust,
+                                      args=(url, data_root), resource='io')
+        meta = filename_parser(filename)
+        if meta['level'] in ['L1A', 'L2'] and meta['sensor_code'] in sensor_codes:
+            dates.add(_day(meta['date']))
+    dates = sorted(dates)
+    # Variables of every L3 suite, and corresponding L2 suites
+    suite_vars = {}
+    l2_suites = {}
+    for sensor_code in sensor_codes:
+        sensor = SENSOR_CODES[sensor_code]
+        suite_vars[sensor_code] = {'day': _suite_vars(day_vars or [], 'day', sensor),
+                                   'night': _suite_vars(night_vars or [], 'night', sensor)}
+        l2_suites[sensor_code] = {}
+        for dn in ['day', 'night']:
+            l2_suites[sensor_code][dn] = set(L2_L3_SUITES_CORRESPONDENCES[x]
+                                             for x in suite_vars[sensor_code][dn])
+    l2m_suites = {}
+    for dn in ['day', 'night']:
+        for var in l2m_vars or []:
+            try:
+                l2m_suites[(dn, var)] = L3_SUITE_FROM_VAR[dn][var]
+            except KeyError:
+                continue
+
+    def _inputs(level, suites=None):
+        """Existing and pending files of a level for the sensors and dates processed"""
+        file_list = set(x for x in pending if filename_parser(x)['level'] == level)
+        for date, sensor_code in itertools.product(dates, sensor_codes):
+            for suite in suites or [None]:
+                file_list.update(file_finder(data_root=data_root, date=date, level=level,
+                                             suite=suite, sensor_code=sensor_code))
+        file_list = [x for x in file_list if filename_parser(x)['sensor_code'] in sensor_codes
+                     and _day(filename_parser(x)['date']) in dates]
+        return sorted(file_list)
+
+    # L1A --> L2
+    if l1a:
+        for x in _inputs('L1A'):
+            meta = filename_parser(x)
+            dn = 'day' if is_day(x) else 'night'
+            # L1A and GEO downloads of the granule
+            deps = [task for y, task in pending.items()
+                    if filename_parser(y)['level'] in ['L1A', 'GEO'] and
+                    filename_parser(y)['sensor_code'] == meta['sensor_code'] and
+                    filename_parser(y)['date'] == meta['date'] and
+                    filename_parser(y)['time'] == meta['time']]
+            for l2_suite in sorted(l2_suites[meta['sensor_code']][dn]):
+                try:
+                    var_list = VARS_FROM_L2_SUITE[meta['sensor']][dn][l2_suite]
+                except KeyError:
+                    continue
+                l2_file = filename_builder(level='L2', filename=x, suite=l2_suite,
+                                           full_path=True, data_root=data_root)
+                if not deps and not needs_build(l2_file, [x], overwrite):
+                    continue
+                pending[l2_file] = graph.add(os.path.basename(l2_file), l2gen,
+                                             kwargs={'x': x, 'var_list': var_list,
+                                                     'suite': l2_suite,
+                                                     'data_root': data_root,
+                                                     'get_anc': get_anc},
+                                             deps=deps)
+    # Group L2 files by sensor, date, day/night and suite
+    all_l2_suites = set(L2_L3_SUITES_CORRESPONDENCES.get(x) for x in l2m_suites.values())
+    for sensor_code in sensor_codes:
+        all_l2_suites.update(*l2_suites[sensor_code].values())
+    l2_groups = defaultdict(list)
+    for x in _inputs('L2', sorted(x for x in all_l2_suites if x is not None)):
+        meta = filename_parser(x)
+        dn = 'day' if is_day(x) else 'night'
+        l2_groups[(meta['sensor_code'], _day(meta['date']), dn, meta['suite'])].append(x)
+    day_products = {}
+    for (sensor_code, date, dn, l2_suite), file_list in sorted(l2_groups.items()):
+        # L2 --> L2m
+        for var in l2m_vars or []:
+            suite = l2m_suites.get((dn, var))
+            if suite is None or L2_L3_SUITES_CORRESPONDENCES.get(suite) != l2_suite:
+                continue
+            for x in file_list:
+                l2m_file = filename_builder(level='L2m', filename=x, suite=suite,
+                                            variable=var, full_path=True,
+                                            data_root=data_root)
+                # An L2 file being (re)processed makes its L2m outdated
+                outdated = x in pending and overwrite == 'auto'
+                if not outdated and not needs_build(l2m_file, [x], overwrite):
+                    continue
+                graph.add(os.path.basename(l2m_file), l2mapgen,
+                          kwargs={'x': x, 'north': north, 'south': south, 'west': west,
+                                  'east': east, 'prod': var, 'flags': FLAGS[suite],
+                                  'data_root': data_root, 'filename': l2m_file,
+                                  'overwrite': overwrite},
+                          deps=[pending[x]] if x in pending else [])
+        # L2 --> L3b --> L3m
+        for suite, var_list in sorted(suite_vars[sensor_code][dn].items()):
+            if L2_L3_SUITES_CORRESPONDENCES[suite] != l2_suite:
+                continue
+            l3b_file = filename_builder(level='L3b', full_path=True, data_root=data_root,
+                                        suite=suite, filename=file_list[0], composite='DAY')
+            pending[l3b_file] = graph.add(os.path.basename(l3b_file), l2bin,
+                                          kwargs={'file_list': file_list, 'L3b_suite': suite,
+                                                  'var_list': var_list,
+                                                  'resolution': binning_resolution,
+                                                  'night': dn == 'night',
+                                                  'filename': l3b_file,
+                                                  'overwrite': overwrite, 'flags': flags},
+                                          deps=[pending[x] for x in file_list if x in pending])
+            for var in sorted(var_list):
+                l3m_file = filename_builder(level='L3m', full_path=True, data_root=data_root,
+                                            filename=l3b_file, composite='DAY', variable=var,
+                                            resolution=resolution)
+                pending[l3m_file] = graph.add(os.path.basename(l3m_file), l3mapgen,
+                                              kwargs={'x': l3b_file, 'variable': var,
+                                                      'south': south, 'north': north,
+                                                      'west': west, 'east': east,
+                                                      'filename': l3m_file,
+                                                      'resolution': mapping_resolution,
+                                                      'proj': proj, 'overwrite': overwrite},
+                                              deps=[pending[l3b_file]])
+                _preview(l3m_file)
+                day_products[(sensor_code, date, suite, var)] = l3m_file
+    # L3m --> daily multi-sensor composite
+    if daily_composite:
+        groups = defaultdict(list)
+        for (sensor_code, date, suite, var), filename in sorted(day_products.items()):
+            groups[(date, suite, var)].append(filename)
+        day_products = {}
+        for (date, suite, var), file_list in sorted(groups.items()):
+            x_file = filename_builder(level='L3m', full_path=True, data_root=data_root,
+                                      date=date, sensor_code='X', suite=suite,
+                                      composite='DAY', variable=var, resolution=resolution)
+            pending[x_file] = graph.add(os.path.basename(x_file), make_daily_composite,
+                                        kwargs={'date': date, 'variable': var, 'suite': suite,
+                                                'data_root': data_root,
+                                                'resolution': resolution, 'fun': fun,
+                                                'filename': x_file, 'preview': False,
+                                                'overwrite': overwrite},
+                                        deps=[pending[x] for x in file_list])
+            _preview(x_file)
+            day_products[('X', date, suite, var)] = x_file
+    # Daily L3m --> temporal composites
+    for composite in composites or []:
+        delta = COMPOSITE_DELTAS[composite]
+        groups = defaultdict(list)
+        for (sensor_code, date, suite, var), filename in sorted(day_products.items()):
+            period = tuple(find_composite_date_list(date, delta))
+            groups[(sensor_code, period, suite, var)].append(filename)
+        for (sensor_code, period, suite, var), file_list in sorted(groups.items()):
+            composite_file = filename_builder(level='L3m', full_path=True, data_root=data_root,
+                                              date=period[0], sensor_code=sensor_code,
+                                              suite=suite, composite=composite, variable=var,
+                                              resolution=resolution)
+            pending[composite_file] = graph.add(os.path.basename(composite_file),
+                                                make_time_composite,
+                                                kwargs={'date_list': list(period), 'var': var,
+                                                        'suite': suite,
+                                                        'resolution': resolution,
+                                                        'composite': composite,
+                                                        'data_root': data_root,
+                                                        'sensor_code': sensor_code,
+                                                        'fun': fun,
+                                                        'filename': composite_file,
+                                                        'overwrite': overwrite,
+                                                        'preview': False},
+                                                deps=[pending[x] for x in file_list])
+            _preview(composite_file)
+    return graph
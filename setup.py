@@ -45,6 +45,7 @@ setup(name='satmo',
                'satmo/scripts/timerange_time_compositing.py',
                'satmo/scripts/timerange_daily_composite.py',
                'satmo/scripts/satmo_nrt.py',
-               'satmo/scripts/make_preview.py'],
+               'satmo/scripts/make_preview.py',
+               'satmo/scripts/update_catalog.py'],
       test_suite="tests",
       extras_require=extra_reqs)
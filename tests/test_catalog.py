@@ -0,0 +1,112 @@
+import satmo
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.data_root = tempfile.mkdtemp()
+        self.catalog = satmo.Catalog(os.path.join(self.data_root, 'catalog.sqlite'))
+        file_list = []
+        for doy in range(1, 4):
+            date = datetime.strptime('2016%03d' % doy, '%Y%j')
+            for sensor_code in ['A', 'T']:
+                for suite in ['OC', 'SST']:
+                    file_list.append(satmo.filename_builder(
+                        level='L2', full_path=True, data_root=self.data_root,
+                        filename='%s2016%03d180000.L1A_LAC.bz2' % (sensor_code, doy),
+                        suite=suite))
+                file_list.append(satmo.filename_builder(
+                    level='L3m', full_path=True, data_root=self.data_root, date=date,
+                    sensor_code=sensor_code, suite='CHL', composite='DAY',
+                    variable='chlor_a', resolution='1km'))
+        for filename in file_list:
+            if not os.path.exists(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            open(filename, 'w').close()
+        self.file_list = file_list
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.data_root)
+
+    def test_scan(self):
+        # The catalog database itself is not a valid data name
+        self.assertEqual(self.catalog.scan(self.data_root), len(self.file_list))
+        self.assertEqual(self.catalog.scan(self.data_root), len(self.file_list))
+        self.assertEqual(len(self.catalog.query(level='L2', suite='OC', begin='2016-01-02',
+                                                end='2016-01-03')), 4)
+
+    def test_update(self):
+        self.assertEqual(self.catalog.update(self.data_root), len(self.file_list))
+        # Nothing changed, no directory is listed again
+        self.assertEqual(self.catalog.update(self.data_root), 0)
+        os.remove(self.file_list[0])
+        shutil.rmtree(os.path.dirname(self.file_list[-1]))
+        # Make the modification visible despite coarse mtime resolution
+        os.utime(os.path.dirname(self.file_list[0]), (0, 0))
+        self.catalog.update(self.data_root)
+        self.assertEqual(sorted(self.catalog.query()), sorted(self.file_list[1:-1]))
+
+    def test_file_finder(self):
+        # Catalog queries return the same files as glob searches
+        self.catalog.scan(self.data_root)
+        queries = [{'level': 'L2', 'suite': 'OC'},
+                   {'level': 'L2', 'suite': 'SST', 'sensor_code': 'T'},
+                   {'level': 'L3m', 'suite': 'CHL', 'variable': 'chlor_a',
+                    'resolution': '1km', 'composite': 'DAY'}]
+        for kwargs in queries:
+            self.assertEqual(
+                sorted(satmo.file_finder(self.data_root, '2016-01-02', catalog=self.catalog,
+                                         **kwargs)),
+                sorted(satmo.file_finder(self.data_root, '2016-01-02', catalog=False,
+                                         **kwargs)))
+        self.assertEqual(sorted(satmo.path_finder(self.data_root, '2016-01-02', 'L2',
+                                                  catalog=self.catalog)),
+                         sorted(satmo.path_finder(self.data_root, '2016-01-02', 'L2',
+                                                  catalog=False)))
+        self.catalog.remove(self.file_list[0])
+        self.assertEqual(len(satmo.file_finder(self.data_root, '2016-01-01', 'L2', suite='OC',
+                                               catalog=self.catalog)), 1)
+
+    def test_checksums(self):
+        urls = ['https://oceandata.sci.gsfc.nasa.gov/cgi/getfile/A2016001%02d0000.L1A_LAC.bz2' % x
+                for x in range(4)]
+        local = [satmo.path_builder(x, data_root=self.data_root) for x in urls]
+        os.makedirs(os.path.dirname(local[0]))
+        for i, filename in enumerate(local[:3]):
+            with open(filename, 'w') as dst:
+                dst.write(str(i))
+        satmo.set_catalog(self.catalog)
+        try:
+            # Written files are only hashed on request
+            satmo.catalog.register(local[:3])
+            self.assertEqual(self.catalog.checksums(local), {})
+            satmo.catalog.register(local[:3], compute=True)
+            checksums = self.catalog.checksums(local)
+            self.assertEqual(sorted(checksums), sorted(local[:3]))
+            self.assertEqual(checksums[local[0]], satmo.file_checksum(local[0]))
+            # Checksums of unchanged files survive updates and scans
+            os.utime(os.path.dirname(local[0]), (0, 0))
+            self.catalog.update(self.data_root)
+            self.catalog.scan(self.data_root)
+            self.assertEqual(self.catalog.checksums(local), checksums)
+            manifest = {os.path.basename(urls[0]): checksums[local[0]],
+                        os.path.basename(urls[1]): checksums[local[0]]}
+            self.assertEqual(satmo.compare_manifest(urls, manifest, self.data_root, n_workers=2),
+                             ([urls[3]], [urls[1]], [urls[2]]))
+            # Modified files are verified again
+            with open(local[1], 'w') as dst:
+                dst.write('00')
+            self.assertNotIn(local[1], self.catalog.checksums(local))
+            self.assertEqual(satmo.local_checksums(local, n_workers=2)[local[1]],
+                             satmo.file_checksum(local[1]))
+            self.assertIn(local[1], self.catalog.checksums(local))
+        finally:
+            satmo.set_catalog(None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import satmo
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+class TestCompleteness(unittest.TestCase):
+
+    def setUp(self):
+        self.data_root = tempfile.mkdtemp()
+        self.catalog = satmo.Catalog(os.path.join(self.data_root, 'catalog.sqlite'))
+        self.kwargs = {'begin': '2016-01-01', 'end': '2016-01-02', 'sensor_codes': ['A'],
+                       'data_root': self.data_root, 'day_vars': ['chlor_a'],
+                       'catalog': self.catalog}
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.data_root)
+
+    def _touch(self, mtime, **kwargs):
+        filename = satmo.filename_builder(full_path=True, data_root=self.data_root, **kwargs)
+        if not os.path.exists(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        open(filename, 'w').close()
+        os.utime(filename, (mtime, mtime))
+        self.catalog.add(filename)
+        return filename
+
+    def test_find_gaps(self):
+        for doy in [1, 2]:
+            self._touch(100, level='L2', suite='OC',
+                        filename='A201600%d180000.L1A_LAC.bz2' % doy)
+        self._touch(200, level='L3b', sensor_code='A', date=datetime(2016, 1, 1),
+                    suite='CHL', composite='DAY')
+        l3m = self._touch(300, level='L3m', sensor_code='A', date=datetime(2016, 1, 1),
+                          suite='CHL', variable='chlor_a', composite='DAY', resolution='1km')
+        work_list = satmo.find_gaps(**self.kwargs)
+        self.assertEqual([(x.level, x.status, x.date.day) for x in work_list],
+                         [('L3b', 'missing', 2), ('L3m', 'missing', 2)])
+        self.assertEqual(work_list[1].inputs, [work_list[0].filename])
+        # A refined L2 makes the products of the first day stale, and a missing
+        # composite is reported after its inputs
+        self._touch(400, level='L2', suite='OC', filename='A2016001180000.L1A_LAC.bz2')
+        work_list = satmo.find_gaps(composites=['8DAY'], **self.kwargs)
+        self.assertEqual([(x.level, x.status, x.composite, x.date.day) for x in work_list],
+                         [('L3b', 'stale', 'DAY', 1), ('L3b', 'missing', 'DAY', 2),
+                          ('L3b', 'missing', '8DAY', 1), ('L3m', 'upstream', 'DAY', 1),
+                          ('L3m', 'missing', 'DAY', 2), ('L3m', 'missing', '8DAY', 1)])
+        self.assertEqual(work_list[3].filename, l3m)
+        self.assertEqual(satmo.work_dates(work_list, ['L3b', 'L3m'], composite='DAY'),
+                         [datetime(2016, 1, 1), datetime(2016, 1, 2)])
+
+if __name__ == '__main__':
+    unittest.main()
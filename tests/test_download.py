@@ -0,0 +1,267 @@
+import satmo
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+import warnings
+import requests
+import BaseHTTPServer
+import SocketServer
+from SimpleHTTPServer import SimpleHTTPRequestHandler
+
+class Handler(SimpleHTTPRequestHandler):
+    """Serves the files of the current directory; drops the first request of
+    flaky files, answers the first requests of overloaded files with 503, and
+    records the number of simultaneous GET requests and the request methods"""
+    flaky = set()
+    overloaded = {}
+    methods = []
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        Handler.methods.append('HEAD')
+        SimpleHTTPRequestHandler.do_HEAD(self)
+
+    def do_GET(self):
+        Handler.methods.append('GET')
+        with Handler.lock:
+            if self.path in Handler.flaky:
+                Handler.flaky.remove(self.path)
+                self.close_connection = 1
+                return
+            if Handler.overloaded.get(self.path):
+                Handler.overloaded[self.path] -= 1
+                self.send_error(503)
+                return
+            Handler.running += 1
+            Handler.max_running = max(Handler.max_running, Handler.running)
+        time.sleep(0.1)
+        try:
+            SimpleHTTPRequestHandler.do_GET(self)
+        finally:
+            with Handler.lock:
+                Handler.running -= 1
+
+class RangeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves the files of the current directory, with support of Range requests
+    (unless ranges is False). The first transfer of the files of truncated is
+    cut in the middle. No Last-Modified header is sent when last_modified is None"""
+    truncated = set()
+    ranges = True
+    requests = []
+    last_modified = 'Fri, 01 Jan 2016 00:00:00 GMT'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        RangeHandler.requests.append((self.path, self.headers.get('Range')))
+        path = self.path.lstrip('/')
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as src:
+            data = src.read()
+        start = 0
+        if self.headers.get('Range') and RangeHandler.ranges and \
+                self.headers.get('If-Range') in [None, RangeHandler.last_modified]:
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(data) - 1,
+                                                                  len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        if RangeHandler.last_modified is not None:
+            self.send_header('Last-Modified', RangeHandler.last_modified)
+        self.end_headers()
+        data = data[start:]
+        if self.path in RangeHandler.truncated:
+            RangeHandler.truncated.remove(self.path)
+            data = data[:len(data) // 2]
+            self.close_connection = 1
+        self.wfile.write(data)
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class TestDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.remote = tempfile.mkdtemp()
+        self.data_root = tempfile.mkdtemp()
+        self.filenames = ['A2016001%02d0000.L1A_LAC.bz2' % x for x in range(6)]
+        for filename in self.filenames:
+            with open(os.path.join(self.remote, filename), 'wb') as dst:
+                dst.write(os.urandom(100000))
+        self.cwd = os.getcwd()
+        os.chdir(self.remote)
+        handler = RangeHandler if 'resume' in self.id() else Handler
+        self.server = Server(('127.0.0.1', 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+
+    def tearDown(self):
+        satmo.configure_session(**satmo.session.SESSION_DEFAULTS)
+        self.server.shutdown()
+        self.server.server_close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.remote)
+        shutil.rmtree(self.data_root)
+
+    def test_download_many(self):
+        # Connection errors are left to download_many
+        satmo.configure_session(retries=0)
+        Handler.flaky = set(['/' + self.filenames[0]])
+        Handler.max_running = 0
+        urls = [self.url + x for x in self.filenames + ['T2016001000000.L1A_LAC.bz2']]
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            results = list(satmo.download_many(urls, self.data_root, n_workers=4, per_host=2,
+                                               pause_retries=0.1))
+        self.assertEqual(len(w), 1)
+        self.assertEqual(sorted(x[0] for x in results), sorted(urls))
+        self.assertLessEqual(Handler.max_running, 2)
+        # The flaky file is retried once the other files were dispatched
+        self.assertIn(urls[0], [x[0] for x in results[-2:]])
+        for url, filename in results:
+            if url == urls[-1]:
+                self.assertIsNone(filename)
+                continue
+            self.assertEqual(filename, satmo.path_builder(url, data_root=self.data_root))
+            with open(os.path.join(self.remote, os.path.basename(url)), 'rb') as src:
+                with open(filename, 'rb') as dst:
+                    self.assertEqual(src.read(), dst.read())
+        # Existing files are not downloaded again
+        self.assertEqual([x[1] for x in satmo.download_many(urls[:2], self.data_root)],
+                         [None, None])
+
+    def test_session(self):
+        # The shared session retries the dropped request
+        Handler.flaky = set(['/' + self.filenames[0]])
+        url = self.url + self.filenames[0]
+        self.assertEqual(satmo.download_robust(url, self.data_root, n_retries=1),
+                         satmo.path_builder(url, data_root=self.data_root))
+        self.assertIs(satmo.get_session(), satmo.get_session())
+        self.assertRaises(ValueError, satmo.configure_session, retry=3)
+
+    def test_server_errors(self):
+        # Server errors outlasting the retries of the session are retried
+        satmo.configure_session(retries=1, backoff_factor=0)
+        urls = [self.url + x for x in self.filenames[:2]]
+        Handler.overloaded = {'/' + x: 2 for x in self.filenames[:2]}
+        self.assertEqual(satmo.download_robust(urls[0], self.data_root, n_retries=2,
+                                               pause_retries=0),
+                         satmo.path_builder(urls[0], data_root=self.data_root))
+        self.assertEqual(list(satmo.download_many(urls[1:], self.data_root,
+                                                  pause_retries=0.1)),
+                         [(urls[1], satmo.path_builder(urls[1], data_root=self.data_root))])
+
+    def test_check_integrity(self):
+        url = self.url + self.filenames[0]
+        filename = satmo.download_to_tree(url, self.data_root)
+        # Complete files are only verified with a HEAD request
+        Handler.methods = []
+        self.assertIsNone(satmo.download_to_tree(url, self.data_root, check_integrity=True))
+        self.assertEqual(Handler.methods, ['HEAD'])
+        # Truncated files are downloaded again
+        with open(filename, 'r+b') as dst:
+            dst.truncate(1000)
+        Handler.methods = []
+        self.assertEqual(satmo.download_to_tree(url, self.data_root, check_integrity=True),
+                         filename)
+        self.assertEqual(Handler.methods, ['HEAD', 'GET'])
+        self.assertEqual(os.path.getsize(filename), 100000)
+
+    def test_chunk_size(self):
+        url = self.url + self.filenames[0]
+        with open(os.path.join(self.remote, self.filenames[0]), 'rb') as src:
+            data = src.read()
+        for raw in [True, False]:
+            stats = {}
+            filename = satmo.download_file(url, self.data_root, overwrite=True,
+                                           chunk_size=30000, raw=raw, stats=stats)
+            with open(filename, 'rb') as dst:
+                self.assertEqual(dst.read(), data)
+            self.assertEqual(stats['bytes'], len(data))
+            self.assertGreater(stats['seconds'], 0)
+
+    def test_checksums(self):
+        url = self.url + self.filenames[0]
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            results = list(satmo.download_many([url], self.data_root, n_retries=2,
+                                               pause_retries=0.1,
+                                               checksums={self.filenames[0]: '0' * 40}))
+        # Corrupted files are downloaded again, and removed
+        self.assertEqual(results, [(url, None)])
+        self.assertEqual(len(w), 1)
+        self.assertEqual(os.listdir(os.path.dirname(satmo.path_builder(
+            url, data_root=self.data_root))), [])
+        sha1 = satmo.file_checksum(os.path.join(self.remote, self.filenames[0]))
+        self.assertIsNotNone(list(satmo.download_many([url], self.data_root,
+                                                      checksums={self.filenames[0]: sha1}))[0][1])
+
+    def test_resume(self):
+        urls = [self.url + x for x in self.filenames[:2]]
+        RangeHandler.truncated = set(['/' + x for x in self.filenames[:2]])
+        RangeHandler.requests = []
+        RangeHandler.ranges = True
+        filename = satmo.download_robust(urls[0], self.data_root, pause_retries=0)
+        # The second request only asks for the missing half of the file
+        self.assertEqual(RangeHandler.requests, [('/' + self.filenames[0], None),
+                                                 ('/' + self.filenames[0], 'bytes=50000-')])
+        with open(os.path.join(self.remote, self.filenames[0]), 'rb') as src:
+            with open(filename, 'rb') as dst:
+                self.assertEqual(src.read(), dst.read())
+        self.assertEqual(os.listdir(os.path.dirname(filename)), [self.filenames[0]])
+        # Servers without range support send the full file again
+        RangeHandler.ranges = False
+        filename = satmo.download_robust(urls[1], self.data_root, pause_retries=0)
+        with open(os.path.join(self.remote, self.filenames[1]), 'rb') as src:
+            with open(filename, 'rb') as dst:
+                self.assertEqual(src.read(), dst.read())
+
+    def test_resume_restart(self):
+        # Interrupted downloads are resumed by later calls, without in memory state
+        urls = [self.url + x for x in self.filenames[:2]]
+        RangeHandler.truncated = set(['/' + x for x in self.filenames[:2]])
+        RangeHandler.requests = []
+        RangeHandler.ranges = True
+        self.assertRaises(requests.ConnectionError, satmo.download_file, urls[0],
+                          self.data_root)
+        self.assertEqual(sorted(os.listdir(self.data_root)),
+                         ['.%s.part' % self.filenames[0],
+                          '.%s.part.validator' % self.filenames[0]])
+        filename = satmo.download_file(urls[0], self.data_root)
+        self.assertEqual(RangeHandler.requests[-1],
+                         ('/' + self.filenames[0], 'bytes=50000-'))
+        with open(os.path.join(self.remote, self.filenames[0]), 'rb') as src:
+            with open(filename, 'rb') as dst:
+                self.assertEqual(src.read(), dst.read())
+        self.assertEqual(os.listdir(self.data_root), [self.filenames[0]])
+        # Without a validator of the remote file, downloads start from scratch
+        last_modified = RangeHandler.last_modified
+        RangeHandler.last_modified = None
+        try:
+            self.assertRaises(requests.ConnectionError, satmo.download_file, urls[1],
+                              self.data_root)
+            filename = satmo.download_file(urls[1], self.data_root)
+        finally:
+            RangeHandler.last_modified = last_modified
+        self.assertEqual(RangeHandler.requests[-1], ('/' + self.filenames[1], None))
+        with open(os.path.join(self.remote, self.filenames[1]), 'rb') as src:
+            with open(filename, 'rb') as dst:
+                self.assertEqual(src.read(), dst.read())
+
+if __name__ == '__main__':
+    unittest.main()
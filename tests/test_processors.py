@@ -0,0 +1,437 @@
+import satmo
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import netCDF4 as nc
+import rasterio
+from affine import Affine
+
+
+def make_l2(filename, shape, rng):
+    """Write a small synthetic L2 granule with the groups and variables read by BasicBinMap"""
+    with nc.Dataset(filename, 'w') as dst:
+        dst.createDimension('number_of_lines', shape[0])
+        dst.createDimension('pixels_per_line', shape[1])
+        dims = ('number_of_lines', 'pixels_per_line')
+        nav = dst.createGroup('navigation_data')
+        geo = dst.createGroup('geophysical_data')
+        nav.createVariable('longitude', 'f4', dims)[:] = rng.uniform(-111, -99, shape)
+        nav.createVariable('latitude', 'f4', dims)[:] = rng.uniform(14, 26, shape)
+        # Bits 0 and 9 are part of the default mask, bit 2 is not
+        flags = rng.choice([0, 0, 0, 1, 4, 0x200], shape)
+        geo.createVariable('l2_flags', 'i4', dims)[:] = flags
+        geo.createVariable('qual_sst', 'i2', dims)[:] = rng.randint(0, 5, shape)
+        for var in ['chlor_a', 'Kd_490']:
+            values = rng.rand(*shape).astype(np.float32)
+            values[rng.rand(*shape) < 0.05] = np.nan
+            geo.createVariable(var, 'f4', dims)[:] = values
+
+def bin_task(file_list, grid, n_workers):
+    """Bin chlor_a, to be run as a TaskGraph task"""
+    bin_class = satmo.BasicBinMap(file_list, var='chlor_a', n_workers=n_workers)
+    bin_class.bin_to_grid(**grid)
+    return np.ma.filled(bin_class.output_array, np.nan)
+
+class TestBinning(unittest.TestCase):
+
+    shape = (4, 5)
+    x = np.array([0.2, 0.7, 4.99, 5.0, 2.5, -0.1, 3.3, 3.9, 1.0])
+    y = np.array([0.1, 0.9, 3.5, 4.0, 2.2, 1.0, 4.1, 0.5, 1.0])
+    values = np.array([1., 3., 2., 4., 5., 6., 7., 8., 9.])
+
+    def test_cell_index(self):
+        # Cell assignment must match np.histogram2d with unit bin edges
+        cell_ids, valid = satmo.processors._cell_index(self.x, self.y, self.shape)
+        counts = np.bincount(cell_ids, minlength=20).reshape(self.shape)
+        hist, _, _ = np.histogram2d(self.y, self.x, bins=(range(0, 5), range(0, 6)))
+        np.testing.assert_array_equal(counts, hist)
+        np.testing.assert_array_equal(valid, [True, True, True, True, True, False,
+                                              False, True, True])
+
+    def test_accumulator(self):
+        cell_ids, valid = satmo.processors._cell_index(self.x, self.y, self.shape)
+        acc = satmo.processors.BinAccumulator(self.shape, extrema=True)
+        # Adding in two batches gives the same result as adding at once
+        acc.add(cell_ids[:3], self.values[valid][:3])
+        acc.add(cell_ids[3:], self.values[valid][3:])
+        mean = acc.get('mean')
+        self.assertEqual(mean[0, 0], 2.)
+        self.assertEqual(acc.get('count')[0, 0], 2)
+        self.assertEqual(acc.get('std')[0, 0], 1.)
+        self.assertEqual(acc.get('min')[0, 0], 1.)
+        self.assertEqual(acc.get('max')[0, 0], 3.)
+        self.assertEqual(mean[3, 4], 3.)
+        self.assertTrue(np.isnan(mean[0, 1]))
+        self.assertEqual(np.isfinite(mean).sum(), 5)
+
+    def test_accumulator_merge(self):
+        cell_ids, valid = satmo.processors._cell_index(self.x, self.y, self.shape)
+        values = self.values[valid]
+        acc = satmo.processors.BinAccumulator(self.shape, extrema=True)
+        acc.add(cell_ids, values)
+        # Reducing partial grids gives the same result as a single accumulator
+        part_1 = satmo.processors.BinAccumulator(self.shape, extrema=True)
+        part_1.add(cell_ids[::2], values[::2])
+        part_2 = satmo.processors.BinAccumulator(self.shape, extrema=True)
+        part_2.add(cell_ids[1::2], values[1::2])
+        part_1.merge(part_2)
+        for stat in ['mean', 'count', 'std', 'min', 'max']:
+            np.testing.assert_array_equal(part_1.get(stat), acc.get(stat))
+
+class TestBasicBinMap(unittest.TestCase):
+
+    grid = {'south': 15, 'north': 25, 'west': -110, 'east': -100,
+            'resolution': 50000, 'proj4string': '+proj=laea +lat_0=20 +lon_0=-105'}
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        self.file_list = []
+        # Granules of different swath sizes
+        for i, shape in enumerate([(20, 15), (31, 12), (7, 40)]):
+            filename = os.path.join(self.tmp_dir, 'A20160011%d0000.L2_LAC_OC.nc' % i)
+            make_l2(filename, shape, rng)
+            self.file_list.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read(self):
+        # Preallocated single pass reader matches the former np.append concatenation
+        bin_class = satmo.BasicBinMap(self.file_list, qual_array='qual_sst',
+                                      var='chlor_a')
+        self.assertEqual(bin_class.swath_sizes, [300, 372, 280])
+        expected = {'lon_dd': np.array([]), 'lat_dd': np.array([]),
+                    'flag_array': np.array([]), 'qual_array': np.array([]),
+                    'var_array': np.array([])}
+        for file in self.file_list:
+            with nc.Dataset(file) as src:
+                nav = src.groups['navigation_data'].variables
+                geo = src.groups['geophysical_data'].variables
+                for name, x in [('lon_dd', nav['longitude']), ('lat_dd', nav['latitude']),
+                                ('flag_array', geo['l2_flags']),
+                                ('qual_array', geo['qual_sst']),
+                                ('var_array', geo['chlor_a'])]:
+                    expected[name] = np.append(expected[name], x[:].flatten())
+        dtypes = {'lon_dd': np.float32, 'lat_dd': np.float32, 'flag_array': np.uint32,
+                  'qual_array': np.int16, 'var_array': np.float32}
+        for name, dtype in dtypes.items():
+            array = getattr(bin_class, name)
+            self.assertEqual(array.dtype, dtype)
+            np.testing.assert_array_equal(array, expected[name])
+        np.testing.assert_array_equal(bin_class._read_band_all('Kd_490')[:300],
+                                      bin_class._read_band(self.file_list[0], 'Kd_490'))
+
+    def _grid_tuple(self, **kwargs):
+        grid = dict(self.grid, **kwargs)
+        return tuple(grid[x] for x in ['south', 'north', 'west', 'east', 'resolution',
+                                       'proj4string'])
+
+    def _bin(self, bin_class, **kwargs):
+        grid = dict(self.grid, **kwargs)
+        bin_class.bin_to_grid(**grid)
+        return np.ma.filled(bin_class.output_array, np.nan)
+
+    def test_apply_mask(self):
+        bin_class = satmo.BasicBinMap(self.file_list, qual_array='qual_sst', var='chlor_a')
+        bin_class.apply_mask(0x201, 2)
+        expected = self._bin(bin_class)
+        # Successive masks are combined, and can be applied before setting the variable
+        bin_class = satmo.BasicBinMap(self.file_list, qual_array='qual_sst')
+        bin_class.apply_mask(0x1, 2)
+        bin_class.apply_mask(0x200, 4)
+        bin_class.set_variable(bin_class._read_band_all('chlor_a'))
+        np.testing.assert_array_equal(self._bin(bin_class), expected)
+        # The mask is not applied to the coordinates
+        self.assertEqual(bin_class.lon_dd.size, sum(bin_class.swath_sizes))
+        self.assertTrue(np.isfinite(expected).any())
+
+    def test_stream(self):
+        # Streaming, with whole granules or blocks of lines, gives the same grids
+        # as the in memory mode, with and without masks
+        for masks in [[], [(0x0669D73B, 2)], [(0x1, 2), (0x200, 4)]]:
+            for stat in ['mean', 'std', 'count', 'max']:
+                grids = []
+                for kwargs in [{}, {'stream': True}, {'stream': True, 'block_lines': 4}]:
+                    bin_class = satmo.BasicBinMap(self.file_list, qual_array='qual_sst',
+                                                  var='chlor_a', **kwargs)
+                    for bit_mask, max_qual in masks:
+                        bin_class.apply_mask(bit_mask, max_qual)
+                    grids.append(self._bin(bin_class, stat=stat))
+                np.testing.assert_array_equal(grids[1], grids[0])
+                np.testing.assert_array_equal(grids[2], grids[0])
+        self.assertTrue(np.isnan(grids[0]).any())
+
+    def test_n_workers(self):
+        # Partial grids binned in parallel reduce to the serial grids
+        for stat in ['sum', 'count', 'mean', 'max']:
+            grids = []
+            for n_workers in [1, 2]:
+                bin_class = satmo.BasicBinMap(self.file_list, var='chlor_a',
+                                              n_workers=n_workers)
+                bin_class.apply_mask()
+                grids.append(self._bin(bin_class, stat=stat))
+            np.testing.assert_array_equal(grids[1], grids[0])
+        # Binning falls back to serial in TaskGraph workers, which cannot fork
+        graph = satmo.TaskGraph()
+        graph.add('bin', bin_task, args=(self.file_list, self.grid, 2))
+        self.assertEqual(graph.run(), {'bin': 'done'})
+        np.testing.assert_array_equal(graph.results['bin'],
+                                      bin_task(self.file_list, self.grid, 1))
+
+    def test_bin_many(self):
+        var_list = ['chlor_a', 'Kd_490']
+        expected = []
+        for var in var_list:
+            bin_class = satmo.BasicBinMap(self.file_list, var=var)
+            bin_class.apply_mask()
+            expected.append(self._bin(bin_class))
+        bin_class = satmo.BasicBinMap(self.file_list)
+        bin_class.apply_mask()
+        bin_class.bin_many(var_list, **self.grid)
+        self.assertEqual(bin_class.output_variables, var_list)
+        for layer, array in zip(bin_class.output_array, expected):
+            np.testing.assert_array_equal(np.ma.filled(layer, np.nan), array)
+        # Multi band file, with the variable names as band tags
+        filename = os.path.join(self.tmp_dir, 'multi.tif')
+        bin_class.to_file(filename)
+        with rasterio.open(filename) as src:
+            self.assertEqual(src.count, 2)
+            self.assertEqual([src.tags(i)['variable'] for i in [1, 2]], var_list)
+            for i, array in enumerate(expected, start=1):
+                np.testing.assert_array_equal(src.read(i, masked=True).filled(np.nan),
+                                              array.astype(np.float32))
+        # One file per variable
+        filename_list = [os.path.join(self.tmp_dir, '%s.tif' % x) for x in var_list]
+        self.assertEqual(bin_class.to_files(filename_list), filename_list)
+        for filename, array in zip(filename_list, expected):
+            with rasterio.open(filename) as src:
+                self.assertEqual(src.count, 1)
+                np.testing.assert_array_equal(src.read(1, masked=True).filled(np.nan),
+                                              array.astype(np.float32))
+
+    def test_cell_index_cache(self):
+        cache = satmo.processors._cell_index_cache
+        cache.clear()
+        bin_class = satmo.BasicBinMap(self.file_list, var='chlor_a')
+        cell_ids, valid = bin_class._get_cell_index(**self.grid)
+        self.assertEqual(len(cache), 1)
+        # Another instance on the same files and grid hits the memory cache
+        bin_class = satmo.BasicBinMap(self.file_list, var='chlor_a')
+        self.assertIs(bin_class._get_cell_index(**self.grid)[0], cell_ids)
+        # A different grid or file list is a different map
+        key = bin_class._cell_index_key(*self._grid_tuple())
+        self.assertNotEqual(bin_class._cell_index_key(*self._grid_tuple(resolution=25000)),
+                            key)
+        other_class = satmo.BasicBinMap(self.file_list[:2], var='chlor_a')
+        self.assertNotEqual(other_class._cell_index_key(*self._grid_tuple()), key)
+        other_class._get_cell_index(**self.grid)
+        self.assertEqual(len(cache), 2)
+        # Index maps round trip through the .npy sidecars of cache_dir
+        cache_dir = os.path.join(self.tmp_dir, 'cache')
+        cache.clear()
+        satmo.BasicBinMap(self.file_list, cache_dir=cache_dir)._get_cell_index(**self.grid)
+        self.assertEqual(sorted(os.listdir(cache_dir)),
+                         ['%s_cell_ids.npy' % key, '%s_valid.npy' % key])
+        cache.clear()
+        bin_class = satmo.BasicBinMap(self.file_list, cache_dir=cache_dir)
+        # Not recomputed from the (here corrupted) coordinates
+        bin_class.lon_dd += 50
+        cached_ids, cached_valid = bin_class._get_cell_index(**self.grid)
+        np.testing.assert_array_equal(cached_ids, cell_ids)
+        np.testing.assert_array_equal(cached_valid, valid)
+        # A replaced input invalidates the map
+        os.utime(self.file_list[0], (0, 0))
+        self.assertNotEqual(bin_class._cell_index_key(*self._grid_tuple()), key)
+        # The memory cache is bounded by the size of the maps
+        cache.clear()
+        cache_bytes = satmo.processors.CELL_INDEX_CACHE_BYTES
+        satmo.processors.CELL_INDEX_CACHE_BYTES = cell_ids.nbytes + valid.nbytes
+        try:
+            satmo.BasicBinMap(self.file_list)._get_cell_index(**self.grid)
+            self.assertEqual(len(cache), 1)
+            satmo.BasicBinMap(self.file_list)._get_cell_index(
+                **dict(self.grid, west=-109))
+            self.assertEqual(len(cache), 1)
+        finally:
+            satmo.processors.CELL_INDEX_CACHE_BYTES = cache_bytes
+
+class TestComposer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        meta = {'driver': 'GTiff', 'height': 90, 'width': 70, 'count': 1,
+                'dtype': 'float32', 'crs': '+proj=longlat', 'nodata': np.nan,
+                'transform': Affine(0.1, 0, -100, 0, -0.1, 30)}
+        self.file_list = []
+        for doy in range(1, 4):
+            array = rng.rand(90, 70).astype(np.float32)
+            array[rng.rand(90, 70) < 0.4] = np.nan
+            filename = os.path.join(self.tmp_dir,
+                                    'A201600%d.L3m_DAY_CHL_chlor_a_1km.tif' % doy)
+            with rasterio.open(filename, 'w', **meta) as dst:
+                dst.write(array, 1)
+            self.file_list.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _compose(self, fun, **kwargs):
+        filename = os.path.join(self.tmp_dir, 'composite.tif')
+        compose_class = satmo.FileComposer(*self.file_list, **kwargs)
+        getattr(compose_class, fun)()
+        compose_class.to_file(filename)
+        with rasterio.open(filename) as src:
+            return src.read(1)
+
+    def test_windowed(self):
+        # Window by window compositing gives the same result as in memory compositing
+        for fun in ['mean', 'median', 'min', 'max']:
+            np.testing.assert_array_equal(self._compose(fun, windowed=True,
+                                                        window_lines=16),
+                                          self._compose(fun))
+
+    def test_compose_many(self):
+        # All statistics computed from one read match the single function outputs
+        fun_list = ['mean', 'median', 'std', 'count']
+        filename_list = [os.path.join(self.tmp_dir, '%s.tif' % fun) for fun in fun_list]
+        for windowed in [False, True]:
+            compose_class = satmo.FileComposer(*self.file_list, windowed=windowed)
+            compose_class.compose_many(fun_list)
+            compose_class.to_files(filename_list)
+            for fun, filename in zip(fun_list, filename_list):
+                with rasterio.open(filename) as src:
+                    np.testing.assert_array_equal(src.read(1), self._compose(fun))
+        with rasterio.open(filename_list[-1]) as src:
+            self.assertEqual(src.dtypes[0], 'uint16')
+            self.assertEqual(src.read(1).max(), 3)
+
+    def test_interrupted_write(self):
+        # A failing composite leaves neither partial nor temporary files
+        filename_list = [os.path.join(self.tmp_dir, '%s.tif' % fun)
+                         for fun in ['mean', 'foo']]
+        compose_class = satmo.FileComposer(*self.file_list, windowed=True)
+        compose_class.compose_many(['mean', 'foo'])
+        self.assertRaises(KeyError, compose_class.to_files, filename_list)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         sorted(os.path.basename(x) for x in self.file_list))
+
+    def test_dependencies(self):
+        filename = os.path.join(self.tmp_dir, 'composite.tif')
+        satmo.compose_to_files(self.file_list, ['mean'], [filename], preview=False)
+        self.assertEqual(sorted(satmo.read_inputs(filename)),
+                         sorted(os.path.basename(x) for x in self.file_list))
+        self.assertFalse(satmo.is_outdated(filename, self.file_list))
+        self.assertTrue(satmo.is_outdated(filename, self.file_list[:2]))
+        # An input is replaced; only 'auto' and True trigger the rebuild
+        os.utime(self.file_list[0], (0, 0))
+        self.assertTrue(satmo.is_outdated(filename, self.file_list))
+        os.utime(filename, (1, 1))
+        satmo.compose_to_files(self.file_list, ['mean'], [filename], preview=False)
+        self.assertEqual(os.path.getmtime(filename), 1)
+        satmo.compose_to_files(self.file_list, ['mean'], [filename], overwrite='auto',
+                               preview=False)
+        self.assertNotEqual(os.path.getmtime(filename), 1)
+        self.assertFalse(satmo.is_outdated(filename, self.file_list))
+
+    def test_median(self):
+        # Block wise median matches np.nanmedian, including masked inputs
+        rng = np.random.RandomState(1)
+        array_list = []
+        for i in range(6):
+            array = rng.rand(30, 20).astype(np.float32)
+            array[rng.rand(30, 20) < 0.5] = np.nan
+            array_list.append(np.ma.masked_array(array, rng.rand(30, 20) < 0.2))
+        expected = np.ma.filled(np.nanmedian(np.ma.array(array_list), axis=0), np.nan)
+        for block_size in [100, 10000]:
+            median = satmo.processors._nanmedian(array_list, block_size)
+            np.testing.assert_array_equal(median, expected)
+
+    def test_median_edge_cases(self):
+        # Odd and even numbers of valid values, ties, fully masked and all nan cells
+        rng = np.random.RandomState(2)
+        for n in [1, 2, 5, 8]:
+            for dtype in [np.float32, np.float64]:
+                array_list = []
+                for i in range(n):
+                    array = rng.randint(0, 4, (12, 9)).astype(dtype)
+                    array[rng.rand(12, 9) < 0.3] = np.nan
+                    array[0] = np.nan
+                    mask = rng.rand(12, 9) < 0.3
+                    mask[1] = True
+                    array_list.append(np.ma.masked_array(array, mask))
+                expected = np.ma.filled(np.nanmedian(np.ma.array(array_list), axis=0),
+                                        np.nan)
+                for block_size in [n * 9, 10000]:
+                    median = satmo.processors._nanmedian(array_list, block_size)
+                    self.assertEqual(median.dtype, np.result_type(np.float32, dtype))
+                    np.testing.assert_array_equal(median, expected)
+                self.assertTrue(np.isnan(median[:2]).all())
+
+    def test_incremental(self):
+        filename = os.path.join(self.tmp_dir, 'X2016001.L3m_8DAY_CHL_chlor_a_1km.tif')
+        compose_class = satmo.IncrementalComposer(filename, extrema=True)
+        for x in self.file_list:
+            self.assertTrue(compose_class.add(x))
+        # Unchanged inputs are not ingested twice
+        self.assertFalse(compose_class.add(self.file_list[0]))
+        compose_class.save()
+        # Replace an input; its previous contribution must be subtracted
+        with rasterio.open(self.file_list[1], 'r+') as dst:
+            dst.write(np.full((90, 70), 0.5, dtype=np.float32), 1)
+        os.utime(self.file_list[1], (0, 0))
+        compose_class = satmo.IncrementalComposer(filename, extrema=True)
+        self.assertTrue(compose_class.add(self.file_list[1]))
+        self.assertEqual(compose_class.count.min(), 1)
+        np.testing.assert_allclose(compose_class.composed_array('mean'),
+                                   self._compose('mean'), rtol=1e-6)
+        np.testing.assert_array_equal(compose_class.composed_array('max'),
+                                      self._compose('max'))
+        compose_class.to_file('mean')
+        self.assertEqual(sorted(satmo.read_inputs(filename)),
+                         sorted(os.path.basename(x) for x in self.file_list))
+        self.assertFalse(satmo.is_outdated(filename, self.file_list))
+        # No temporary file left behind
+        self.assertFalse([x for x in os.listdir(self.tmp_dir) if x.startswith('.')])
+
+    def test_incremental_interrupted(self):
+        filename = os.path.join(self.tmp_dir, 'X2016001.L3m_8DAY_CHL_chlor_a_1km.tif')
+        state_dir = filename + '.state'
+        compose_class = satmo.IncrementalComposer(filename, extrema=True)
+        for x in self.file_list:
+            compose_class.add(x)
+        compose_class.save()
+        saved = sorted(os.listdir(state_dir))
+        with rasterio.open(self.file_list[1], 'r+') as dst:
+            dst.write(np.full((90, 70), 0.5, dtype=np.float32), 1)
+        os.utime(self.file_list[1], (0, 0))
+        # Process killed between add and save
+        compose_class = satmo.IncrementalComposer(filename, extrema=True)
+        compose_class.add(self.file_list[1])
+        del compose_class
+        self.assertEqual(sorted(os.listdir(state_dir)), saved)
+        # Process killed while saving, before the state is committed
+        compose_class = satmo.IncrementalComposer(filename, extrema=True)
+        compose_class.add(self.file_list[1])
+        os.mkdir(os.path.join(state_dir, '.state.tmp.npz'))
+        self.assertRaises(OSError, compose_class.save)
+        os.rmdir(os.path.join(state_dir, '.state.tmp.npz'))
+        # The saved state is intact and the replaced input is ingested correctly
+        compose_class = satmo.IncrementalComposer(filename, extrema=True)
+        self.assertTrue(compose_class.add(self.file_list[1]))
+        np.testing.assert_allclose(compose_class.composed_array('mean'),
+                                   self._compose('mean'), rtol=1e-6)
+        np.testing.assert_array_equal(compose_class.composed_array('max'),
+                                      self._compose('max'))
+        compose_class.save()
+        self.assertEqual(len(os.listdir(state_dir)), len(saved))
+        compose_class = satmo.IncrementalComposer(filename, extrema=True)
+        self.assertFalse(compose_class.add(self.file_list[1]))
+        np.testing.assert_allclose(compose_class.composed_array('mean'),
+                                   self._compose('mean'), rtol=1e-6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+import satmo
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+def _log(filename, name, sleep=0):
+    time.sleep(sleep)
+    with open(filename, 'a') as dst:
+        dst.write(name + '\n')
+    return name
+
+def _write(filename, log):
+    with open(filename, 'w') as dst:
+        dst.write('data')
+    with open(log, 'a') as dst:
+        dst.write(os.path.basename(filename) + '\n')
+    return filename
+
+def _pid(x):
+    return os.getpid(), x
+
+def _fail():
+    raise ValueError('Failure')
+
+class _FailingJournal(satmo.Journal):
+    def record(self, name, path, sha1=None):
+        raise RuntimeError('Journal failure')
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmp_dir, 'log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_run(self):
+        graph = satmo.TaskGraph()
+        graph.add('L3b', _log, args=(self.log, 'L3b', 0.2))
+        graph.add('L3m', _log, args=(self.log, 'L3m'), deps=['L3b'])
+        graph.add('download', _log, args=(self.log, 'download'), resource='io')
+        graph.add('fail', _fail)
+        graph.add('skipped', _log, args=(self.log, 'skipped'), deps=['fail', 'L3b'])
+        self.assertRaises(ValueError, graph.add, 'L2m', _log, deps=['L2'])
+        status = graph.run(limits={'cpu': 2, 'io': 1})
+        self.assertEqual(status, {'L3b': 'done', 'L3m': 'done', 'download': 'done',
+                                  'fail': 'failed', 'skipped': 'skipped'})
+        self.assertEqual(graph.results['L3m'], 'L3m')
+        with open(self.log) as src:
+            lines = src.read().split()
+        # Independent tasks do not wait on slower ones
+        self.assertEqual(lines, ['download', 'L3b', 'L3m'])
+
+    def test_journal(self):
+        journal = os.path.join(self.tmp_dir, 'journal.sqlite')
+        graph = satmo.TaskGraph()
+        for name in ['L3b', 'L3m']:
+            graph.add(name, _write, args=(os.path.join(self.tmp_dir, name), self.log),
+                      deps=['L3b'] if name == 'L3m' else [])
+        graph.run(journal=journal)
+        # Resuming only runs the units whose output changed
+        with open(os.path.join(self.tmp_dir, 'L3m'), 'a') as dst:
+            dst.write('partial')
+        os.remove(self.log)
+        graph.run(journal=journal, resume=True)
+        with open(self.log) as src:
+            self.assertEqual(src.read().split(), ['L3m'])
+        self.assertEqual(graph.results['L3b'], os.path.join(self.tmp_dir, 'L3b'))
+        # Outputs recorded without checksum cannot be verified
+        self.assertIsNone(satmo.Journal(journal).completed('L3m', verify=True))
+        os.remove(self.log)
+        graph.run(journal=journal, resume=True, verify=True)
+        with open(self.log) as src:
+            self.assertEqual(src.read().split(), ['L3b', 'L3m'])
+        self.assertEqual(satmo.Journal(journal).completed('L3m', verify=True),
+                         os.path.join(self.tmp_dir, 'L3m'))
+        # Content changes are detected even when size and mtime are unchanged
+        filename = os.path.join(self.tmp_dir, 'L3b')
+        os.utime(filename, (1, 1))
+        satmo.Journal(journal).record('L3b', filename, sha1=satmo.file_checksum(filename))
+        with open(filename, 'r+') as dst:
+            dst.write('X')
+        os.utime(filename, (1, 1))
+        self.assertEqual(satmo.Journal(journal).completed('L3b'), filename)
+        self.assertIsNone(satmo.Journal(journal).completed('L3b', verify=True))
+
+    def test_run_error(self):
+        # An error of the graph loop only terminates the pools used by the graph
+        list(satmo.parallel_map(_pid, range(4), n_workers=2))
+        default_pool = satmo.scheduler._pools[('default', 2)][0]
+        graph = satmo.TaskGraph()
+        graph.add('L3b', _write, args=(os.path.join(self.tmp_dir, 'L3b'), self.log),
+                  resource='graph_cpu')
+        journal = _FailingJournal(os.path.join(self.tmp_dir, 'journal.sqlite'))
+        self.assertRaises(RuntimeError, graph.run, journal=journal)
+        self.assertNotIn(('graph_cpu', 1), satmo.scheduler._pools)
+        self.assertIs(satmo.scheduler._pools[('default', 2)][0], default_pool)
+        self.assertEqual(len(list(satmo.parallel_map(_pid, range(4), n_workers=2))), 4)
+
+    def test_parallel_map(self):
+        results = list(satmo.parallel_map(_pid, range(20), n_workers=2, chunksize=5))
+        self.assertEqual(sorted(x[1] for x in results), range(20))
+        # Successive calls reuse the same two workers
+        results += list(satmo.parallel_map(_pid, range(20), n_workers=2))
+        pids = set(x[0] for x in results)
+        self.assertLessEqual(len(pids), 2)
+        self.assertNotIn(os.getpid(), pids)
+        satmo.shutdown_pools()
+        results = list(satmo.parallel_map(_pid, range(20), n_workers=2))
+        self.assertFalse(set(x[0] for x in results) & pids)
+        # A single worker runs in the current process
+        self.assertEqual(list(satmo.parallel_map(_pid, [0])), [(os.getpid(), 0)])
+
+    def test_processing_graph(self):
+        l2_list = []
+        for sensor_code in ['A', 'T']:
+            for hour in [6, 18]:
+                l2_list.append(satmo.filename_builder(
+                    level='L2', full_path=True, data_root=self.tmp_dir, suite='SST',
+                    filename='%s2016001%02d0000.L1A_LAC.bz2' % (sensor_code, hour)))
+        for filename in l2_list:
+            if not os.path.exists(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            open(filename, 'w').close()
+        graph = satmo.processing_graph(self.tmp_dir, 3, 33, -122, -72,
+                                       date_list=['2016-01-01'], sensor_codes=['A', 'T'],
+                                       day_vars=['sst'], night_vars=['sst'],
+                                       daily_composite=True, composites=['8DAY'],
+                                       overwrite=False)
+        # Day and night L3b, L3m, daily composite and 8DAY composite
+        self.assertEqual(len(graph), 12)
+        self.assertEqual(graph.tasks['A2016001.L3b_DAY_NSST.nc'].kwargs['file_list'],
+                         [l2_list[0]])
+        self.assertEqual(graph.tasks['X2016001.L3m_DAY_SST_sst_1km.tif'].deps,
+                         ('A2016001.L3m_DAY_SST_sst_1km.tif',
+                          'T2016001.L3m_DAY_SST_sst_1km.tif'))
+        self.assertEqual(graph.tasks['X2016001.L3m_8DAY_SST_sst_1km.tif'].deps,
+                         ('X2016001.L3m_DAY_SST_sst_1km.tif',))
+
+    def test_processing_graph_l2m(self):
+        l2_list = [satmo.filename_builder(level='L2', full_path=True, data_root=self.tmp_dir,
+                                          suite='OC', filename=x)
+                   for x in ['A2016001180000.L1A_LAC.bz2', 'A2016001183000.L1A_LAC.bz2']]
+        l2m_file = satmo.filename_builder(level='L2m', filename=l2_list[0], suite='CHL',
+                                          variable='chlor_a', full_path=True,
+                                          data_root=self.tmp_dir)
+        for filename in l2_list + [l2m_file]:
+            if not os.path.exists(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            open(filename, 'w').close()
+        graph = satmo.processing_graph(self.tmp_dir, 3, 33, -122, -72,
+                                       date_list=['2016-01-01'], sensor_codes=['A'],
+                                       l2m_vars=['chlor_a'], overwrite=False)
+        # Only the missing L2m is mapped
+        self.assertEqual([x for x in graph.tasks if 'L2m' in x],
+                         [os.path.basename(satmo.filename_builder(
+                             level='L2m', filename=l2_list[1], suite='CHL',
+                             variable='chlor_a'))])
+
+    def test_l2mapgen_batcher(self):
+        l2_file = satmo.filename_builder(level='L2', full_path=True, data_root=self.tmp_dir,
+                                         suite='OC', filename='A2016001180000.L1A_LAC.bz2')
+        l2m_file = satmo.filename_builder(level='L2m', filename=l2_file, suite='CHL',
+                                          variable='chlor_a', full_path=True,
+                                          data_root=self.tmp_dir)
+        for filename in [l2_file, l2m_file]:
+            if not os.path.exists(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            open(filename, 'w').close()
+        # Existing outputs are not turned into (failing) tasks
+        status = satmo.l2mapgen_batcher('2016-01-01', '2016-01-01', ['A'], 'chlor_a',
+                                        3, 33, -122, -72, self.tmp_dir)
+        self.assertEqual(status, {})
+
+    def test_l3bin_map_graph(self):
+        for doy in [1, 2, 9]:
+            filename = satmo.filename_builder(
+                level='L3b', full_path=True, data_root=self.tmp_dir, sensor_code='A',
+                suite='CHL', composite='DAY',
+                date=datetime.strptime('2016%03d' % doy, '%Y%j'))
+            if not os.path.exists(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            open(filename, 'w').close()
+        date_lists = [[datetime(2016, 1, 1) + timedelta(days=x) for x in range(i, i + 8)]
+                      for i in [0, 8, 16]]
+        graph = satmo.l3bin_map_graph(date_lists, ['A', 'T'], ['chlor_a', 'nflh'],
+                                      3, 33, -122, -72, '8DAY', self.tmp_dir)
+        # One L3b composite per period with daily inputs, and one L3m per variable
+        self.assertEqual(list(graph.tasks)[:3],
+                         ['A2016001.L3b_8DAY_CHL.nc',
+                          'A2016001.L3m_8DAY_CHL_chlor_a_1km.tif',
+                          'A2016009.L3b_8DAY_CHL.nc'])
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(len(graph.tasks['A2016001.L3b_8DAY_CHL.nc'].kwargs['file_list']), 2)
+        self.assertEqual(graph.tasks['A2016009.L3m_8DAY_CHL_chlor_a_1km.tif'].deps,
+                         ('A2016009.L3b_8DAY_CHL.nc',))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,10 @@
 import satmo
 import unittest
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
 from datetime import datetime, date, time
 
 class TestUtils(unittest.TestCase):
@@ -215,6 +220,62 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(satmo.filename_parser(f9), d9)
         self.assertEqual(satmo.filename_parser(f10), d10)
 
+    def test_filename_parser_record(self):
+        f = 'aqua/L2/2005/004/A2005004002500.L2_LAC_OC.nc'
+        meta = satmo.filename_parser(f, record=True)
+        self.assertEqual(meta.to_dict(), satmo.filename_parser(f))
+        self.assertEqual(meta['suite'], 'OC')
+        self.assertEqual(meta.date, date(2005, 1, 4))
+        self.assertEqual(meta.get('foo', 'bar'), 'bar')
+        self.assertRaises(KeyError, lambda: meta['foo'])
+        self.assertRaises(AttributeError, setattr, meta, 'suite', 'SST')
+        # Cached parsing gives the same record
+        self.assertIs(satmo.filename_parser(os.path.basename(f), record=True), meta)
+        self.assertRaises(ValueError, satmo.filename_parser, 'foo.txt')
+        self.assertIsNone(satmo.filename_parser('foo.txt', raiseError=False)['level'])
+
+    def test_filename_parser_threads(self):
+        # Concurrent parsing with constant evictions from a small cache
+        file_list = ['A2005%03d002500.L2_LAC_OC.nc' % doy for doy in range(1, 201)]
+        errors = []
+        def parse():
+            try:
+                for i in range(20):
+                    for f in file_list:
+                        if satmo.filename_parser(f)['doy'] != int(f[5:8]):
+                            errors.append(f)
+            except Exception as e:
+                errors.append(e)
+        cache_size = satmo.utils.FILENAME_CACHE_SIZE
+        satmo.utils.FILENAME_CACHE_SIZE = 50
+        try:
+            threads = [threading.Thread(target=parse) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            satmo.utils.FILENAME_CACHE_SIZE = cache_size
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(satmo.utils._filename_cache), 50)
+
+    def test_parse_many(self):
+        file_list = ['aqua/L2/2005/004/A2005004002500.L2_LAC_OC.nc',
+                     'T2005004183000.L1A_LAC.bz2',
+                     'X2005001.L3m_8DAY_CHL_chlor_a_1km.tif',
+                     'foo.txt']
+        self.assertRaises(ValueError, satmo.parse_many, file_list)
+        meta = satmo.parse_many(file_list, raiseError=False)
+        self.assertEqual(list(meta.sensor_code), ['A', 'T', 'X', ''])
+        self.assertEqual(meta[2].variable, 'chlor_a')
+        self.assertEqual(meta.date[0], np.datetime64('2005-01-04'))
+        self.assertTrue(np.isnat(meta.time[2]))
+        self.assertEqual(list(satmo.is_day(file_list[:3])), [False, True, False])
+        self.assertEqual(list(satmo.is_night(file_list[:2])),
+                         [satmo.is_night(x) for x in file_list[:2]])
+        self.assertEqual(satmo.get_date_list(file_list[:3]),
+                         [datetime(2005, 1, 1), datetime(2005, 1, 4)])
+
     def test_filename_builder(self):
 
         d1_0 = {'level': 'L2', 'filename': 'A2008085203500.L1A_LAC.bz2', 'suite': 'OC'}
@@ -321,5 +382,24 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(satmo.viirs_geo_filename_builder('V2017241160000.L1A_SNPP.nc'),
                          'V2017241160000.GEO-M_SNPP.nc')
 
+    def test_atomic_output(self):
+        tmp_dir = tempfile.mkdtemp()
+        filename = os.path.join(tmp_dir, 'A2016001.L3b_DAY_CHL.nc')
+        try:
+            with satmo.atomic_output(filename) as tmp_file:
+                self.assertEqual(os.path.splitext(tmp_file)[1], '.nc')
+                open(tmp_file, 'w').close()
+                self.assertFalse(os.path.exists(filename))
+            self.assertTrue(os.path.exists(filename))
+            # A failed write leaves neither the temporary nor a new final file
+            os.remove(filename)
+            with self.assertRaises(ValueError):
+                with satmo.atomic_output(filename) as tmp_file:
+                    open(tmp_file, 'w').close()
+                    raise ValueError
+            self.assertEqual(os.listdir(tmp_dir), [])
+        finally:
+            shutil.rmtree(tmp_dir)
+
 if __name__ == '__main__':
     unittest.main()